@@ -0,0 +1,206 @@
+import os
+import argparse
+import sys
+import json
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = 32
+
+def get_dct_matrix(size):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size)).astype(np.float32)
+
+DCT_MATRIX = get_dct_matrix(HASH_IMAGE_SIZE)
+
+def compute_phash(image_path):
+    with Image.open(image_path) as img:
+        # JPEG decoding at 1/8 scale is enough for a 32x32 thumbnail and skips most of the decode cost
+        img.draft("L", (HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+        img = img.convert("L").resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.BILINEAR)
+    pixels = np.asarray(img, dtype=np.float32)
+    dct = DCT_MATRIX @ pixels @ DCT_MATRIX.T
+    # The lowest 8x8 frequencies without the DC term are compared to their median
+    low = dct[:HASH_SIZE, :HASH_SIZE].flatten()[1:]
+    bits = np.concatenate([[0], low > np.median(low)])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def hash_image(task):
+    image_path, rel_path = task
+    try:
+        return rel_path, compute_phash(image_path)
+    except Exception as e:
+        print(f"Could not hash {image_path}: {e}")
+        return rel_path, None
+
+def list_images(data_dir, data_types):
+    images = []
+    for data_type in data_types:
+        img_dir = os.path.join(data_dir, data_type, "images")
+        if not os.path.exists(img_dir):
+            print(f"{data_type} image directory ({img_dir}) not found, skipping it")
+            continue
+        for img_file in sorted(os.listdir(img_dir)):
+            if img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                images.append(os.path.join(data_type, "images", img_file))
+    return images
+
+def load_hashes(data_dir, images, max_workers):
+    # Hashes are cached with the file size and mtime so rerunning only hashes new or changed images
+    cache_path = os.path.join(data_dir, "phash_cache.json")
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+
+    hashes, tasks = {}, []
+    for rel_path in images:
+        stat = os.stat(os.path.join(data_dir, rel_path))
+        entry = cache.get(rel_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            hashes[rel_path] = int(entry['hash'], 16)
+        else:
+            tasks.append((os.path.join(data_dir, rel_path), rel_path))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for rel_path, phash in executor.map(hash_image, tasks, chunksize=64):
+            if phash is not None:
+                hashes[rel_path] = phash
+    print(f"Hashed {len(tasks)} images ({len(images) - len(tasks)} cached)")
+
+    new_cache = {}
+    for rel_path, phash in hashes.items():
+        stat = os.stat(os.path.join(data_dir, rel_path))
+        new_cache[rel_path] = {"hash": f"{phash:016x}", "size": stat.st_size, "mtime": stat.st_mtime}
+    with open(cache_path, "w") as f:
+        json.dump(new_cache, f)
+    return hashes
+
+def get_bands(max_distance, bits=64):
+    # Two hashes within max_distance bits differ in at most max_distance bands, so with max_distance + 1 bands at least one band matches exactly
+    band_count = max_distance + 1
+    bounds = [round(i * bits / band_count) for i in range(band_count + 1)]
+    return [(start, (1 << (end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def find(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def find_duplicate_groups(hashes, max_distance):
+    names = sorted(hashes)
+    values = [hashes[name] for name in names]
+    parents = list(range(len(names)))
+    bands = get_bands(max_distance)
+    pairs = compared = 0
+    for band, (start, mask) in enumerate(bands):
+        buckets = {}
+        for i, value in enumerate(values):
+            buckets.setdefault((value >> start) & mask, []).append(i)
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    difference = values[members[a]] ^ values[members[b]]
+                    # A pair sharing several bands is only compared in the first one
+                    if any((difference >> earlier_start) & earlier_mask == 0 for earlier_start, earlier_mask in bands[:band]):
+                        continue
+                    compared += 1
+                    if bin(difference).count("1") <= max_distance:
+                        pairs += 1
+                        parents[find(parents, members[a])] = find(parents, members[b])
+
+    groups = {}
+    for i, name in enumerate(names):
+        groups.setdefault(find(parents, i), []).append(name)
+    return [sorted(group) for group in groups.values() if len(group) > 1], pairs, compared
+
+def count_boxes(data_dir, rel_path):
+    data_type, _, img_file = rel_path.split(os.sep)
+    label_path = os.path.join(data_dir, data_type, "labels", os.path.splitext(img_file)[0] + ".txt")
+    if not os.path.exists(label_path):
+        return 0
+    with open(label_path, "r") as f:
+        return sum(1 for line in f if line.strip())
+
+def choose_kept_image(data_dir, group):
+    # The copy with the most boxes is kept, official data wins ties as its annotations are reviewed
+    return max(group, key=lambda rel_path: (count_boxes(data_dir, rel_path), rel_path.startswith("official"), rel_path))
+
+def remove_duplicates(data_dir, groups):
+    removed = 0
+    for group in groups:
+        kept = choose_kept_image(data_dir, group)
+        for rel_path in group:
+            if rel_path == kept:
+                continue
+            # Duplicates are moved aside instead of deleted so a bad threshold can be undone
+            data_type, _, img_file = rel_path.split(os.sep)
+            label_file = os.path.splitext(img_file)[0] + ".txt"
+            for sub_dir, file_name in [("images", img_file), ("labels", label_file)]:
+                source = os.path.join(data_dir, data_type, sub_dir, file_name)
+                if os.path.exists(source):
+                    destination_dir = os.path.join(data_dir, "duplicates", data_type, sub_dir)
+                    os.makedirs(destination_dir, exist_ok=True)
+                    shutil.move(source, os.path.join(destination_dir, file_name))
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images across the official and unofficial datasets with perceptual hashes.")
+    parser.add_argument('--directory', type=str, required=True, help="Directory where dataset is stored")
+    parser.add_argument('--action', type=str, required=False, default="group", choices=['report', 'group', 'remove'], help="report: only print the duplicates, group: write duplicate_groups.json for split.py to keep groups in one split, remove: move all but one image of every group to <directory>/duplicates")
+    parser.add_argument('--maxDistance', type=int, required=False, default=4, help="Largest Hamming distance between 64-bit hashes counted as a duplicate")
+    parser.add_argument('--maxWorker', type=int, required=False, default=os.cpu_count(), help="Number of processes hashing images")
+    parser.add_argument('--no_official', action='store_true', help="Do not include the official dataset")
+    parser.add_argument('--no_unofficial', action='store_true', help="Do not include the unofficial dataset")
+
+    args = parser.parse_args()
+    data_dir = args.directory
+
+    if not os.path.exists(data_dir):
+        print("Data directory not found")
+        sys.exit(1)
+    if args.maxDistance < 0 or args.maxDistance > 15:
+        print(f"maxDistance must be between 0 and 15, but found {args.maxDistance} instead")
+        sys.exit(1)
+    if args.no_official and args.no_unofficial:
+        print("At most one flag of no_official or no_unofficial can be used")
+        sys.exit(1)
+
+    data_types = [data_type for data_type, skip in [("official", args.no_official), ("unofficial", args.no_unofficial)] if not skip]
+    images = list_images(data_dir, data_types)
+    if not images:
+        print(f"No images found in {data_dir}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    hashes = load_hashes(data_dir, images, args.maxWorker)
+    hash_time = time.perf_counter() - start
+    start = time.perf_counter()
+    groups, pairs, compared = find_duplicate_groups(hashes, args.maxDistance)
+    print(f"Hashing took {hash_time:.2f}s, matching took {time.perf_counter() - start:.2f}s ({compared} candidate pairs compared, {pairs} duplicate pairs)")
+
+    duplicates = sum(len(group) - 1 for group in groups)
+    cross_source = sum(1 for group in groups if len({rel_path.split(os.sep)[0] for rel_path in group}) > 1)
+    print(f"Found {len(groups)} duplicate groups with {sum(len(group) for group in groups)} images, {cross_source} of them span both datasets")
+    print(f"{duplicates} of {len(images)} images ({duplicates / len(images) * 100:.2f}%) are redundant copies")
+    if args.action == "report":
+        for group in sorted(groups, key=len, reverse=True)[:20]:
+            print("  " + ", ".join(group))
+    elif args.action == "group":
+        groups_path = os.path.join(data_dir, "duplicate_groups.json")
+        with open(groups_path, "w") as f:
+            json.dump({"max_distance": args.maxDistance, "groups": groups}, f, indent=4)
+        print(f"Duplicate groups saved to {groups_path}, split.py keeps every group in one split")
+    else:
+        removed = remove_duplicates(data_dir, groups)
+        print(f"Moved {removed} duplicate images and their labels to {os.path.join(data_dir, 'duplicates')}")
+
+if __name__ == "__main__":
+    main()
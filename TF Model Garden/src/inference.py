@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tensorflow as tf
+from object_detection.utils import label_map_util
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def get_image_paths(directory, image_list):
+    if directory:
+        return [os.path.join(directory, file_name) for file_name in sorted(os.listdir(directory)) if is_image(file_name)]
+    with open(image_list, "r") as f:
+        return [line.strip() for line in f if line.strip() and is_image(line.strip())]
+
+def configure_threading(intra_op_threads, inter_op_threads):
+    # Must run before TensorFlow creates its runtime, i.e. before any op executes
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+def load_model(model_dir):
+    model = tf.saved_model.load(model_dir)
+    detect_fn = model.signatures['serving_default']
+    input_name, input_spec = list(detect_fn.structured_input_signature[1].items())[0]
+    return detect_fn, input_name, input_spec
+
+def build_dataset(image_paths, image_size, batch_size):
+    def load_image(path):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        original_size = tf.shape(image)[:2]
+        image = tf.cast(tf.image.resize(image, image_size), tf.uint8)
+        return path, image, original_size
+
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(load_image, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def run_batch(detect_fn, input_name, fixed_batch_size, images):
+    # Object Detection API exports only accept a batch of 1
+    if fixed_batch_size == 1:
+        outputs = [detect_fn(**{input_name: images[i:i + 1]}) for i in range(images.shape[0])]
+        return {key: tf.concat([output[key] for output in outputs], axis=0) for key in outputs[0]}
+    return detect_fn(**{input_name: images})
+
+def to_detections(outputs, index, original_size, image_size, category_index, conf, absolute_boxes):
+    height, width = original_size
+    count = int(outputs['num_detections'][index])
+    boxes = outputs['detection_boxes'][index].numpy()
+    scores = outputs['detection_scores'][index].numpy()
+    classes = outputs['detection_classes'][index].numpy()
+
+    detections = []
+    for i in range(count):
+        if scores[i] < conf:
+            continue
+        ymin, xmin, ymax, xmax = boxes[i]
+        if absolute_boxes:
+            ymin, ymax = ymin / image_size[0], ymax / image_size[0]
+            xmin, xmax = xmin / image_size[1], xmax / image_size[1]
+        class_id = int(classes[i])
+        detections.append({
+            "class_id": class_id,
+            "class_name": category_index[class_id]['name'] if class_id in category_index else str(class_id),
+            "score": float(scores[i]),
+            "box": [float(xmin * width), float(ymin * height), float(xmax * width), float(ymax * height)],
+        })
+    return detections
+
+def get_coco_image_ids(annotation_json):
+    with open(annotation_json, "r") as f:
+        data = json.load(f)
+    return {image['file_name'].replace("/", "_"): image['id'] for image in data['images']}
+
+def write_results(results, output_path, output_format, annotation_json=None):
+    if output_format == "jsonl":
+        with open(output_path, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        return
+
+    coco_image_ids = get_coco_image_ids(annotation_json) if annotation_json else {}
+    coco_results = []
+    for index, result in enumerate(results):
+        image_id = coco_image_ids.get(os.path.basename(result['image']), index)
+        for detection in result['detections']:
+            xmin, ymin, xmax, ymax = detection['box']
+            coco_results.append({
+                "image_id": image_id,
+                "category_id": detection['class_id'],
+                "bbox": [xmin, ymin, xmax - xmin, ymax - ymin],
+                "score": detection['score'],
+            })
+    with open(output_path, "w") as f:
+        json.dump(coco_results, f)
+
+def run_inference(args, image_paths):
+    category_index = label_map_util.create_category_index_from_labelmap(args.label_map, use_display_name=True)
+
+    start = time.perf_counter()
+    detect_fn, input_name, input_spec = load_model(args.model_dir)
+    print(f"Model loaded in {time.perf_counter() - start:.2f}s")
+
+    fixed_batch_size = input_spec.shape[0]
+    if input_spec.shape[1] is not None and input_spec.shape[2] is not None:
+        image_size = (input_spec.shape[1], input_spec.shape[2])
+    else:
+        image_size = (args.image_size, args.image_size)
+
+    results = []
+    start = time.perf_counter()
+    for paths, images, original_sizes in build_dataset(image_paths, image_size, args.batch_size):
+        outputs = run_batch(detect_fn, input_name, fixed_batch_size, images)
+        for i in range(images.shape[0]):
+            results.append({
+                "image": paths[i].numpy().decode("utf8"),
+                "detections": to_detections(outputs, i, original_sizes[i].numpy(), image_size, category_index, args.conf, args.absolute_boxes),
+            })
+    elapsed = time.perf_counter() - start
+
+    write_results(results, args.output, args.format, args.annotation_json)
+    print(f"Inferred on {len(results)} images in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):.2f} images/sec)")
+    print(f"Detections saved to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an exported SavedModel on a directory or list of images.")
+    parser.add_argument('--model_dir', type=str, required=True, help="Path to the exported saved_model directory")
+    parser.add_argument('--label_map', type=str, required=True, help="Path to the label map pbtxt (e.g. label_maps/supercategory.pbtxt)")
+    parser.add_argument('--directory', type=str, required=False, help="Directory of images to infer on")
+    parser.add_argument('--image_list', type=str, required=False, help="Text file with one image path per line")
+    parser.add_argument('--output', type=str, required=False, default="detections.jsonl", help="File to write detections to")
+    parser.add_argument('--format', type=str, required=False, default="jsonl", choices=['jsonl', 'coco'], help="Write one JSON line per image or a COCO results list")
+    parser.add_argument('--annotation_json', type=str, required=False, help="COCO annotation JSON used to look up image ids for the coco format")
+    parser.add_argument('--conf', type=float, required=False, default=0.35, help="Minimum confidence level of a detection to be recognized")
+    parser.add_argument('--batch_size', type=int, required=False, default=8, help="Number of images decoded and run per batch")
+    parser.add_argument('--image_size', type=int, required=False, default=640, help="Resize size when the model input size is not fixed (default: 640)")
+    parser.add_argument('--absolute_boxes', action='store_true', help="Use if the model returns boxes in input pixels instead of normalized coordinates")
+    parser.add_argument('--intra_op_threads', type=int, required=False, default=os.cpu_count(), help="Threads used inside a single op")
+    parser.add_argument('--inter_op_threads', type=int, required=False, default=2, help="Number of ops run in parallel")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model_dir):
+        print(f"Model directory ({args.model_dir}) not found")
+        sys.exit(1)
+    if not os.path.exists(args.label_map):
+        print(f"Label map ({args.label_map}) not found")
+        sys.exit(1)
+    if (not args.directory) and (not args.image_list):
+        print("Either the directory or the image_list flag must be used")
+        sys.exit(1)
+    if args.directory and not os.path.exists(args.directory):
+        print(f"Directory ({args.directory}) not found")
+        sys.exit(1)
+    if args.image_list and not os.path.exists(args.image_list):
+        print(f"Image list ({args.image_list}) not found")
+        sys.exit(1)
+
+    configure_threading(args.intra_op_threads, args.inter_op_threads)
+
+    image_paths = get_image_paths(args.directory, args.image_list)
+    if len(image_paths) == 0:
+        print("No images found to infer on")
+        sys.exit(1)
+
+    run_inference(args, image_paths)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import argparse
 import sys
 import shutil
 import random
+import json
 
 def split_data(data_dir, train_split, val_split, data_type, shuffle):
     data_dir = os.path.join(data_dir, data_type)
@@ -46,6 +47,32 @@ def split_data(data_dir, train_split, val_split, data_type, shuffle):
 
     return create_file_list(train_files), create_file_list(val_files), create_file_list(test_files)
 
+def apply_duplicate_groups(data_dir, groups_path, split_lists):
+    # Near-duplicates found by dedup.py all go to the earliest split any of them landed in, so none leak into validation or test
+    with open(groups_path, "r") as f:
+        groups = json.load(f)['groups']
+    split_of = {}
+    for split_index, data_list in enumerate(split_lists):
+        for img_path, label_path in data_list:
+            split_of[os.path.relpath(img_path, data_dir)] = split_index
+
+    moved = 0
+    target_of = {}
+    for group in groups:
+        present = [os.path.normpath(rel_path) for rel_path in group if os.path.normpath(rel_path) in split_of]
+        if present:
+            target = min(split_of[rel_path] for rel_path in present)
+            for rel_path in present:
+                target_of[rel_path] = target
+                moved += split_of[rel_path] != target
+
+    new_lists = [[] for _ in split_lists]
+    for split_index, data_list in enumerate(split_lists):
+        for img_path, label_path in data_list:
+            new_lists[target_of.get(os.path.relpath(img_path, data_dir), split_index)].append((img_path, label_path))
+    print(f"Moved {moved} images to keep {len(groups)} duplicate groups in a single split")
+    return new_lists
+
 def split_dataset(split_dir, train_list, val_list, test_list):
     if os.path.exists(split_dir):
         shutil.rmtree(split_dir)
@@ -91,6 +118,7 @@ def main():
     parser.add_argument('--no_unofficial', type=str2bool, required=False, default=False, help="Do not add unofficial dataset to the split")
     parser.add_argument('--unofficial_train_mainly', type=str2bool, required=False, default=True, help="All unofficial data will be first put to training split. Only relevant if both official and unofficial dataset are split")
     parser.add_argument('--shuffle', type=str2bool, required=False, default=True, help="Whether to shuffle dataset before splitting")
+    parser.add_argument('--duplicateGroups', type=str, required=False, help="duplicate_groups.json written by dedup.py (default: the one in the dataset directory, if any)")
     
     args = parser.parse_args()
     data_dir = args.directory
@@ -144,6 +172,13 @@ def main():
         val_list = off_val + unoff_val
         test_list = off_test
 
+    groups_path = args.duplicateGroups or os.path.join(data_dir, "duplicate_groups.json")
+    if os.path.exists(groups_path):
+        train_list, val_list, test_list = apply_duplicate_groups(data_dir, groups_path, [train_list, val_list, test_list])
+    elif args.duplicateGroups:
+        print(f"Duplicate groups ({groups_path}) not found")
+        sys.exit(1)
+
     split_dataset(split_dir, train_list, val_list, test_list)
 
     print(f"{len(os.listdir(os.path.join(split_dir, 'train', 'images')))} data in training set")
@@ -0,0 +1,87 @@
+import hashlib
+import os
+from tflite_model_maker import object_detector
+from tensorflow_examples.lite.model_maker.core.data_util import object_detector_dataloader_util as dataloader_util
+from json_to_xml import get_category_list, get_image_size_table, read_image_size
+
+CACHE_FORMAT_VERSION = "1"
+
+class LabelFileCacheFilesWriter(dataloader_util.CacheFilesWriter):
+    def _get_xml_dict(self, xml_dicts):
+        for xml_dict in xml_dicts:
+            yield xml_dict
+
+def get_label_map(data):
+    return sorted(set(get_category_list(data)))
+
+def stat_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def get_dataset_fingerprint(split_directory, split_type, img_names, label_map):
+    image_dir = os.path.join(split_directory, split_type, "images")
+    label_dir = os.path.join(split_directory, split_type, "labels")
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(f"{CACHE_FORMAT_VERSION}|{split_type}|{'|'.join(label_map)}\n".encode("utf8"))
+    fingerprint.update(stat_signature(os.path.join(split_directory, "annotations.json")).encode("utf8"))
+    for img_name in img_names:
+        label_name = img_name.replace(".jpg", ".txt")
+        image_signature = stat_signature(os.path.join(image_dir, img_name))
+        label_signature = stat_signature(os.path.join(label_dir, label_name))
+        fingerprint.update(f"{img_name}|{image_signature}|{label_signature}\n".encode("utf8"))
+    return fingerprint.hexdigest()[:16]
+
+def get_xml_dicts(image_dir, label_dir, img_names, category_list, size_table):
+    for img_name in img_names:
+        if img_name in size_table:
+            width, height = size_table[img_name]
+        else:
+            width, height = read_image_size(os.path.join(image_dir, img_name))
+
+        objects = []
+        label_path = os.path.join(label_dir, img_name.replace(".jpg", ".txt"))
+        with open(label_path, "r") as f:
+            for line in f:
+                category_id, bbox_x1, bbox_y1, bbox_w, bbox_h = line.strip().split()
+                bbox_x1, bbox_y1 = float(bbox_x1), float(bbox_y1)
+                objects.append({
+                    "name": category_list[int(category_id)],
+                    "pose": "Unspecified",
+                    "truncated": "0",
+                    "difficult": "0",
+                    "bndbox": {
+                        "xmin": bbox_x1,
+                        "ymin": bbox_y1,
+                        "xmax": bbox_x1 + float(bbox_w),
+                        "ymax": bbox_y1 + float(bbox_h),
+                    },
+                })
+
+        yield {
+            "filename": img_name,
+            "size": {"width": width, "height": height, "depth": 3},
+            "object": objects,
+        }
+
+def load_split(split_directory, split_type, data, cache_dir, num_shards=10, img_names=None):
+    # A given image list may repeat images, which the fingerprint includes so it gets its own cache
+    image_dir = os.path.join(split_directory, split_type, "images")
+    label_dir = os.path.join(split_directory, split_type, "labels")
+    img_names = img_names if img_names is not None else sorted(os.listdir(image_dir))
+    label_map = get_label_map(data)
+
+    fingerprint = get_dataset_fingerprint(split_directory, split_type, img_names, label_map)
+    cache_files = dataloader_util.get_cache_files(cache_dir, f"{split_type}_{fingerprint}", num_shards)
+
+    if dataloader_util.is_cached(cache_files):
+        print(f"{split_type}: using cached dataset {cache_files.cache_prefix}")
+    else:
+        print(f"{split_type}: writing dataset cache {cache_files.cache_prefix}")
+        category_list = get_category_list(data)
+        size_table = get_image_size_table(data)
+        # The writer takes the id to name dict from_pascal_voc builds, with 0 left for the background
+        cache_writer = LabelFileCacheFilesWriter({i + 1: name for i, name in enumerate(label_map)}, image_dir, num_shards=num_shards)
+        cache_writer.write_files(cache_files, get_xml_dicts(image_dir, label_dir, img_names, category_list, size_table))
+
+    return object_detector.DataLoader.from_cache(cache_files.cache_prefix)
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import tensorflow as tf
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def load_labels(model_path, labels_path=None):
+    if labels_path:
+        with open(labels_path, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    try:
+        from tflite_support import metadata
+        displayer = metadata.MetadataDisplayer.with_model_file(model_path)
+        for file_name in displayer.get_packed_associated_file_list():
+            if file_name.endswith(".txt"):
+                return displayer.get_associated_file_buffer(file_name).decode("utf8").splitlines()
+    except (ImportError, ValueError):
+        pass
+    return None
+
+def create_interpreter(model_content, num_threads, use_xnnpack=True):
+    if use_xnnpack:
+        op_resolver_type = tf.lite.experimental.OpResolverType.AUTO
+    else:
+        op_resolver_type = tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=num_threads, experimental_op_resolver_type=op_resolver_type)
+    interpreter.allocate_tensors()
+    return interpreter
+
+def preprocess_image(img_path, input_details):
+    _, height, width, _ = input_details['shape']
+    with Image.open(img_path) as image:
+        image = image.convert("RGB")
+        original_size = image.size
+        image = image.resize((width, height))
+        return np.expand_dims(np.asarray(image, dtype=input_details['dtype']), axis=0), original_size
+
+def detect_objects(runner, input_name, image, original_size, conf, labels=None):
+    output = runner(**{input_name: image})
+    count = int(np.squeeze(output['output_0']))
+    scores = np.squeeze(output['output_1'])
+    classes = np.squeeze(output['output_2'])
+    boxes = np.squeeze(output['output_3'])
+
+    width, height = original_size
+    detections = []
+    for i in range(count):
+        if scores[i] < conf:
+            continue
+        ymin, xmin, ymax, xmax = boxes[i]
+        class_id = int(classes[i])
+        detections.append({
+            "class_id": class_id,
+            "class_name": labels[class_id] if labels and class_id < len(labels) else str(class_id),
+            "score": float(scores[i]),
+            "box": [float(xmin * width), float(ymin * height), float(xmax * width), float(ymax * height)],
+        })
+    return detections
+
+def iter_image_paths(args):
+    if args.directory:
+        for file_name in sorted(os.listdir(args.directory)):
+            file_path = os.path.join(args.directory, file_name)
+            if is_image(file_path):
+                yield file_path
+    else:
+        image_list = sys.stdin if args.image_list == "-" else open(args.image_list, "r")
+        with image_list:
+            for line in image_list:
+                file_path = line.strip()
+                if file_path and is_image(file_path):
+                    yield file_path
+
+def feed_images(image_paths, input_details, work_queue, preprocess_workers, num_interpreters, feed_errors):
+    # The bounded work queue caps how many decoded images are held in memory
+    try:
+        with ThreadPoolExecutor(max_workers=preprocess_workers) as executor:
+            for img_path in image_paths:
+                work_queue.put((img_path, executor.submit(preprocess_image, img_path, input_details)))
+    except Exception as e:
+        feed_errors.append(e)
+    finally:
+        # The workers always get their sentinels, otherwise they and the main thread would wait forever
+        for _ in range(num_interpreters):
+            work_queue.put(None)
+
+def inference_worker(model_content, args, labels, work_queue, result_queue):
+    try:
+        interpreter = create_interpreter(model_content, args.num_threads, not args.no_xnnpack)
+        runner = interpreter.get_signature_runner()
+        input_name = list(runner.get_input_details().keys())[0]
+
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            img_path, future = item
+            try:
+                image, original_size = future.result()
+                start = time.perf_counter()
+                detections = detect_objects(runner, input_name, image, original_size, args.conf, labels)
+                latency_ms = (time.perf_counter() - start) * 1000
+                result_queue.put({"image": img_path, "latency_ms": latency_ms, "detections": detections})
+            except Exception as e:
+                result_queue.put({"image": img_path, "error": str(e)})
+    finally:
+        result_queue.put(None)
+
+def run_inference(args):
+    with open(args.model, "rb") as f:
+        model_content = f.read()
+    labels = load_labels(args.model, args.labels)
+    input_details = create_interpreter(model_content, 1, not args.no_xnnpack).get_input_details()[0]
+
+    work_queue = queue.Queue(maxsize=args.num_interpreters * 2)
+    result_queue = queue.Queue()
+
+    workers = [threading.Thread(target=inference_worker, args=(model_content, args, labels, work_queue, result_queue), daemon=True) for _ in range(args.num_interpreters)]
+    for worker in workers:
+        worker.start()
+    feed_errors = []
+    feeder = threading.Thread(target=feed_images, args=(iter_image_paths(args), input_details, work_queue, args.preprocess_workers, args.num_interpreters, feed_errors), daemon=True)
+
+    start = time.perf_counter()
+    feeder.start()
+
+    latencies = []
+    error_count = 0
+    finished_workers = 0
+    with open(args.output, "w") as f:
+        while finished_workers < args.num_interpreters:
+            result = result_queue.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            if "error" in result:
+                error_count += 1
+                print(f"Failed to infer on {result['image']}: {result['error']}")
+                continue
+            latencies.append(result['latency_ms'])
+            f.write(json.dumps(result) + "\n")
+    elapsed = time.perf_counter() - start
+    feeder.join()
+
+    print(f"Inferred on {len(latencies)} images in {elapsed:.2f}s ({len(latencies) / max(elapsed, 1e-9):.2f} images/sec)")
+    if latencies:
+        print(f"Latency p50 : {np.percentile(latencies, 50):.2f} ms")
+        print(f"Latency p95 : {np.percentile(latencies, 95):.2f} ms")
+    if error_count:
+        print(f"{error_count} images failed")
+    print(f"Detections saved to {args.output}")
+    if feed_errors:
+        print(f"Reading images stopped early: {feed_errors[0]}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an exported EfficientDet-Lite TFLite model on many images.")
+    parser.add_argument('--model', type=str, required=True, help="Path to the exported .tflite model")
+    parser.add_argument('--directory', type=str, required=False, help="Directory of images to infer on")
+    parser.add_argument('--image_list', type=str, required=False, help="Text file with one image path per line, or '-' to read paths from stdin")
+    parser.add_argument('--output', type=str, required=False, default="detections.jsonl", help="JSONL file to write detections to")
+    parser.add_argument('--labels', type=str, required=False, help="Label file with one class name per line (defaults to the labels packed in the model metadata)")
+    parser.add_argument('--conf', type=float, required=False, default=0.35, help="Minimum confidence level of a detection to be recognized")
+    parser.add_argument('--num_interpreters', type=int, required=False, default=2, help="Number of interpreters running in parallel")
+    parser.add_argument('--num_threads', type=int, required=False, default=2, help="Number of threads used by each interpreter")
+    parser.add_argument('--preprocess_workers', type=int, required=False, default=2, help="Number of threads decoding and resizing images")
+    parser.add_argument('--no_xnnpack', action='store_true', help="Disable the XNNPACK delegate")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Model ({args.model}) not found")
+        sys.exit(1)
+    if (not args.directory) and (not args.image_list):
+        print("Either the directory or the image_list flag must be used")
+        sys.exit(1)
+    if args.directory and not os.path.exists(args.directory):
+        print(f"Directory ({args.directory}) not found")
+        sys.exit(1)
+    if args.image_list and (args.image_list != "-") and not os.path.exists(args.image_list):
+        print(f"Image list ({args.image_list}) not found")
+        sys.exit(1)
+
+    run_inference(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,56 @@
 import argparse
 import os
 import shutil
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import json
 
 def dict_to_xml(image_info, annotation_list, category_list, split_type):
-    xml = "<annotation>\n"
-    xml += f"\t<folder>{split_type}</folder>\n"
-    xml += f"\t<filename>{image_info['file_name']}</filename>\n"
-    xml += f"\t<path>{image_info['file_path']}</path>\n"
-    xml += "\t<source>\n"
-    xml += "\t\t<database>Unspecified</database>\n"
-    xml += "\t</source>\n"
-    xml += f"\t<size>\n"
-    xml += f"\t\t<width>{image_info['width']}</width>\n"
-    xml += f"\t\t<height>{image_info['height']}</height>\n"
-    xml += "\t\t<depth>3</depth>\n"
-    xml += "\t</size>\n"
-    xml += "\t<segmented>0</segmented>\n"
+    parts = [
+        "<annotation>\n",
+        f"\t<folder>{split_type}</folder>\n",
+        f"\t<filename>{image_info['file_name']}</filename>\n",
+        f"\t<path>{image_info['file_path']}</path>\n",
+        "\t<source>\n",
+        "\t\t<database>Unspecified</database>\n",
+        "\t</source>\n",
+        "\t<size>\n",
+        f"\t\t<width>{image_info['width']}</width>\n",
+        f"\t\t<height>{image_info['height']}</height>\n",
+        "\t\t<depth>3</depth>\n",
+        "\t</size>\n",
+        "\t<segmented>0</segmented>\n",
+    ]
     for annot in annotation_list:
-        xml += "\t<object>\n"
-        xml += f"\t\t<name>{category_list[annot['category_id']]}</name>\n"
-        xml += "\t\t<pose>Unspecified</pose>\n"
-        xml += "\t\t<truncated>0</truncated>\n"
-        xml += "\t\t<difficult>0</difficult>\n"
-        xml += "\t\t<bndbox>\n"
-        xml += f"\t\t\t<xmin>{round(annot['bbox'][0])}</xmin>\n"
-        xml += f"\t\t\t<ymin>{round(annot['bbox'][1])}</ymin>\n"
-        xml += f"\t\t\t<xmax>{round(annot['bbox'][0] + annot['bbox'][2])}</xmax>\n"
-        xml += f"\t\t\t<ymax>{round(annot['bbox'][1] + annot['bbox'][3])}</ymax>\n"
-        xml += "\t\t</bndbox>\n"
-        xml += "\t</object>\n"
-    xml += "</annotation>"
-    return xml
-
-def get_category_list(split_directory):
+        parts.append(
+            "\t<object>\n"
+            f"\t\t<name>{category_list[annot['category_id']]}</name>\n"
+            "\t\t<pose>Unspecified</pose>\n"
+            "\t\t<truncated>0</truncated>\n"
+            "\t\t<difficult>0</difficult>\n"
+            "\t\t<bndbox>\n"
+            f"\t\t\t<xmin>{round(annot['bbox'][0])}</xmin>\n"
+            f"\t\t\t<ymin>{round(annot['bbox'][1])}</ymin>\n"
+            f"\t\t\t<xmax>{round(annot['bbox'][0] + annot['bbox'][2])}</xmax>\n"
+            f"\t\t\t<ymax>{round(annot['bbox'][1] + annot['bbox'][3])}</ymax>\n"
+            "\t\t</bndbox>\n"
+            "\t</object>\n"
+        )
+    parts.append("</annotation>")
+    return "".join(parts)
+
+def load_annotation_json(split_directory):
     json_path = os.path.join(split_directory, "annotations.json")
     if not os.path.exists(json_path):
         print(f"Annotation json ({json_path}) not found")
         sys.exit(1)
     
     with open(json_path, "r") as f:
-        data = json.loads(f.read())
+        return json.loads(f.read())
 
+def get_category_list(data):
     categories = data['categories']
     category_list = []
 
@@ -60,50 +67,128 @@ def get_category_list(split_directory):
         category_list.append(cat['supercategory'])
     return category_list
 
-def get_xml(split_directory, split_type):
-    img_annot_list = []
+def get_image_size_table(data):
+    # Keyed by the flattened file name that preprocess.py gives each image
+    size_table = {}
+    for image in data.get('images', []):
+        if ('width' not in image) or ('height' not in image):
+            continue
+        file_name = image['file_name'].replace("/", "_")
+        size_table[file_name] = (int(image['width']), int(image['height']))
+    return size_table
+
+def read_jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xd8) or 0xd0 <= marker <= 0xd7:
+            continue
+        if marker == 0xd9:
+            return None
+        segment_length = f.read(2)
+        if len(segment_length) < 2:
+            return None
+        length = struct.unpack(">H", segment_length)[0]
+        # SOF0-SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            frame_header = f.read(5)
+            if len(frame_header) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame_header[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+def read_image_size(img_path):
+    with open(img_path, "rb") as f:
+        head = f.read(24)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return struct.unpack(">II", head[16:24])
+        if head[:2] == b'\xff\xd8':
+            size = read_jpeg_size(f)
+            if size is not None:
+                return size
+
+    with Image.open(img_path) as image:
+        return image.size
+
+def is_xml_up_to_date(xml_path, source_paths):
+    if not os.path.exists(xml_path):
+        return False
+    xml_mtime = os.path.getmtime(xml_path)
+    return all(os.path.getmtime(path) <= xml_mtime for path in source_paths)
+
+def write_xml(img_name, image_dir, label_dir, xml_dir, category_list, size_table, split_type, json_path, skip_up_to_date):
+    img_path = os.path.join(image_dir, img_name)
+    label_name = img_name.replace(".jpg", ".txt")
+    label_path = os.path.join(label_dir, label_name)
+    xml_name = img_name.replace(".jpg", ".xml")
+    xml_path = os.path.join(xml_dir, xml_name)
+
+    if skip_up_to_date and is_xml_up_to_date(xml_path, [img_path, label_path, json_path]):
+        return False
+
+    if img_name in size_table:
+        width, height = size_table[img_name]
+    else:
+        width, height = read_image_size(img_path)
+
+    image_info = {
+        "file_name": img_name,
+        "file_path": img_path,
+        "width": width,
+        "height": height
+    }
+
+    annot_list = []
+    with open(label_path, "r") as f:
+        for line in f:
+            category_id, bbox_x1, bbox_y1, bbox_w, bbox_h = line.strip().split()
+            annot = {
+                "category_id": int(category_id),
+                "bbox": [float(bbox_x1), float(bbox_y1), float(bbox_w), float(bbox_h)]
+            }
+            annot_list.append(annot)
+    xml = dict_to_xml(image_info, annot_list, category_list, split_type)
+
+    with open(xml_path, "w") as f:
+        f.write(xml)
+    return True
+
+def get_xml(split_directory, split_type, category_list, size_table, max_workers=8, skip_up_to_date=False):
     image_dir = os.path.join(split_directory, split_type, "images")
     label_dir = os.path.join(split_directory, split_type, "labels")
     xml_dir = os.path.join(split_directory, split_type, "xml_labels")
-    category_list = get_category_list(split_directory)
-
-    if os.path.exists(xml_dir):
-        shutil.rmtree(xml_dir)
-    os.makedirs(xml_dir)
-
-    for img_name in os.listdir(image_dir):
-        img_path = os.path.join(image_dir, img_name)
-        image = Image.open(img_path)
-        width, height = image.size
-
-        image_info = {
-            "file_name": img_name,
-            "file_path": os.path.join(image_dir, img_name),
-            "width": width,
-            "height": height
-        }
-
-        label_name = img_name.replace(".jpg", ".txt")
-        label_path = os.path.join(label_dir, label_name)
-        annot_list = []
-        with open(label_path, "r") as f:
-            for line in f:
-                category_id, bbox_x1, bbox_y1, bbox_w, bbox_h = line.strip().split()
-                annot = {
-                    "category_id": int(category_id),
-                    "bbox": [float(bbox_x1), float(bbox_y1), float(bbox_w), float(bbox_h)]
-                }
-                annot_list.append(annot)
-        xml = dict_to_xml(image_info, annot_list, category_list, split_type)
-
-        xml_name = img_name.replace(".jpg", ".xml")
-        xml_path = os.path.join(xml_dir, xml_name)
-        with open(xml_path, "w") as f:
-            f.write(xml)
+    json_path = os.path.join(split_directory, "annotations.json")
+    img_names = os.listdir(image_dir)
+
+    if skip_up_to_date and os.path.exists(xml_dir):
+        expected_xml_names = set(img_name.replace(".jpg", ".xml") for img_name in img_names)
+        for xml_name in os.listdir(xml_dir):
+            if xml_name not in expected_xml_names:
+                os.remove(os.path.join(xml_dir, xml_name))
+    else:
+        if os.path.exists(xml_dir):
+            shutil.rmtree(xml_dir)
+        os.makedirs(xml_dir)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_xml, img_name, image_dir, label_dir, xml_dir, category_list, size_table, split_type, json_path, skip_up_to_date) for img_name in img_names]
+        written_count = sum(1 for future in futures if future.result())
+
+    print(f"{split_type}: wrote {written_count} xml labels, {len(img_names) - written_count} already up to date")
 
 def main():
     parser = argparse.ArgumentParser(description="Change JSON and TXT labels into XML for training")
     parser.add_argument('--split_directory', type=str, required=True, help="Directory of splitted dataset")
+    parser.add_argument('--max_workers', type=int, required=False, default=8, help="Number of concurrent workers writing XML labels")
+    parser.add_argument('--skip_up_to_date', action='store_true', help="Keep existing XML labels that are newer than their image, label and annotation json")
     args = parser.parse_args()
     
     train_image_dir = os.path.join(args.split_directory, "train", "images")
@@ -134,10 +219,14 @@ def main():
             print(f"Test label directory ({test_label_dir}) not found")
             sys.exit(1)
     
-    get_xml(args.split_directory, "train")
-    get_xml(args.split_directory, "val")
+    data = load_annotation_json(args.split_directory)
+    category_list = get_category_list(data)
+    size_table = get_image_size_table(data)
+
+    get_xml(args.split_directory, "train", category_list, size_table, args.max_workers, args.skip_up_to_date)
+    get_xml(args.split_directory, "val", category_list, size_table, args.max_workers, args.skip_up_to_date)
     if os.path.exists(os.path.join(args.split_directory, "test")):
-        get_xml(args.split_directory, "test")
+        get_xml(args.split_directory, "test", category_list, size_table, args.max_workers, args.skip_up_to_date)
 
 if __name__ == "__main__":
     main()
@@ -4,6 +4,11 @@ import subprocess
 import random
 import shutil
 import sys
+from json_to_xml import load_annotation_json, get_category_list
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+import balance
 
 def move_image_and_labels(directory, image_list, split_type, split_directory):
     for img_name in image_list:
@@ -92,5 +97,9 @@ def main():
     dest_json_path = os.path.join(args.split_directory, "annotations.json")
     shutil.copy(orig_json_path, dest_json_path)
 
+    category_list = get_category_list(load_annotation_json(args.split_directory))
+    category_names = {str(category_id): name for category_id, name in enumerate(category_list)}
+    balance.create_class_index(args.split_directory, ["train", "val", "test"], category_names)
+
 if __name__ == "__main__":
     main()
@@ -1,9 +1,14 @@
 import argparse
 import numpy as np
 import os
+import sys
 import json
+import resource
+import time
+from PIL import Image
 from tflite_model_maker import model_spec
 from tflite_model_maker import object_detector
+from tflite_model_maker.config import QuantizationType
 from tflite_support import metadata
 import tensorflow as tf
 assert tf.__version__.startswith('2')
@@ -12,30 +17,204 @@ tf.get_logger().setLevel('ERROR')
 from absl import logging
 logging.set_verbosity(logging.ERROR)
 
-def get_category_set(split_directory):
-    json_path = os.path.join(split_directory, "annotations.json")
-    if not os.path.exists(json_path):
-        print(f"Annotation json ({json_path}) not found")
-        sys.exit(1)
-    
-    with open(json_path, "r") as f:
-        data = json.loads(f.read())
+from dataloader import load_split, get_label_map
+from json_to_xml import load_annotation_json
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+import augment_bank
+import balance
+# Offline augmented images already carry flips and scale jitter
+NO_AUGMENTATION = {"input_rand_hflip": False, "jitter_min": 1.0, "jitter_max": 1.0}
+
+def load_data(split_directory, split_type, data, category_list, label_source, cache_dir):
+    if label_source == "txt":
+        return load_split(split_directory, split_type, data, cache_dir)
+    return object_detector.DataLoader.from_pascal_voc(
+        os.path.join(split_directory, split_type, "images"),
+        os.path.join(split_directory, split_type, "xml_labels"),
+        category_list,
+        cache_dir=cache_dir
+    )
+
+def get_memory_mb():
+    # Current RSS from /proc where available, peak RSS (kilobytes on Linux) otherwise
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class ProfileCallback(tf.keras.callbacks.Callback):
+    # The dataset is left untouched, so the gap between one batch ending and the next one beginning is counted as data wait
+    # The compiled train step cannot be split further, so forward and backward are reported together as compute
+    def __init__(self, profile_path, batch_size, input_bound_threshold):
+        super().__init__()
+        self.profile_path = profile_path
+        self.batch_size = batch_size
+        self.input_bound_threshold = input_bound_threshold
+        self.epoch_start = self.step_start = self.step_end = self.data_wait = 0.0
+        self.epoch = 0
+        self.steps = []
+
+    def write(self, record):
+        with open(self.profile_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch + 1
+        self.epoch_start = self.step_end = time.perf_counter()
+        self.steps = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.step_start = time.perf_counter()
+        self.data_wait = self.step_start - self.step_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step_end = time.perf_counter()
+        compute = self.step_end - self.step_start
+        step_time = self.data_wait + compute
+        record = {
+            "type": "step",
+            "trainer": "tflite",
+            "epoch": self.epoch,
+            "step": batch + 1,
+            "images": self.batch_size,
+            "data_wait_s": self.data_wait,
+            "compute_s": compute,
+            "step_time_s": step_time,
+            "images_per_second": self.batch_size / max(step_time, 1e-9),
+            "memory_mb": get_memory_mb(),
+        }
+        self.steps.append(record)
+        self.write(record)
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_time = self.step_end - self.epoch_start
+        data_wait = sum(step['data_wait_s'] for step in self.steps)
+        images = sum(step['images'] for step in self.steps)
+        record = {
+            "type": "epoch",
+            "trainer": "tflite",
+            "epoch": epoch + 1,
+            "steps": len(self.steps),
+            "images": images,
+            "epoch_time_s": epoch_time,
+            "data_wait_s": data_wait,
+            "compute_s": sum(step['compute_s'] for step in self.steps),
+            "data_wait_fraction": data_wait / max(epoch_time, 1e-9),
+            "images_per_second": images / max(epoch_time, 1e-9),
+            "peak_memory_mb": max([step['memory_mb'] for step in self.steps], default=0.0),
+        }
+        record['input_bound'] = record['data_wait_fraction'] >= self.input_bound_threshold
+        if record['input_bound']:
+            print(f"Epoch {epoch + 1} is input bound: {record['data_wait_fraction']:.0%} of the time went to waiting for data, try pre-resized images or a faster cache directory")
+        self.write(record)
+
+class EpochLogger(tf.keras.callbacks.Callback):
+    # Same record layout as the YOLOv10 trainer's epochs.jsonl so sweeps can read both
+    def __init__(self, log_path):
+        super().__init__()
+        self.log_path = log_path
+        self.epoch_start = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        record = {
+            "epoch": epoch + 1,
+            "epochs": self.params.get('epochs'),
+            "epoch_time_s": time.perf_counter() - self.epoch_start,
+            "metrics": {name: float(value) for name, value in (logs or {}).items()},
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+def attach_callbacks(spec, batch_size, log_path=None, profile_path=None, input_bound_threshold=0.2):
+    # Model Maker builds the dataset and calls model.fit inside spec.train, so the callbacks are attached there
+    original_train = spec.train
+
+    def train(model, train_dataset, *args, **kwargs):
+        extra_callbacks = [EpochLogger(log_path)] if log_path else []
+        if profile_path:
+            extra_callbacks.append(ProfileCallback(profile_path, batch_size, input_bound_threshold))
+        original_fit = model.fit
+
+        def fit(x=None, *fit_args, callbacks=None, **fit_kwargs):
+            return original_fit(x, *fit_args, callbacks=list(callbacks or []) + extra_callbacks, **fit_kwargs)
+        model.fit = fit
+        return original_train(model, train_dataset, *args, **kwargs)
+    spec.train = train
+
+def load_benchmark_image(img_path, input_details):
+    _, height, width, _ = input_details['shape']
+    with Image.open(img_path) as image:
+        image = image.convert("RGB").resize((width, height))
+        return np.expand_dims(np.asarray(image, dtype=input_details['dtype']), axis=0)
+
+def benchmark_tflite(tflite_path, image_dir, num_threads, max_images, warmup_images=5):
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+
+    img_names = sorted(os.listdir(image_dir))[:max_images]
+    images = [load_benchmark_image(os.path.join(image_dir, img_name), input_details) for img_name in img_names]
+
+    for image in images[:warmup_images]:
+        interpreter.set_tensor(input_details['index'], image)
+        interpreter.invoke()
 
-    categories = data['categories']
-    category_set = set()
+    latencies = []
+    for image in images:
+        interpreter.set_tensor(input_details['index'], image)
+        start = time.perf_counter()
+        interpreter.invoke()
+        latencies.append((time.perf_counter() - start) * 1000)
 
-    for cat in categories:
-        cat['supercategory'] = cat['supercategory'].replace('&', 'and')
+    return {
+        "mean_ms": float(np.mean(latencies)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
 
-        if cat['supercategory'] in ['Plastic glooves', 'Plastic utensils', 'Lid']:
-            cat['supercategory'] = 'Other plastic'
-        if cat['supercategory'] in ['Scrap metal', 'Food waste', 'Shoe', 'Rope and strings', 'Squeezable tube', 'Blister pack', 'Battery', 'Aluminium foil', 'Pop tab', 'Glass jar', 'Unlabeled litter']:
-            cat['supercategory'] = 'Miscelaneous'
-        if cat['supercategory'] == 'Paper bag':
-            cat['supercategory'] = 'Paper'
-        
-        category_set.add(cat['supercategory'])
-    return category_set
+def export_quantized_variants(model, model_save_name, representative_data, test_data, test_image_dir, num_threads, max_images):
+    # Model Maker rejects a quantization_config next to its INT8 default quantization_type, so the type is set per variant
+    quantization_types = {
+        "dynamic": QuantizationType.DYNAMIC,
+        "float16": QuantizationType.FP16,
+        "int8": QuantizationType.INT8,
+    }
+
+    report = []
+    for variant, quantization_type in quantization_types.items():
+        tflite_filename = f"{model_save_name}_{variant}.tflite"
+        if quantization_type == QuantizationType.INT8:
+            model.export(export_dir='.', tflite_filename=tflite_filename, quantization_type=quantization_type, representative_data=representative_data)
+        else:
+            model.export(export_dir='.', tflite_filename=tflite_filename, quantization_type=quantization_type)
+        print(f"Exported {tflite_filename}")
+
+        metrics = model.evaluate_tflite(tflite_filename, test_data)
+        latency = benchmark_tflite(tflite_filename, test_image_dir, num_threads, max_images)
+        report.append({
+            "variant": variant,
+            "file": tflite_filename,
+            "size_mb": os.path.getsize(tflite_filename) / (1024 * 1024),
+            "AP": float(metrics['AP']),
+            "AP50": float(metrics['AP50']),
+            **latency,
+        })
+
+    print()
+    print("| Variant | Size (MB) | AP | AP50 | Mean (ms) | p50 (ms) | p95 (ms) |")
+    print("|:--|--:|--:|--:|--:|--:|--:|")
+    for row in report:
+        print(f"| {row['variant']} | {row['size_mb']:.2f} | {row['AP']:.4f} | {row['AP50']:.4f} | {row['mean_ms']:.2f} | {row['p50_ms']:.2f} | {row['p95_ms']:.2f} |")
+
+    report_path = f"{model_save_name}_quantization_report.json"
+    with open(report_path, "w") as f:
+        json.dump({"num_threads": num_threads, "variants": report}, f, indent=4)
+    print(f"Quantization report saved to {report_path}")
 
 def main():
     parser = argparse.ArgumentParser(description="Preprocess dataset.")
@@ -45,51 +224,74 @@ def main():
     parser.add_argument('--batch_size', type=int, required=False, default=8, help="Batch size for training")
     parser.add_argument('--full_model_train', action='store_true', help="Use if you want to train the entire model and not just the head")
     parser.add_argument('--model_save_name', type=str, required=False, help="Model's name for saving (no extensions)")
+    parser.add_argument('--label_source', type=str, required=False, default="txt", choices=['txt', 'xml'], help="Build the dataset from the txt labels directly or from the xml labels of json_to_xml.py")
+    parser.add_argument('--cache_dir', type=str, required=False, default="cache", help="Directory to store the TFRecord dataset cache in")
+    parser.add_argument('--export_variants', action='store_true', help="Export dynamic range, float16 and int8 (calibrated on the validation split) models instead of the default one and report their mAP, latency and size on the test split")
+    parser.add_argument('--benchmark_threads', type=int, required=False, default=4, help="Interpreter threads used when benchmarking exported variants")
+    parser.add_argument('--benchmark_images', type=int, required=False, default=100, help="Number of test images used when benchmarking exported variants")
+    parser.add_argument('--augment_bank', type=str, required=False, help="Train on an augment_bank.py output (built with --label_format pixel) with Model Maker's own flips and scale jitter turned off")
+    parser.add_argument('--balance_threshold', type=float, required=False, help="Repeat images of classes found in fewer than this fraction of train images (e.g. 0.01), using class_index.json of the split")
+    parser.add_argument('--log_path', type=str, required=False, help="JSONL file to append per-epoch losses and validation metrics to")
+    parser.add_argument('--profile', action='store_true', help="Trace data wait, compute time, images/sec and memory of every step")
+    parser.add_argument('--profile_path', type=str, required=False, help="JSONL file for the profile trace (default: <model_save_name>_profile.jsonl)")
+    parser.add_argument('--input_bound_threshold', type=float, required=False, default=0.2, help="Fraction of epoch time spent waiting for data above which training is flagged as input bound")
     args = parser.parse_args()
 
     train_image_dir = os.path.join(args.split_directory, "train", "images")
-    train_xml_label_dir = os.path.join(args.split_directory, "train", "xml_labels")
+    train_label_dir = os.path.join(args.split_directory, "train", "labels" if args.label_source == "txt" else "xml_labels")
     if not os.path.exists(train_image_dir):
         print(f"Train image directory ({train_image_dir}) not found")
         sys.exit(1)
-    if not os.path.exists(train_xml_label_dir):
-        print(f"Train xml label directory ({train_xml_label_dir}) not found")
+    if not os.path.exists(train_label_dir):
+        print(f"Train {args.label_source} label directory ({train_label_dir}) not found")
         sys.exit(1)
 
     val_image_dir = os.path.join(args.split_directory, "val", "images")
-    val_xml_label_dir = os.path.join(args.split_directory, "val", "xml_labels")
+    val_label_dir = os.path.join(args.split_directory, "val", "labels" if args.label_source == "txt" else "xml_labels")
     if not os.path.exists(val_image_dir):
         print(f"Validation image directory ({val_image_dir}) not found")
         sys.exit(1)
-    if not os.path.exists(val_xml_label_dir):
-        print(f"Validation xml label directory ({val_xml_label_dir}) not found")
+    if not os.path.exists(val_label_dir):
+        print(f"Validation {args.label_source} label directory ({val_label_dir}) not found")
         sys.exit(1)
     
+    if args.balance_threshold is not None and args.label_source != "txt":
+        print("Balanced sampling can only be used with txt labels")
+        sys.exit(1)
+    if args.augment_bank:
+        if args.label_source != "txt":
+            print("The augmentation bank can only be used with txt labels")
+            sys.exit(1)
+        if not os.path.exists(os.path.join(args.augment_bank, "index.json")):
+            print(f"Augmentation bank index ({os.path.join(args.augment_bank, 'index.json')}) not found")
+            sys.exit(1)
+
     if (args.model_version < 0) or (args.model_version > 4):
         print(f"Model version must be between 0 and 4, but found {args.model_version} instead")
         sys.exit(1)
 
-    category_set = get_category_set(args.split_directory)
-    category_list = list(category_set)
-
-    train_data = object_detector.DataLoader.from_pascal_voc(
-        train_image_dir,
-        train_xml_label_dir,
-        category_list
-    )
+    data = load_annotation_json(args.split_directory)
+    category_list = get_label_map(data)
 
+    if args.augment_bank:
+        bank_directory, index = augment_bank.materialize_bank(args.augment_bank)
+        if index['settings']['label_format'] != "pixel":
+            print(f"Augmentation bank labels must be in pixel format, but found {index['settings']['label_format']} instead")
+            sys.exit(1)
+        train_directory, train_split = bank_directory, index['split']
+    else:
+        train_directory, train_split = args.split_directory, "train"
+    if args.balance_threshold is not None:
+        img_names = balance.get_balanced_image_list(train_directory, train_split, args.balance_threshold)
+        train_data = load_split(train_directory, train_split, data, args.cache_dir, img_names=img_names)
+    elif args.augment_bank:
+        train_data = load_split(train_directory, train_split, data, args.cache_dir)
+    else:
+        train_data = load_data(args.split_directory, "train", data, category_list, args.label_source, args.cache_dir)
     print("Train data loaded")
-
-    val_data = object_detector.DataLoader.from_pascal_voc(
-        val_image_dir,
-        val_xml_label_dir,
-        category_list
-    )
+    val_data = load_data(args.split_directory, "val", data, category_list, args.label_source, args.cache_dir)
     print("Val data loaded")
     
-    spec = model_spec.get(f"efficientdet_lite{args.model_version}")
-    model = object_detector.create(train_data, model_spec=spec, batch_size=args.batch_size, train_whole_model=False, epochs=args.epochs, validation_data=val_data)
-
     if not args.model_save_name:
         if args.full_model_train:
             model_save_name = f"taco_v{args.model_version}_full_{args.epochs}epoch"
@@ -97,7 +299,25 @@ def main():
             model_save_name = f"taco_v{args.model_version}_head_{args.epochs}epoch"
     else:
         model_save_name = args.model_save_name
-    model.export(export_dir='.', tflite_filename=model_save_name + ".tflite")
+
+    spec = model_spec.get(f"efficientdet_lite{args.model_version}")
+    if args.augment_bank:
+        spec.config.override(NO_AUGMENTATION)
+    profile_path = (args.profile_path or f"{model_save_name}_profile.jsonl") if args.profile else None
+    if args.log_path or profile_path:
+        attach_callbacks(spec, args.batch_size, args.log_path, profile_path, args.input_bound_threshold)
+    model = object_detector.create(train_data, model_spec=spec, batch_size=args.batch_size, train_whole_model=False, epochs=args.epochs, validation_data=val_data)
+    if args.profile:
+        print(f"Profile trace saved to {profile_path}")
+
+    if args.export_variants:
+        test_split = "test" if os.path.exists(os.path.join(args.split_directory, "test")) else "val"
+        test_data = load_data(args.split_directory, test_split, data, category_list, args.label_source, args.cache_dir)
+        test_image_dir = os.path.join(args.split_directory, test_split, "images")
+        print(f"Benchmarking exported variants on the {test_split} split")
+        export_quantized_variants(model, model_save_name, val_data, test_data, test_image_dir, args.benchmark_threads, args.benchmark_images)
+    else:
+        model.export(export_dir='.', tflite_filename=model_save_name + ".tflite")
 
 if __name__ == "__main__":
     main()
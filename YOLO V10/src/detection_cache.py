@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Detections are cached at this confidence and filtered to the requested one when served
+CACHE_MIN_CONF = 0.01
+
+def get_cache_key(image_hash, model_hash, params):
+    key = hashlib.sha256()
+    key.update(f"{image_hash}|{model_hash}|{json.dumps(params, sort_keys=True)}".encode("utf8"))
+    return key.hexdigest()
+
+class DetectionCache:
+    def __init__(self, cache_dir, max_size_mb=512):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "detections.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        blob = json.dumps(value).encode("utf8")
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        # Least recently used entries go first until the cache fits in its size cap again
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        for key, size in self.connection.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
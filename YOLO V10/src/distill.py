@@ -0,0 +1,229 @@
+import argparse
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import torch
+import yaml
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.nn.tasks import YOLOv10DetectionModel
+from ultralytics.utils import RANK
+from ultralytics.utils.loss import v10DetectLoss
+from ultralytics.utils.tal import TaskAlignedAssigner
+from inference import get_model_hash, is_image, iter_image_batches, load_model
+from train import train
+from evaluate import box_iou_matrix
+
+# Teacher scores are capped below 1 so a teacher box never encodes as a whole, ground truth class id
+MAX_SOFT_SCORE = 0.999
+
+def load_teacher_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {"image_names": [], "signatures": [], "image_indices": np.zeros(0, dtype=int), "classes": np.zeros(0, dtype=int), "scores": np.zeros(0), "boxes": np.zeros((0, 4)), "names": []}
+    cache = np.load(cache_path)
+    cache = {key: (cache[key].tolist() if key in ["image_names", "signatures", "names"] else cache[key]) for key in cache.files}
+    # Caches written before signatures were stored are redone image by image
+    cache.setdefault('signatures', [""] * len(cache['image_names']))
+    return cache
+
+def save_teacher_cache(cache_path, cache):
+    partial_path = cache_path + ".partial.npz"
+    np.savez_compressed(partial_path, **{key: np.array(value) for key, value in cache.items()})
+    os.replace(partial_path, cache_path)
+
+def get_image_signature(image_path):
+    stat = os.stat(image_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def drop_cached_images(cache, image_names):
+    kept = np.array([image_name not in image_names for image_name in cache['image_names']], dtype=bool)
+    new_indices = np.cumsum(kept) - 1
+    in_kept = kept[cache['image_indices']]
+    cache['image_indices'] = new_indices[cache['image_indices'][in_kept]]
+    for key in ["classes", "scores", "boxes"]:
+        cache[key] = cache[key][in_kept]
+    cache['image_names'] = [image_name for image_name, keep in zip(cache['image_names'], kept) if keep]
+    cache['signatures'] = [signature for signature, keep in zip(cache['signatures'], kept) if keep]
+
+def update_teacher_cache(teacher_weight, image_directory, cache_path, min_conf, imgsz, batch_size):
+    # Only new images and images whose size or mtime changed go through the teacher, so it runs once per image version and weights
+    cache = load_teacher_cache(cache_path)
+    known = dict(zip(cache['image_names'], cache['signatures']))
+    signatures = {file_name: get_image_signature(os.path.join(image_directory, file_name)) for file_name in sorted(os.listdir(image_directory)) if is_image(file_name)}
+    changed = {file_name for file_name, signature in signatures.items() if file_name in known and known[file_name] != signature}
+    image_paths = [os.path.join(image_directory, file_name) for file_name, signature in signatures.items() if known.get(file_name) != signature]
+    if changed:
+        print(f"{len(changed)} images changed since their teacher predictions were cached, inferring on them again")
+        drop_cached_images(cache, changed)
+    if not image_paths:
+        print(f"Teacher predictions for all images found in {cache_path}")
+        return cache
+
+    teacher = load_model(teacher_weight)
+    cache['names'] = [teacher.names[class_id] for class_id in sorted(teacher.names)]
+    image_indices, classes, scores, boxes = [cache['image_indices']], [cache['classes']], [cache['scores']], [cache['boxes']]
+    start = time.perf_counter()
+    for batch in iter_image_batches(image_paths, batch_size, batch_size * 2):
+        results = teacher.predict([image for _, image in batch], conf=min_conf, imgsz=imgsz, save=False, verbose=False)
+        for (image_path, _), result in zip(batch, results):
+            image_indices.append(np.full(len(result.boxes), len(cache['image_names'])))
+            cache['image_names'].append(os.path.basename(image_path))
+            cache['signatures'].append(signatures[os.path.basename(image_path)])
+            classes.append(result.boxes.cls.cpu().numpy().astype(int))
+            scores.append(result.boxes.conf.cpu().numpy())
+            boxes.append(result.boxes.xywhn.cpu().numpy())
+    print(f"Teacher inferred on {len(image_paths)} new or changed images in {time.perf_counter() - start:.2f}s")
+
+    cache['image_indices'] = np.concatenate(image_indices)
+    cache['classes'] = np.concatenate(classes)
+    cache['scores'] = np.concatenate(scores)
+    cache['boxes'] = np.concatenate(boxes).reshape(-1, 4)
+    save_teacher_cache(cache_path, cache)
+    print(f"Teacher predictions saved to {cache_path}")
+    return cache
+
+def xywh_to_xyxy(boxes):
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+
+def load_label_lines(label_path):
+    if not os.path.exists(label_path):
+        return []
+    with open(label_path, "r") as f:
+        return [line.strip() for line in f if len(line.strip().split()) == 5]
+
+def encode_soft_class(class_id, score):
+    # Ultralytics augmentations carry the class column along with every box, so the teacher confidence rides in its
+    # fractional part: ground truth boxes keep whole class ids and a weight of 1, teacher boxes get 1 - fraction
+    return class_id + 1 - min(score, MAX_SOFT_SCORE)
+
+def get_soft_labels(label_lines, teacher_classes, teacher_scores, teacher_boxes, match_iou):
+    # Teacher boxes on an object that is already labelled are dropped whatever their class, the ground truth wins
+    if len(teacher_boxes) == 0:
+        return []
+    keep = np.ones(len(teacher_boxes), dtype=bool)
+    if label_lines:
+        values = np.array([line.split() for line in label_lines], dtype=float)
+        ious = box_iou_matrix(xywh_to_xyxy(teacher_boxes), xywh_to_xyxy(values[:, 1:]))
+        keep = ~np.any(ious >= match_iou, axis=1)
+    return [
+        f"{encode_soft_class(class_id, score):.6f} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
+        for class_id, score, (x, y, w, h) in zip(teacher_classes[keep], teacher_scores[keep], teacher_boxes[keep])
+    ]
+
+class SoftTargetAssigner(TaskAlignedAssigner):
+    @torch.no_grad()
+    def forward(self, pd_scores, pd_bboxes, anc_points, gt_labels, gt_bboxes, mask_gt):
+        if gt_labels.shape[1] == 0:
+            return super().forward(pd_scores, pd_bboxes, anc_points, gt_labels, gt_bboxes, mask_gt)
+        weights = 1 - torch.frac(gt_labels).squeeze(-1)
+        target_labels, target_bboxes, target_scores, fg_mask, target_gt_idx = super().forward(pd_scores, pd_bboxes, anc_points, torch.floor(gt_labels), gt_bboxes, mask_gt)
+        # Scaling the targets by the teacher confidence turns the class, box and DFL losses of teacher boxes into soft ones
+        target_weights = weights.gather(1, target_gt_idx.long()) * fg_mask
+        return target_labels, target_bboxes, target_scores * target_weights.unsqueeze(-1), fg_mask, target_gt_idx
+
+class SoftTargetDetectionLoss(v10DetectLoss):
+    def __init__(self, model):
+        super().__init__(model)
+        for loss in [self.one2many, self.one2one]:
+            assigner = loss.assigner
+            loss.assigner = SoftTargetAssigner(topk=assigner.topk, num_classes=assigner.num_classes, alpha=assigner.alpha, beta=assigner.beta)
+
+class SoftTargetDetectionModel(YOLOv10DetectionModel):
+    def init_criterion(self):
+        return SoftTargetDetectionLoss(self)
+
+class SoftTargetTrainer(YOLOv10DetectionTrainer):
+    def get_model(self, cfg=None, weights=None, verbose=True):
+        model = SoftTargetDetectionModel(cfg, nc=self.data["nc"], verbose=verbose and RANK == -1)
+        if weights:
+            model.load(weights)
+        return model
+
+def link_or_copy(source, destination):
+    try:
+        os.symlink(os.path.abspath(source), destination)
+    except OSError:
+        if os.path.isdir(source):
+            shutil.copytree(source, destination)
+        else:
+            shutil.copy(source, destination)
+
+def build_soft_label_dataset(split_directory, soft_label_directory, cache, soft_label_conf, match_iou):
+    with open(os.path.join(split_directory, "data.yaml"), "r") as f:
+        data = yaml.safe_load(f)
+    names = data['names'] if isinstance(data['names'], list) else [data['names'][class_id] for class_id in sorted(data['names'])]
+    class_ids = {name: class_id for class_id, name in enumerate(names)}
+    # Teacher classes are mapped by name, classes the dataset does not have are dropped
+    class_map = np.array([class_ids.get(name, -1) for name in cache['names']], dtype=int)
+
+    if os.path.exists(soft_label_directory):
+        shutil.rmtree(soft_label_directory)
+    os.makedirs(os.path.join(soft_label_directory, "train", "images"))
+    os.makedirs(os.path.join(soft_label_directory, "train", "labels"))
+    for split_type in ["valid", "test"]:
+        if os.path.exists(os.path.join(split_directory, split_type)):
+            link_or_copy(os.path.join(split_directory, split_type), os.path.join(soft_label_directory, split_type))
+
+    image_directory = os.path.join(split_directory, "train", "images")
+    label_directory = os.path.join(split_directory, "train", "labels")
+    image_ids = {image_name: index for index, image_name in enumerate(cache['image_names'])}
+    confident = cache['scores'] >= soft_label_conf
+    soft_label_count = 0
+    for img_name in sorted(os.listdir(image_directory)):
+        if not is_image(img_name):
+            continue
+        label_name = os.path.splitext(img_name)[0] + ".txt"
+        label_lines = load_label_lines(os.path.join(label_directory, label_name))
+        in_image = confident & (cache['image_indices'] == image_ids.get(img_name, -1))
+        teacher_classes = class_map[cache['classes'][in_image]]
+        known = teacher_classes >= 0
+        soft_labels = get_soft_labels(label_lines, teacher_classes[known], cache['scores'][in_image][known], cache['boxes'][in_image][known], match_iou)
+        soft_label_count += len(soft_labels)
+
+        link_or_copy(os.path.join(image_directory, img_name), os.path.join(soft_label_directory, "train", "images", img_name))
+        with open(os.path.join(soft_label_directory, "train", "labels", label_name), "w") as f:
+            f.write("".join(line + "\n" for line in label_lines + soft_labels))
+
+    data.update({"names": names, "nc": len(names), "train": "../train/images", "val": "../valid/images"})
+    with open(os.path.join(soft_label_directory, "data.yaml"), "w") as f:
+        yaml.safe_dump(data, f)
+    print(f"Soft label dataset created at {soft_label_directory} with {soft_label_count} teacher boxes added to the labels")
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill a large YOLOv10 teacher into a small YOLOv10 student, trained on the labels plus the teacher's cached boxes as soft targets weighted by its confidence.")
+    parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory name (without 'datasets' parent folder)")
+    parser.add_argument('--teacher_weight', type=str, required=True, help="Path to the trained teacher weights (e.g. a fine tuned YOLOv10-M)")
+    parser.add_argument('--student_weight', type=str, required=False, default="yolov10n.pt", help="Path to the student weights to start from")
+    parser.add_argument('--epochs', type=int, required=True, help="Number of epochs to train the student")
+    parser.add_argument('--batch_size', type=int, required=False, default=8, help="Batch size for training")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="Teacher inference and student training image size")
+    parser.add_argument('--teacher_min_conf', type=float, required=False, default=0.05, help="Lowest teacher confidence kept in the cache")
+    parser.add_argument('--soft_label_conf', type=float, required=False, default=0.1, help="Teacher confidence a box needs to become a soft target, its loss is weighted by that confidence")
+    parser.add_argument('--match_iou', type=float, required=False, default=0.5, help="IoU with any ground truth box above which a teacher box is dropped as already labelled")
+    parser.add_argument('--cache_dir', type=str, required=False, default="cache/teacher", help="Directory storing the cached teacher predictions")
+    parser.add_argument('--teacher_batch_size', type=int, required=False, default=16, help="Number of images run through the teacher at once")
+    args = parser.parse_args()
+
+    split_directory = os.path.join("datasets", args.directory)
+    soft_label_directory = os.path.join("datasets", f"{args.directory}_soft_labels")
+    image_directory = os.path.join(split_directory, "train", "images")
+    if not os.path.exists(image_directory):
+        print(f"Train image directory ({image_directory}) not found")
+        sys.exit(1)
+    if not os.path.exists(args.teacher_weight):
+        print(f"Teacher weight ({args.teacher_weight}) not found")
+        sys.exit(1)
+    if args.soft_label_conf < args.teacher_min_conf:
+        print(f"Soft label conf ({args.soft_label_conf}) must not be lower than teacher min conf ({args.teacher_min_conf})")
+        sys.exit(1)
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    cache_name = f"teacher_{get_model_hash(args.teacher_weight)}_{args.directory.replace('/', '_')}_{args.imgsz}_{args.teacher_min_conf}.npz"
+    cache = update_teacher_cache(args.teacher_weight, image_directory, os.path.join(args.cache_dir, cache_name), args.teacher_min_conf, args.imgsz, args.teacher_batch_size)
+    build_soft_label_dataset(split_directory, soft_label_directory, cache, args.soft_label_conf, args.match_iou)
+
+    train(args.student_weight, os.path.join(os.getcwd(), soft_label_directory, "data.yaml"), args.epochs, args.batch_size, args.imgsz, trainer=SoftTargetTrainer)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from ultralytics import YOLOv10
+from inference import is_image, load_model
+from onnx_backend import preprocess
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+import evaluate
+
+class ValCalibrationDataReader(CalibrationDataReader):
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = iter(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for image_path in self.image_paths:
+            image = cv2.imread(image_path)
+            if image is None:
+                print(f"Could not read {image_path}, skipping it")
+                continue
+            return {self.input_name: preprocess([image], self.imgsz)[0]}
+        return None
+
+def get_image_paths(image_directory, max_images):
+    return [os.path.join(image_directory, file_name) for file_name in sorted(os.listdir(image_directory)) if is_image(file_name)][:max_images]
+
+def export_onnx(weight, output_directory, imgsz, opset):
+    # A dynamic batch lets inference.py keep batching images through the exported model
+    exported_path = YOLOv10(weight).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, opset=opset)
+    onnx_path = os.path.join(output_directory, os.path.splitext(os.path.basename(weight))[0] + ".onnx")
+    if os.path.abspath(exported_path) != os.path.abspath(onnx_path):
+        shutil.move(exported_path, onnx_path)
+    return onnx_path
+
+def copy_metadata(source_path, target_path):
+    source = onnx.load(source_path)
+    target = onnx.load(target_path)
+    del target.metadata_props[:]
+    target.metadata_props.extend(source.metadata_props)
+    onnx.save(target, target_path)
+
+def quantize_int8(onnx_path, calibration_paths, imgsz, per_channel):
+    prepared_path = onnx_path.replace(".onnx", "_prepared.onnx")
+    int8_path = onnx_path.replace(".onnx", "_int8.onnx")
+    quant_pre_process(onnx_path, prepared_path)
+    input_name = onnx.load(prepared_path).graph.input[0].name
+
+    # Only convolutions and matmuls are quantized, the NMS-free head's top-k and gathers stay in float
+    quantize_static(
+        prepared_path,
+        int8_path,
+        ValCalibrationDataReader(calibration_paths, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv", "MatMul"],
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    os.remove(prepared_path)
+    # The class names live in the model metadata, which quantization does not carry over
+    copy_metadata(onnx_path, int8_path)
+    return int8_path
+
+def measure_variant(model_path, backend, image_paths, imgsz, intra_op_threads, ground_truth, warmup=3):
+    model = load_model(model_path, backend, intra_op_threads)
+    rows, latencies_ms = [], []
+    for index, image_path in enumerate(image_paths):
+        image = cv2.imread(image_path)
+        start = time.perf_counter()
+        result = model.predict([image], conf=0.001, imgsz=imgsz, save=False, verbose=False)[0]
+        if index >= warmup:
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+        boxes = result.boxes.xyxy.cpu().numpy()
+        scores = result.boxes.conf.cpu().numpy()
+        classes = result.boxes.cls.cpu().numpy().astype(int)
+        for i in range(len(scores)):
+            rows.append((os.path.basename(image_path), model.names[int(classes[i])], *boxes[i], scores[i]))
+
+    images = [os.path.basename(image_path) for image_path in image_paths]
+    metrics = evaluate.evaluate(ground_truth, evaluate.to_columns(rows, True), images, workers=1)
+    latencies_ms = latencies_ms or [0.0]
+    return {
+        "model_path": model_path,
+        "backend": backend,
+        "size_mb": os.path.getsize(model_path) / 1024 / 1024,
+        "map": metrics['map'],
+        "map50": metrics['map50'],
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "images_per_second": 1000 / max(float(np.mean(latencies_ms)), 1e-9),
+    }
+
+def print_report(report):
+    print("| Variant | Size (MB) | mAP50-95 | mAP50 | p50 (ms) | p95 (ms) | Images/sec |")
+    print("|---|---|---|---|---|---|---|")
+    for name, variant in report.items():
+        print(f"| {name} | {variant['size_mb']:.1f} | {variant['map']:.4f} | {variant['map50']:.4f} | {variant['latency_p50_ms']:.1f} | {variant['latency_p95_ms']:.1f} | {variant['images_per_second']:.2f} |")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLOv10 weights to ONNX with optional int8 quantization calibrated on the val split.")
+    parser.add_argument('--weight', type=str, required=True, help="Path to the trained .pt weights")
+    parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory name (without 'datasets' parent folder)")
+    parser.add_argument('--output_directory', type=str, required=False, help="Directory to store the exported models and report (default: next to the weights)")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="Export and inference image size")
+    parser.add_argument('--opset', type=int, required=False, default=13, help="ONNX opset version")
+    parser.add_argument('--calibration_images', type=int, required=False, default=200, help="Number of val images used to calibrate int8 activations")
+    parser.add_argument('--per_channel', action='store_true', help="Quantize weights per output channel instead of per tensor")
+    parser.add_argument('--no_int8', action='store_true', help="Only export the float ONNX model")
+    parser.add_argument('--report_split', type=str, required=False, help="Split the accuracy and latency report runs on (default: test if it exists, else valid)")
+    parser.add_argument('--report_images', type=int, required=False, default=200, help="Number of images in the report, 0 skips it")
+    parser.add_argument('--intra_op_threads', type=int, required=False, help="Threads used inside a single op while measuring latency")
+    args = parser.parse_args()
+
+    split_directory = os.path.join("datasets", args.directory)
+    val_image_directory = os.path.join(split_directory, "valid", "images")
+    if not os.path.exists(args.weight):
+        print(f"Weight ({args.weight}) not found")
+        sys.exit(1)
+    if not os.path.exists(val_image_directory):
+        print(f"Val image directory ({val_image_directory}) not found")
+        sys.exit(1)
+
+    output_directory = args.output_directory or os.path.dirname(os.path.abspath(args.weight))
+    os.makedirs(output_directory, exist_ok=True)
+
+    onnx_path = export_onnx(args.weight, output_directory, args.imgsz, args.opset)
+    print(f"ONNX model saved to {onnx_path}")
+    variants = {"torch": (args.weight, "torch"), "onnx": (onnx_path, "onnx")}
+    if not args.no_int8:
+        calibration_paths = get_image_paths(val_image_directory, args.calibration_images)
+        start = time.perf_counter()
+        int8_path = quantize_int8(onnx_path, calibration_paths, args.imgsz, args.per_channel)
+        print(f"Calibrated on {len(calibration_paths)} val images in {time.perf_counter() - start:.2f}s, int8 model saved to {int8_path}")
+        variants['onnx_int8'] = (int8_path, "onnx")
+
+    if args.report_images <= 0:
+        return
+    report_split = args.report_split or ("test" if os.path.exists(os.path.join(split_directory, "test", "images")) else "valid")
+    if report_split == "valid" and not args.no_int8:
+        print("Reporting on the valid split, which the int8 model was also calibrated on")
+    report_split_path = os.path.join(split_directory, report_split)
+    image_paths = get_image_paths(os.path.join(report_split_path, "images"), args.report_images)
+
+    ground_truth, _ = evaluate.load_yolo_ground_truth(report_split_path, os.path.join(split_directory, "data.yaml"))
+    in_report = np.isin(ground_truth['images'], [os.path.basename(image_path) for image_path in image_paths])
+    ground_truth = {key: value[in_report] for key, value in ground_truth.items()}
+
+    report = {}
+    for name, (model_path, backend) in variants.items():
+        print(f"Measuring {name} on {len(image_paths)} {report_split} images")
+        report[name] = measure_variant(model_path, backend, image_paths, args.imgsz, args.intra_op_threads, ground_truth)
+
+    print_report(report)
+    report_path = os.path.join(output_directory, "export_report.json")
+    with open(report_path, "w") as f:
+        json.dump({"split": report_split, "images": len(image_paths), "variants": report}, f, indent=4)
+    print(f"Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
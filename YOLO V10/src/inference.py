@@ -1,8 +1,23 @@
-import subprocess
 import argparse
+import collections
+import functools
+import hashlib
+import importlib.util
+import json
 import os
+import queue
 import sys
-import shutil
+import tempfile
+import threading
+import time
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from ultralytics import YOLOv10
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+from detection_utils import draw_detections, yolo_result_to_detections
+from inference_server import predict_image
 
 def is_image(file_path):
     return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
@@ -10,6 +25,368 @@ def is_image(file_path):
 def is_video(file_path):
     return file_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv'))
 
+def load_model(weight, backend="torch", intra_op_threads=None):
+    if backend == "onnx":
+        from onnx_backend import OnnxModel
+        return OnnxModel(weight, intra_op_threads)
+    if intra_op_threads:
+        import torch
+        torch.set_num_threads(intra_op_threads)
+    return YOLOv10(weight)
+
+def get_file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_model_hash(weight):
+    return get_file_hash(weight)[:16]
+
+def create_job_directory(result_directory, job_name=None):
+    # Every job writes into its own directory so parallel jobs never share output paths
+    os.makedirs(result_directory, exist_ok=True)
+    if job_name:
+        job_directory = os.path.join(result_directory, job_name)
+        os.makedirs(job_directory)
+        return job_directory
+    return tempfile.mkdtemp(prefix=time.strftime("%Y%m%d-%H%M%S_"), dir=result_directory)
+
+def get_partial_path(path):
+    root, extension = os.path.splitext(path)
+    return f"{root}.partial{extension}"
+
+def write_image(path, image):
+    partial_path = get_partial_path(path)
+    cv2.imwrite(partial_path, image)
+    os.replace(partial_path, path)
+
+def prefetch_images(image_paths, prefetch_queue):
+    for image_path in image_paths:
+        prefetch_queue.put((image_path, cv2.imread(image_path)))
+    prefetch_queue.put(None)
+
+def iter_image_batches(image_paths, batch_size, prefetch_size):
+    # Decoding runs in a separate thread so the next batch is ready when the model finishes
+    prefetch_queue = queue.Queue(maxsize=prefetch_size)
+    threading.Thread(target=prefetch_images, args=(image_paths, prefetch_queue), daemon=True).start()
+
+    batch = []
+    while True:
+        item = prefetch_queue.get()
+        if item is None:
+            break
+        image_path, image = item
+        if image is None:
+            print(f"Could not read {image_path}, skipping it")
+            continue
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def arrays_to_detections(boxes, scores, classes, class_names):
+    return [{
+        "class_id": int(classes[i]),
+        "class_name": class_names[int(classes[i])],
+        "score": float(scores[i]),
+        "box": [float(value) for value in boxes[i]],
+    } for i in range(len(scores))]
+
+def to_detection_records(detections, image_id, image_path, width, height, model_hash):
+    return [{
+        "image_id": image_id,
+        "image": image_path,
+        "width": int(width),
+        "height": int(height),
+        **detection,
+        "model_hash": model_hash,
+    } for detection in detections]
+
+def write_detections(records, images, class_names, output_path, output_format, model_hash):
+    partial_path = get_partial_path(output_path)
+    if output_format == "jsonl":
+        with open(partial_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    elif output_format == "coco":
+        coco = {
+            "info": {"model_hash": model_hash},
+            "images": images,
+            "categories": [{"id": class_id, "name": name} for class_id, name in sorted(class_names.items())],
+            "annotations": [{
+                "id": index,
+                "image_id": record['image_id'],
+                "category_id": record['class_id'],
+                "bbox": [record['box'][0], record['box'][1], record['box'][2] - record['box'][0], record['box'][3] - record['box'][1]],
+                "score": record['score'],
+            } for index, record in enumerate(records)],
+        }
+        with open(partial_path, "w") as f:
+            json.dump(coco, f)
+    else:
+        import pandas as pd
+        columns = ["image_id", "image", "width", "height", "class_id", "class_name", "score", "xmin", "ymin", "xmax", "ymax", "model_hash"]
+        rows = [{**record, "xmin": record['box'][0], "ymin": record['box'][1], "xmax": record['box'][2], "ymax": record['box'][3]} for record in records]
+        pd.DataFrame(rows, columns=columns).to_parquet(partial_path, index=False)
+    os.replace(partial_path, output_path)
+
+def get_detections_path(result_directory, output_format):
+    extensions = {"jsonl": ".jsonl", "coco": ".coco.json", "parquet": ".parquet"}
+    return os.path.join(result_directory, "detections" + extensions[output_format])
+
+def load_class_thresholds(path):
+    with open(path, "r") as f:
+        return json.load(f)['thresholds']
+
+def get_predict_conf(conf, class_thresholds=None):
+    # The model runs at the lowest threshold in use and per-class thresholds are applied afterwards
+    return min([conf] + list(class_thresholds.values())) if class_thresholds else conf
+
+def get_threshold(class_name, conf, class_thresholds=None):
+    return class_thresholds.get(class_name, conf) if class_thresholds else conf
+
+def filter_detections(detections, conf, class_thresholds=None):
+    return [detection for detection in detections if detection['score'] >= get_threshold(detection['class_name'], conf, class_thresholds)]
+
+def get_cached_detections(cache, image_paths, model_hash, imgsz, predict_conf):
+    # Files are hashed without being decoded, so cache hits never reach the decoder or the model
+    from detection_cache import CACHE_MIN_CONF, get_cache_key
+    params = {"imgsz": imgsz, "min_conf": CACHE_MIN_CONF}
+    cache_keys = {image_path: get_cache_key(get_file_hash(image_path), model_hash, params) for image_path in image_paths}
+    hits = {}
+    for image_path, cache_key in cache_keys.items():
+        entry = cache.get(cache_key)
+        # An entry inferred above the requested threshold lacks the lower scoring boxes, so it is inferred again
+        if entry is not None and entry.get('min_conf', CACHE_MIN_CONF) <= predict_conf:
+            hits[image_path] = entry
+    return cache_keys, hits
+
+def get_class_names(model_factory, model_hash, cache):
+    # Class names are cached with the detections so a run served fully from the cache never loads the weights
+    names_key = f"class_names:{model_hash}"
+    class_names = cache.get(names_key) if cache is not None else None
+    if class_names is not None:
+        return {int(class_id): name for class_id, name in class_names.items()}
+    class_names = model_factory().names
+    if cache is not None:
+        cache.put(names_key, class_names)
+    return class_names
+
+def infer_images(model_factory, image_paths, result_directory, conf, batch_size=16, imgsz=640, prefetch_size=32, output_format="render", model_hash=None, cache=None, class_thresholds=None):
+    # Structured formats only keep the boxes, so nothing is drawn or encoded; render.py can draw them later
+    image_ids = {image_path: index for index, image_path in enumerate(image_paths)}
+    records = []
+    images = []
+    image_count = 0
+
+    def save_detections(image_path, width, height, detections, image=None):
+        if output_format == "render":
+            image = cv2.imread(image_path) if image is None else image
+            if image is None:
+                print(f"Could not read {image_path}, skipping it")
+                return
+            write_image(os.path.join(result_directory, os.path.basename(image_path)), draw_detections(image, detections))
+        else:
+            images.append({"id": image_ids[image_path], "file_name": image_path, "width": int(width), "height": int(height)})
+            records.extend(to_detection_records(detections, image_ids[image_path], image_path, int(width), int(height), model_hash))
+
+    start = time.perf_counter()
+    predict_conf = get_predict_conf(conf, class_thresholds)
+    if cache is not None:
+        from detection_cache import CACHE_MIN_CONF
+        # Misses are inferred at the cache floor so later runs can serve any higher threshold, or lower when asked for
+        predict_conf = min(CACHE_MIN_CONF, predict_conf)
+        cache_keys, hits = get_cached_detections(cache, image_paths, model_hash, imgsz, predict_conf)
+        for image_path, entry in hits.items():
+            save_detections(image_path, entry['width'], entry['height'], filter_detections(entry['detections'], conf, class_thresholds))
+        image_paths = [image_path for image_path in image_paths if image_path not in hits]
+        image_count += len(hits)
+        print(f"{len(hits)} images served from the detection cache, {len(image_paths)} left to infer")
+
+    for batch in iter_image_batches(image_paths, batch_size, prefetch_size):
+        results = model_factory().predict([image for _, image in batch], conf=predict_conf, imgsz=imgsz, save=False, verbose=False)
+        for (image_path, image), result in zip(batch, results):
+            height, width = result.orig_shape
+            detections = yolo_result_to_detections(result)
+            if cache is not None:
+                cache.put(cache_keys[image_path], {"width": int(width), "height": int(height), "min_conf": predict_conf, "detections": detections})
+            save_detections(image_path, width, height, filter_detections(detections, conf, class_thresholds), image)
+            image_count += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"Inferred on {image_count} images in {elapsed:.2f}s ({image_count / max(elapsed, 1e-9):.2f} images/sec)")
+    if output_format != "render":
+        output_path = get_detections_path(result_directory, output_format)
+        write_detections(records, images, get_class_names(model_factory, model_hash, cache), output_path, output_format, model_hash)
+        print(f"{len(records)} detections saved to {output_path}")
+
+def infer_images_sliced(tile_predict, class_names, image_paths, result_directory, slice_size, slice_overlap, merge="nms", iou_threshold=0.5, full_image=False, prefetch_size=32, output_format="render", model_hash=None, conf=0.0, class_thresholds=None):
+    from slicing import infer_sliced
+    timings = collections.Counter()
+    records = []
+    images = []
+    image_count = 0
+    start = time.perf_counter()
+    for batch in iter_image_batches(image_paths, 1, prefetch_size):
+        image_path, image = batch[0]
+        boxes, scores, classes, image_timings = infer_sliced(image, tile_predict, slice_size, slice_overlap, merge, iou_threshold, full_image)
+        timings.update(image_timings)
+        detections = filter_detections(arrays_to_detections(boxes, scores, classes, class_names), conf, class_thresholds)
+
+        output_start = time.perf_counter()
+        if output_format == "render":
+            write_image(os.path.join(result_directory, os.path.basename(image_path)), draw_detections(image, detections))
+        else:
+            height, width = image.shape[:2]
+            images.append({"id": image_count, "file_name": image_path, "width": width, "height": height})
+            records.extend(to_detection_records(detections, image_count, image_path, width, height, model_hash))
+        timings['output_ms'] += (time.perf_counter() - output_start) * 1000
+        image_count += 1
+    elapsed = time.perf_counter() - start
+
+    if output_format != "render":
+        output_start = time.perf_counter()
+        output_path = get_detections_path(result_directory, output_format)
+        write_detections(records, images, class_names, output_path, output_format, model_hash)
+        timings['output_ms'] += (time.perf_counter() - output_start) * 1000
+        print(f"{len(records)} detections saved to {output_path}")
+
+    # Whatever the stages do not account for is time spent waiting on image decoding
+    timings['total_ms'] = elapsed * 1000
+    timings['decode_wait_ms'] = max(0, timings['total_ms'] - timings['slice_ms'] - timings['infer_ms'] - timings['merge_ms'] - timings['output_ms'])
+    with open(os.path.join(result_directory, "timings.json"), "w") as f:
+        json.dump({"images": image_count, **timings}, f, indent=4)
+
+    print(f"Inferred on {image_count} images ({timings['tiles']} tiles) in {elapsed:.2f}s ({image_count / max(elapsed, 1e-9):.2f} images/sec)")
+    for stage in ['decode_wait_ms', 'slice_ms', 'infer_ms', 'merge_ms', 'output_ms']:
+        print(f"{stage[:-3]} : {timings[stage] / 1000:.2f}s ({timings[stage] / max(timings['total_ms'], 1e-9) * 100:.1f}%)")
+
+def decode_video(capture, frame_queue, stride):
+    frame_index = 0
+    while True:
+        if frame_index % stride == 0:
+            success, frame = capture.read()
+            if not success:
+                break
+            frame_queue.put((frame_index, frame))
+        elif not capture.grab():
+            break
+        frame_index += 1
+    capture.release()
+    frame_queue.put(None)
+
+def encode_video(writer, encode_queue):
+    while True:
+        frame = encode_queue.get()
+        if frame is None:
+            break
+        writer.write(frame)
+    writer.release()
+
+def iter_frame_batches(frame_queue, batch_size):
+    batch = []
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def infer_video(model, video_path, result_directory, conf, batch_size=16, imgsz=640, stride=1, video_output="render", queue_size=64, class_thresholds=None):
+    # Decoding, inference and encoding run in separate threads joined by bounded queues
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        print(f"Could not open {video_path}, skipping it")
+        return
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    decoder = threading.Thread(target=decode_video, args=(capture, frame_queue, stride), daemon=True)
+    decoder.start()
+
+    if video_output == "render":
+        output_path = os.path.join(result_directory, video_name + ".mp4")
+        writer = cv2.VideoWriter(get_partial_path(output_path), cv2.VideoWriter_fourcc(*"mp4v"), fps / stride, frame_size)
+        encode_queue = queue.Queue(maxsize=queue_size)
+        encoder = threading.Thread(target=encode_video, args=(writer, encode_queue), daemon=True)
+        encoder.start()
+    else:
+        output_path = os.path.join(result_directory, video_name + ".jsonl")
+        detections_file = open(get_partial_path(output_path), "w")
+
+    frame_count = 0
+    start = time.perf_counter()
+    for batch in iter_frame_batches(frame_queue, batch_size):
+        results = model.predict([frame for _, frame in batch], conf=get_predict_conf(conf, class_thresholds), imgsz=imgsz, save=False, verbose=False)
+        for (frame_index, frame), result in zip(batch, results):
+            detections = filter_detections(yolo_result_to_detections(result), conf, class_thresholds)
+            if video_output == "render":
+                encode_queue.put(draw_detections(frame, detections))
+            else:
+                record = {"frame": frame_index, "time_s": frame_index / fps, "detections": detections}
+                detections_file.write(json.dumps(record) + "\n")
+        frame_count += len(batch)
+
+    if video_output == "render":
+        encode_queue.put(None)
+        encoder.join()
+    else:
+        detections_file.close()
+    os.replace(get_partial_path(output_path), output_path)
+    elapsed = time.perf_counter() - start
+
+    print(f"Inferred on {frame_count} frames of {video_path} in {elapsed:.2f}s ({frame_count / max(elapsed, 1e-9):.2f} frames/sec)")
+    print(f"Video results saved to {output_path}")
+
+def infer_images_with_server(server_url, image_paths, result_directory, conf, max_workers=8, class_thresholds=None):
+    # Concurrent requests let the server group them into micro-batches
+    def infer_image(image_path):
+        detections = predict_image(server_url, "yolov10", image_path, get_predict_conf(conf, class_thresholds))
+        detections = filter_detections(detections, conf, class_thresholds)
+        image = cv2.imread(image_path)
+        write_image(os.path.join(result_directory, os.path.basename(image_path)), draw_detections(image, detections))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(infer_image, image_paths))
+    elapsed = time.perf_counter() - start
+
+    print(f"Inferred on {len(image_paths)} images in {elapsed:.2f}s ({len(image_paths) / max(elapsed, 1e-9):.2f} images/sec)")
+
+def run_images(model_factory, image_paths, result_directory, args):
+    model_hash = get_model_hash(args.weight)
+    if not args.slice_size:
+        cache = None
+        if args.cache_dir:
+            from detection_cache import DetectionCache
+            cache = DetectionCache(args.cache_dir, args.cache_size_mb)
+        infer_images(model_factory, image_paths, result_directory, args.conf, args.batch_size, args.imgsz, args.prefetch, args.format, model_hash, cache, args.class_thresholds)
+        if cache is not None:
+            cache.close()
+        return
+
+    from slicing import create_tile_predictor
+    tile_model_factory = model_factory if args.slice_workers <= 1 else (lambda: load_model(args.weight, args.backend, args.intra_op_threads))
+    tile_predict = create_tile_predictor(tile_model_factory, get_predict_conf(args.conf, args.class_thresholds), args.imgsz, args.batch_size, args.slice_workers)
+    infer_images_sliced(tile_predict, model_factory().names, image_paths, result_directory, args.slice_size, args.slice_overlap, args.slice_merge, args.slice_iou, args.slice_full_image, args.prefetch, args.format, model_hash, args.conf, args.class_thresholds)
+
+def run_video(model, video_path, result_directory, args):
+    if args.video_mode == "track":
+        from track import infer_video_with_tracking
+        infer_video_with_tracking(model, video_path, result_directory, args.conf, args.imgsz, args.keyframe_mode, args.stride, args.motion_threshold, args.min_track_hits, args.video_output, class_thresholds=args.class_thresholds)
+    else:
+        infer_video(model, video_path, result_directory, args.conf, args.batch_size, args.imgsz, args.stride, args.video_output, class_thresholds=args.class_thresholds)
+
 def main():
     parser = argparse.ArgumentParser(description="Preprocess dataset.")
     parser.add_argument('--source', type=str, required=True, choices=['image', 'video', 'folder'], help='Do you want to infer an image, a video or an entire directory?')
@@ -17,8 +394,31 @@ def main():
     parser.add_argument('--video', type=str, required=False, help="Path to a video to infer on")
     parser.add_argument('--directory', type=str, required=False, help="Path to directory to infer on")
     parser.add_argument('--result_directory', type=str, required=True, help="Path to directory to store inference image result")
-    parser.add_argument('--weight', type=str, required=True, help="Path to model to be fine tuned or checkpoint")
+    parser.add_argument('--job_name', type=str, required=False, help="Name of this job's subdirectory inside the result directory (default: a unique timestamped name)")
+    parser.add_argument('--weight', type=str, required=True, help="Path to model to be fine tuned or checkpoint (an .onnx file from export.py for the onnx backend)")
+    parser.add_argument('--backend', type=str, required=False, default="torch", choices=['torch', 'onnx'], help="Run the PyTorch weights or an exported ONNX model with ONNX Runtime")
+    parser.add_argument('--intra_op_threads', type=int, required=False, help="Threads used inside a single op (default: the runtime's own choice)")
     parser.add_argument('--conf', type=float, required=False, default=0.35, help="Minimum confidence level of a detection to be recognized")
+    parser.add_argument('--class_thresholds', type=str, required=False, help="JSON file of per-class confidence thresholds written by sweep.py (classes not in it use --conf)")
+    parser.add_argument('--batch_size', type=int, required=False, default=16, help="Number of images run through the model at once")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="Inference image size")
+    parser.add_argument('--prefetch', type=int, required=False, default=32, help="Number of decoded images buffered ahead of the model")
+    parser.add_argument('--stride', type=int, required=False, default=1, help="Only infer on every n-th video frame")
+    parser.add_argument('--video_output', type=str, required=False, default="render", choices=['render', 'jsonl'], help="Write a rendered video or only the detections of every inferred frame as JSONL")
+    parser.add_argument('--video_mode', type=str, required=False, default="detect", choices=['detect', 'track'], help="Detect on every inferred frame, or detect on keyframes only and track objects in between")
+    parser.add_argument('--keyframe_mode', type=str, required=False, default="stride", choices=['stride', 'motion'], help="Pick keyframes every --stride frames, or when the frame difference exceeds --motion_threshold (at most --stride frames apart)")
+    parser.add_argument('--motion_threshold', type=float, required=False, default=4.0, help="Mean grayscale frame difference that triggers a keyframe in motion mode")
+    parser.add_argument('--min_track_hits', type=int, required=False, default=1, help="Keyframes an object must be detected in to be counted")
+    parser.add_argument('--format', type=str, required=False, default="render", choices=['render', 'jsonl', 'coco', 'parquet'], help="Write rendered images, or only the detections of all images as JSONL, COCO JSON or Parquet (render them later with render.py)")
+    parser.add_argument('--slice_size', type=int, required=False, default=0, help="Infer on overlapping tiles of this many pixels and merge their detections (default: 0, no slicing)")
+    parser.add_argument('--slice_overlap', type=float, required=False, default=0.2, help="Fraction of a tile shared with its neighbours")
+    parser.add_argument('--slice_merge', type=str, required=False, default="nms", choices=['nms', 'wbf'], help="Merge tile detections with class-wise NMS or weighted box fusion")
+    parser.add_argument('--slice_iou', type=float, required=False, default=0.5, help="IoU above which tile detections of the same class are merged")
+    parser.add_argument('--slice_full_image', action='store_true', help="Also infer on the whole image so large objects split across tiles are still found")
+    parser.add_argument('--slice_workers', type=int, required=False, default=1, help="Threads running tile batches, each with its own copy of the model")
+    parser.add_argument('--cache_dir', type=str, required=False, help="Directory of a detection cache reused across runs on the same images and weights")
+    parser.add_argument('--cache_size_mb', type=float, required=False, default=512, help="Size cap of the detection cache, least recently used entries are evicted first")
+    parser.add_argument('--server_url', type=str, required=False, help="Send images to a running inference_server.py instead of loading the model here")
     args = parser.parse_args()
 
     if args.source == 'image':
@@ -49,42 +449,66 @@ def main():
             print(f"Directory ({args.directory}) not found")
             sys.exit(1)
 
-    if not os.path.exists(args.result_directory):
-        os.makedirs(args.result_directory)
+    if args.format == "parquet" and any(importlib.util.find_spec(name) is None for name in ("pandas", "pyarrow")):
+        print("The parquet format needs pandas and pyarrow, install them with pip install pandas pyarrow")
+        sys.exit(1)
+    if args.server_url and args.format != "render":
+        print(f"The {args.format} format is not supported with the server_url flag, use render instead")
+        sys.exit(1)
 
-    if (args.source == "image") or (args.source == "video"):
-        infer_command = [
-            "yolo", "task=detect", "mode=predict", f"conf={args.conf}", "save=True", f"model={args.weight}", f"source={args.image}"
-        ]
-        subprocess.run(infer_command , check=True)
+    if args.slice_size and args.server_url:
+        print("The slice_size flag is not supported with the server_url flag")
+        sys.exit(1)
+    if args.cache_dir and (args.slice_size or args.server_url):
+        print("The cache_dir flag is not supported with the slice_size or server_url flags")
+        sys.exit(1)
+    if args.slice_size and not 0 <= args.slice_overlap < 1:
+        print(f"Slice overlap must be in [0, 1), but found {args.slice_overlap} instead")
+        sys.exit(1)
 
-        orig_result_dir = "runs/detect/predict"
-        orig_result_path = os.path.join(orig_result_dir, os.listdir(orig_result_dir)[0])
-        dest_result_path = os.path.join(args.result_directory,os.listdir(orig_result_dir)[0])
-        shutil.copy(orig_result_path,dest_result_path)
+    if args.class_thresholds:
+        if not os.path.exists(args.class_thresholds):
+            print(f"Class thresholds ({args.class_thresholds}) not found")
+            sys.exit(1)
+        args.class_thresholds = load_class_thresholds(args.class_thresholds)
+
+    if args.backend == "onnx" and not args.weight.endswith(".onnx"):
+        print(f"The onnx backend needs an .onnx model, but found {args.weight} instead")
+        sys.exit(1)
+
+    if args.stride < 1:
+        print(f"Stride must be at least 1, but found {args.stride} instead")
+        sys.exit(1)
+
+    try:
+        result_directory = create_job_directory(args.result_directory, args.job_name)
+    except FileExistsError:
+        print(f"Job directory ({os.path.join(args.result_directory, args.job_name)}) already exists")
+        sys.exit(1)
 
-        shutil.rmtree(orig_result_dir)
+    # The model is only loaded once something actually needs it, e.g. not when every image is a cache hit
+    model_factory = functools.lru_cache(maxsize=None)(lambda: load_model(args.weight, args.backend, args.intra_op_threads))
+    if args.source == "image":
+        if args.server_url:
+            infer_images_with_server(args.server_url, [args.image], result_directory, args.conf, class_thresholds=args.class_thresholds)
+        else:
+            run_images(model_factory, [args.image], result_directory, args)
+    elif args.source == "video":
+        run_video(model_factory(), args.video, result_directory, args)
     else:
-        for file_name in os.listdir(args.directory):
-            file_path = os.path.join(args.directory, file_name)
-            if (not is_image(file_path)) and (not is_video(file_path)):
-                continue
-
-            infer_command = [
-                "yolo", "task=detect", "mode=predict", f"conf={args.conf}", "save=True", f"model={args.weight}", f"source={file_path}"
-            ]
-            subprocess.run(infer_command , check=True)
-
-            orig_result_dir = "runs/detect/predict"
-
-            if (not os.path.exists(orig_result_dir)) or (len(os.listdir(orig_result_dir)) == 0):
-                print(f"No results found in the prediction directory for {file_path}.")
-                continue
-
-            orig_result_path = os.path.join(orig_result_dir, os.listdir(orig_result_dir)[0])
-            dest_result_path = os.path.join(args.result_directory, os.listdir(orig_result_dir)[0])
-            shutil.copy(orig_result_path, dest_result_path)
-            shutil.rmtree(orig_result_dir)
+        file_paths = [os.path.join(args.directory, file_name) for file_name in sorted(os.listdir(args.directory))]
+        image_paths = [file_path for file_path in file_paths if is_image(file_path)]
+        video_paths = [file_path for file_path in file_paths if is_video(file_path)]
+
+        if args.server_url:
+            infer_images_with_server(args.server_url, image_paths, result_directory, args.conf, class_thresholds=args.class_thresholds)
+        else:
+            run_images(model_factory, image_paths, result_directory, args)
+
+        for file_path in video_paths:
+            run_video(model_factory(), file_path, result_directory, args)
+
+    print(f"Results saved to {result_directory}")
 
 if __name__ == "__main__":
     main()
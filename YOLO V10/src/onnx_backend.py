@@ -0,0 +1,66 @@
+import ast
+import cv2
+import numpy as np
+import onnxruntime as ort
+import torch
+from ultralytics.engine.results import Results
+
+def letterbox(image, size, color=(114, 114, 114)):
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color), ratio, (left, top)
+
+def preprocess(images, size):
+    # Same letterbox, BGR to RGB and 0-1 scaling as the ultralytics predictor
+    batch, transforms = [], []
+    for image in images:
+        padded, ratio, padding = letterbox(image, size)
+        batch.append(padded[:, :, ::-1].transpose(2, 0, 1))
+        transforms.append((ratio, padding))
+    return np.ascontiguousarray(np.stack(batch), dtype=np.float32) / 255, transforms
+
+def create_session(model_path, intra_op_threads=None):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+class OnnxModel:
+    # Runs an exported YOLOv10 model with ONNX Runtime behind the same predict() and names as the ultralytics model
+    def __init__(self, model_path, intra_op_threads=None):
+        self.session = create_session(model_path, intra_op_threads)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.fixed_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names'])
+
+    def run(self, images, size):
+        inputs, transforms = preprocess(images, size)
+        if self.fixed_batch_size:
+            outputs = [self.session.run(None, {self.input_name: inputs[i:i + self.fixed_batch_size]})[0] for i in range(0, len(inputs), self.fixed_batch_size)]
+            return np.concatenate(outputs), transforms
+        return self.session.run(None, {self.input_name: inputs})[0], transforms
+
+    def predict(self, source, conf=0.25, imgsz=640, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        outputs, transforms = self.run(images, self.fixed_size or imgsz)
+
+        results = []
+        # YOLOv10 exports end in its NMS-free head: (batch, max_det, 6) rows of xyxy, score and class in input pixels
+        for image, output, (ratio, (left, top)) in zip(images, outputs, transforms):
+            output = output[output[:, 4] >= conf]
+            boxes = (output[:, :4] - np.array([left, top, left, top])) / ratio
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image.shape[1])
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image.shape[0])
+            data = np.concatenate([boxes, output[:, 4:6]], axis=1).astype(np.float32)
+            results.append(Results(image, path="", names=self.names, boxes=torch.from_numpy(data)))
+        return results
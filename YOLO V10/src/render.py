@@ -0,0 +1,70 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import cv2
+from inference import write_image
+from detection_utils import draw_detections
+
+def load_detections(detections_path):
+    # Returns image path -> detections for the jsonl, coco and parquet outputs of inference.py
+    images = collections.OrderedDict()
+    if detections_path.endswith(".parquet"):
+        import pandas as pd
+        for record in pd.read_parquet(detections_path).to_dict("records"):
+            record['box'] = [record['xmin'], record['ymin'], record['xmax'], record['ymax']]
+            images.setdefault(record['image'], []).append(record)
+    elif detections_path.endswith(".jsonl"):
+        with open(detections_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    images.setdefault(record['image'], []).append(record)
+    else:
+        with open(detections_path, "r") as f:
+            coco = json.load(f)
+        file_names = {image['id']: image['file_name'] for image in coco['images']}
+        class_names = {category['id']: category['name'] for category in coco['categories']}
+        for file_name in file_names.values():
+            images[file_name] = []
+        for annotation in coco['annotations']:
+            x, y, w, h = annotation['bbox']
+            images[file_names[annotation['image_id']]].append({
+                "class_id": annotation['category_id'],
+                "class_name": class_names.get(annotation['category_id'], str(annotation['category_id'])),
+                "score": annotation['score'],
+                "box": [x, y, x + w, y + h],
+            })
+    return images
+
+def render_detections(images, result_directory, conf):
+    rendered_count = 0
+    for image_path, detections in images.items():
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Could not read {image_path}, skipping it")
+            continue
+        detections = [detection for detection in detections if detection['score'] >= conf]
+        write_image(os.path.join(result_directory, os.path.basename(image_path)), draw_detections(image, detections))
+        rendered_count += 1
+    return rendered_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw detections saved by inference.py onto their images.")
+    parser.add_argument('--detections', type=str, required=True, help="Path to a detections .jsonl, .coco.json or .parquet file written by inference.py")
+    parser.add_argument('--result_directory', type=str, required=True, help="Path to directory to store the rendered images")
+    parser.add_argument('--conf', type=float, required=False, default=0.0, help="Only draw detections with at least this confidence")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.detections):
+        print(f"Detections file ({args.detections}) not found")
+        sys.exit(1)
+
+    os.makedirs(args.result_directory, exist_ok=True)
+    images = load_detections(args.detections)
+    rendered_count = render_detections(images, args.result_directory, args.conf)
+    print(f"Rendered {rendered_count} images into {args.result_directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+def get_slice_starts(length, slice_size, step):
+    if length <= slice_size:
+        return [0]
+    starts = list(range(0, length - slice_size, step))
+    starts.append(length - slice_size)
+    return starts
+
+def get_slice_boxes(width, height, slice_size, overlap):
+    # The last tile of each row and column is flush with the image border so no pixel is left out
+    step = max(1, int(slice_size * (1 - overlap)))
+    return [
+        (x, y, min(x + slice_size, width), min(y + slice_size, height))
+        for y in get_slice_starts(height, slice_size, step)
+        for x in get_slice_starts(width, slice_size, step)
+    ]
+
+def box_iou(box, boxes):
+    xmin = np.maximum(box[0], boxes[:, 0])
+    ymin = np.maximum(box[1], boxes[:, 1])
+    xmax = np.minimum(box[2], boxes[:, 2])
+    ymax = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+def nms(boxes, scores, classes, iou_threshold):
+    if len(boxes) == 0:
+        return boxes, scores, classes
+    # Shifting every class by more than the image size keeps boxes of different classes from ever overlapping
+    shifted = boxes + (classes * (boxes.max() + 1))[:, None]
+    order = np.argsort(-scores)
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        order = order[1:][box_iou(shifted[best], shifted[order[1:]]) <= iou_threshold]
+    return boxes[keep], scores[keep], classes[keep]
+
+def weighted_box_fusion(boxes, scores, classes, iou_threshold):
+    if len(boxes) == 0:
+        return boxes, scores, classes
+    fused_boxes = np.zeros((0, 4))
+    fused_classes = np.zeros(0, dtype=classes.dtype)
+    clusters = []
+    for i in np.argsort(-scores):
+        ious = box_iou(boxes[i], fused_boxes) if clusters else np.zeros(0)
+        ious[fused_classes != classes[i]] = 0
+        if ious.size > 0 and ious.max() > iou_threshold:
+            match = int(np.argmax(ious))
+            clusters[match].append(i)
+            weights = scores[clusters[match]]
+            fused_boxes[match] = (boxes[clusters[match]] * weights[:, None]).sum(axis=0) / weights.sum()
+        else:
+            clusters.append([i])
+            fused_boxes = np.vstack([fused_boxes, boxes[i]])
+            fused_classes = np.append(fused_classes, classes[i])
+    fused_scores = np.array([scores[cluster].mean() for cluster in clusters])
+    return fused_boxes, fused_scores, fused_classes
+
+def predict_tiles(model, tiles, conf, imgsz, batch_size):
+    boxes, scores, classes = [np.zeros((0, 4))], [np.zeros(0)], [np.zeros(0, dtype=int)]
+    for start in range(0, len(tiles), batch_size):
+        batch = tiles[start:start + batch_size]
+        results = model.predict([tile for _, tile in batch], conf=conf, imgsz=imgsz, save=False, verbose=False)
+        for (offset, _), result in zip(batch, results):
+            x, y = offset
+            boxes.append(result.boxes.xyxy.cpu().numpy() + np.array([x, y, x, y]))
+            scores.append(result.boxes.conf.cpu().numpy())
+            classes.append(result.boxes.cls.cpu().numpy().astype(int))
+    return np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes)
+
+def create_tile_predictor(model_factory, conf, imgsz, batch_size, num_workers=1):
+    if num_workers <= 1:
+        model = model_factory()
+        return lambda tiles: predict_tiles(model, tiles, conf, imgsz, batch_size)
+
+    # Predictors are not thread safe, so every worker thread loads its own copy of the model
+    local = threading.local()
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    def predict_chunk(chunk):
+        if not hasattr(local, "model"):
+            local.model = model_factory()
+        return predict_tiles(local.model, chunk, conf, imgsz, batch_size)
+
+    def predict(tiles):
+        chunks = [tiles[start:start + batch_size] for start in range(0, len(tiles), batch_size)]
+        outputs = list(executor.map(predict_chunk, chunks))
+        return tuple(np.concatenate([output[i] for output in outputs]) for i in range(3))
+    return predict
+
+def infer_sliced(image, tile_predict, slice_size, overlap, merge="nms", iou_threshold=0.5, full_image=False):
+    timings = {}
+    start = time.perf_counter()
+    height, width = image.shape[:2]
+    tiles = [((xmin, ymin), image[ymin:ymax, xmin:xmax]) for xmin, ymin, xmax, ymax in get_slice_boxes(width, height, slice_size, overlap)]
+    if full_image and len(tiles) > 1:
+        tiles.append(((0, 0), image))
+    timings['slice_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    boxes, scores, classes = tile_predict(tiles)
+    timings['infer_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    merge_fn = weighted_box_fusion if merge == "wbf" else nms
+    boxes, scores, classes = merge_fn(boxes, scores, classes, iou_threshold)
+    timings['merge_ms'] = (time.perf_counter() - start) * 1000
+    timings['tiles'] = len(tiles)
+    return boxes, scores, classes, timings
@@ -7,6 +7,10 @@ import sys
 import json
 import yaml
 
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+import balance
+
 def move_image_and_labels(directory, image_list, split_type, split_directory):
     for img_name in image_list:
         orig_img_path = os.path.join(directory, "images", img_name)
@@ -30,6 +34,7 @@ def get_category_list(split_directory):
 
     categories = data['categories']
     category_set = set()
+    category_names = {}
 
     for cat in categories:
         cat['supercategory'] = cat['supercategory'].replace('&', 'and')
@@ -42,7 +47,8 @@ def get_category_list(split_directory):
             cat['supercategory'] = 'Paper'
         
         category_set.add(cat['supercategory'])
-    return list(category_set)
+        category_names[str(cat['id'])] = cat['supercategory']
+    return list(category_set), category_names
 
 def create_yaml_file(split_directory, new_labels):
     yaml_content = {
@@ -138,8 +144,9 @@ def main():
     dest_json_path = os.path.join(args.split_directory, "annotations.json")
     shutil.copy(orig_json_path, dest_json_path)
 
-    new_labels = get_category_list(args.split_directory)
-    create_yaml_file(args.split_directory)
+    new_labels, category_names = get_category_list(args.split_directory)
+    create_yaml_file(args.split_directory, new_labels)
+    balance.create_class_index(args.split_directory, ["train", "valid", "test"], category_names)
 
 if __name__ == "__main__":
     main()
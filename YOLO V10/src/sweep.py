@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import yaml
+from inference import get_model_hash, is_image, iter_image_batches, load_model
+from evaluate import average_precision, match_image
+
+def load_class_names(split_directory):
+    yaml_path = os.path.join(split_directory, "data.yaml")
+    if not os.path.exists(yaml_path):
+        print(f"YAML path not found ({yaml_path})")
+        sys.exit(1)
+    with open(yaml_path, "r") as f:
+        names = yaml.safe_load(f)['names']
+    if isinstance(names, dict):
+        return [names[class_id] for class_id in sorted(names)]
+    return names
+
+def load_ground_truth(label_path, width, height):
+    classes, boxes = [], []
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            for line in f:
+                values = line.strip().split()
+                if len(values) != 5:
+                    continue
+                class_id, x_center, y_center, box_width, box_height = int(values[0]), *map(float, values[1:])
+                classes.append(class_id)
+                boxes.append([(x_center - box_width / 2) * width, (y_center - box_height / 2) * height, (x_center + box_width / 2) * width, (y_center + box_height / 2) * height])
+    return np.array(classes, dtype=int), np.array(boxes, dtype=float).reshape(-1, 4)
+
+def collect_raw_detections(model, image_paths, min_conf, batch_size, imgsz, prefetch_size):
+    image_ids = {image_path: index for index, image_path in enumerate(image_paths)}
+    image_sizes = {}
+    image_indices, classes, scores, boxes = [], [], [], []
+    for batch in iter_image_batches(image_paths, batch_size, prefetch_size):
+        results = model.predict([image for _, image in batch], conf=min_conf, imgsz=imgsz, save=False, verbose=False)
+        for (image_path, _), result in zip(batch, results):
+            height, width = result.orig_shape
+            image_sizes[image_path] = (width, height)
+            count = len(result.boxes)
+            image_indices.append(np.full(count, image_ids[image_path]))
+            classes.append(result.boxes.cls.cpu().numpy().astype(int))
+            scores.append(result.boxes.conf.cpu().numpy())
+            boxes.append(result.boxes.xyxy.cpu().numpy())
+
+    return {
+        "image_paths": np.array(image_paths),
+        "widths": np.array([image_sizes.get(image_path, (0, 0))[0] for image_path in image_paths]),
+        "heights": np.array([image_sizes.get(image_path, (0, 0))[1] for image_path in image_paths]),
+        "image_indices": np.concatenate(image_indices) if image_indices else np.zeros(0, dtype=int),
+        "classes": np.concatenate(classes) if classes else np.zeros(0, dtype=int),
+        "scores": np.concatenate(scores) if scores else np.zeros(0),
+        "boxes": np.concatenate(boxes).reshape(-1, 4) if boxes else np.zeros((0, 4)),
+    }
+
+def match_detections(det_boxes, det_scores, gt_boxes, iou_threshold):
+    # Greedy matching in score order never depends on lower scored detections, so the
+    # true positive flags found at the lowest threshold hold for every higher threshold too
+    order = np.argsort(-det_scores, kind="stable")
+    true_positives = np.zeros(len(det_scores), dtype=bool)
+    true_positives[order] = match_image(det_boxes[order], gt_boxes, np.array([iou_threshold]))[0]
+    return true_positives
+
+def match_raw_detections(raw, labels_directory, num_classes, iou_threshold):
+    true_positives = np.zeros(len(raw['scores']), dtype=bool)
+    gt_counts = np.zeros(num_classes, dtype=int)
+    for image_index, image_path in enumerate(raw['image_paths']):
+        label_path = os.path.join(labels_directory, os.path.splitext(os.path.basename(str(image_path)))[0] + ".txt")
+        gt_classes, gt_boxes = load_ground_truth(label_path, raw['widths'][image_index], raw['heights'][image_index])
+        gt_counts += np.bincount(gt_classes, minlength=num_classes)[:num_classes]
+        in_image = raw['image_indices'] == image_index
+        for class_id in np.unique(np.concatenate([gt_classes, raw['classes'][in_image]])):
+            det_indices = np.where(in_image & (raw['classes'] == class_id))[0]
+            true_positives[det_indices] = match_detections(raw['boxes'][det_indices], raw['scores'][det_indices], gt_boxes[gt_classes == class_id], iou_threshold)
+    return true_positives, gt_counts
+
+def sweep_thresholds(scores, true_positives, gt_count, thresholds):
+    order = np.argsort(-scores, kind="stable")
+    scores = scores[order]
+    cumulative_tp = np.cumsum(true_positives[order])
+    # Number of detections kept at each threshold, found for all thresholds at once
+    kept = np.searchsorted(-scores, -thresholds, side="right")
+    tp = np.where(kept > 0, cumulative_tp[np.maximum(kept - 1, 0)], 0)
+    precision = np.where(kept > 0, tp / np.maximum(kept, 1), 0.0)
+    recall = tp / gt_count if gt_count else np.zeros(len(thresholds))
+    f1 = np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-9), 0.0)
+
+    curve_precision = cumulative_tp / np.arange(1, len(scores) + 1)
+    curve_recall = cumulative_tp / gt_count if gt_count else np.zeros(len(scores))
+    ap = np.array([average_precision(curve_precision[:n], curve_recall[:n]) for n in kept])
+    return precision, recall, f1, ap
+
+def get_best_index(f1):
+    # Among equal F1 scores the highest threshold wins, since it keeps fewer detections
+    return len(f1) - 1 - int(np.argmax(f1[::-1]))
+
+def run_sweep(raw, true_positives, gt_counts, class_names, thresholds, default_conf):
+    report = {"classes": {}, "thresholds": {}}
+    for class_id, class_name in enumerate(class_names):
+        in_class = raw['classes'] == class_id
+        precision, recall, f1, ap = sweep_thresholds(raw['scores'][in_class], true_positives[in_class], gt_counts[class_id], thresholds)
+        best = get_best_index(f1)
+        report['classes'][class_name] = {
+            "ground_truth": int(gt_counts[class_id]),
+            "ap50": float(ap[0]),
+            "best": {"threshold": float(thresholds[best]), "precision": float(precision[best]), "recall": float(recall[best]), "f1": float(f1[best])},
+            "sweep": [{"threshold": float(t), "precision": float(p), "recall": float(r), "f1": float(f), "ap50": float(a)} for t, p, r, f, a in zip(thresholds, precision, recall, f1, ap)],
+        }
+        # Classes missing from the split keep the default threshold instead of an arbitrary one
+        report['thresholds'][class_name] = float(thresholds[best]) if gt_counts[class_id] else default_conf
+
+    precision, recall, f1, ap = sweep_thresholds(raw['scores'], true_positives, int(gt_counts.sum()), thresholds)
+    best = get_best_index(f1)
+    report['all'] = {"threshold": float(thresholds[best]), "precision": float(precision[best]), "recall": float(recall[best]), "f1": float(f1[best])}
+    present = [class_report['ap50'] for class_report in report['classes'].values() if class_report['ground_truth']]
+    report['map50'] = float(np.mean(present)) if present else 0.0
+    return report
+
+def print_report(report):
+    print("| Class | GT | AP50 | Threshold | Precision | Recall | F1 |")
+    print("|---|---|---|---|---|---|---|")
+    for class_name, class_report in report['classes'].items():
+        best = class_report['best']
+        print(f"| {class_name} | {class_report['ground_truth']} | {class_report['ap50']:.3f} | {report['thresholds'][class_name]:.3f} | {best['precision']:.3f} | {best['recall']:.3f} | {best['f1']:.3f} |")
+    best = report['all']
+    print(f"| all | | {report['map50']:.3f} | {best['threshold']:.3f} | {best['precision']:.3f} | {best['recall']:.3f} | {best['f1']:.3f} |")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep confidence thresholds from a single low threshold inference pass.")
+    parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory name (without 'datasets' parent folder)")
+    parser.add_argument('--split', type=str, required=False, default="valid", help="Split to evaluate on (e.g. valid or test)")
+    parser.add_argument('--weight', type=str, required=True, help="Path to the model to evaluate")
+    parser.add_argument('--output_directory', type=str, required=True, help="Directory to store the raw detections, sweep report and class thresholds")
+    parser.add_argument('--raw_detections', type=str, required=False, help="Reuse raw detections saved by an earlier sweep instead of running the model")
+    parser.add_argument('--min_conf', type=float, required=False, default=0.001, help="Confidence threshold of the single inference pass")
+    parser.add_argument('--iou', type=float, required=False, default=0.5, help="IoU a detection needs with a ground truth box to count as a true positive")
+    parser.add_argument('--threshold_step', type=float, required=False, default=0.01, help="Step between swept confidence thresholds")
+    parser.add_argument('--default_conf', type=float, required=False, default=0.35, help="Threshold recommended for classes without ground truth boxes in the split")
+    parser.add_argument('--batch_size', type=int, required=False, default=16, help="Number of images run through the model at once")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="Inference image size")
+    args = parser.parse_args()
+
+    split_directory = os.path.join("datasets", args.directory)
+    image_directory = os.path.join(split_directory, args.split, "images")
+    labels_directory = os.path.join(split_directory, args.split, "labels")
+    if not os.path.exists(image_directory):
+        print(f"Image directory ({image_directory}) not found")
+        sys.exit(1)
+    if not os.path.exists(args.weight):
+        print(f"Weight ({args.weight}) not found")
+        sys.exit(1)
+    if args.raw_detections and not os.path.exists(args.raw_detections):
+        print(f"Raw detections ({args.raw_detections}) not found")
+        sys.exit(1)
+
+    class_names = load_class_names(split_directory)
+    model_hash = get_model_hash(args.weight)
+    os.makedirs(args.output_directory, exist_ok=True)
+
+    if args.raw_detections:
+        raw = dict(np.load(args.raw_detections))
+        if str(raw['model_hash']) != model_hash:
+            print(f"Raw detections ({args.raw_detections}) were made with different weights than {args.weight}")
+            sys.exit(1)
+    else:
+        image_paths = [os.path.join(image_directory, file_name) for file_name in sorted(os.listdir(image_directory)) if is_image(file_name)]
+        start = time.perf_counter()
+        raw = collect_raw_detections(load_model(args.weight), image_paths, args.min_conf, args.batch_size, args.imgsz, args.batch_size * 2)
+        print(f"Inferred on {len(image_paths)} images at conf {args.min_conf} in {time.perf_counter() - start:.2f}s")
+        raw_path = os.path.join(args.output_directory, "raw_detections.npz")
+        np.savez_compressed(raw_path, model_hash=model_hash, min_conf=args.min_conf, **raw)
+        print(f"Raw detections saved to {raw_path}")
+
+    min_conf = float(raw.get('min_conf', args.min_conf))
+    # The first threshold is the one inferred at, so its AP50 covers every raw detection
+    thresholds = np.unique(np.round(np.concatenate([[min_conf], np.arange(args.threshold_step, 1, args.threshold_step)]), 4))
+    thresholds = thresholds[thresholds >= min_conf]
+    start = time.perf_counter()
+    true_positives, gt_counts = match_raw_detections(raw, labels_directory, len(class_names), args.iou)
+    report = run_sweep(raw, true_positives, gt_counts, class_names, thresholds, args.default_conf)
+    print(f"Swept {len(thresholds)} thresholds over {len(raw['scores'])} detections in {time.perf_counter() - start:.2f}s")
+    print_report(report)
+
+    report_path = os.path.join(args.output_directory, "sweep.json")
+    with open(report_path, "w") as f:
+        json.dump({"weight": args.weight, "model_hash": model_hash, "iou": args.iou, **report}, f, indent=4)
+    thresholds_path = os.path.join(args.output_directory, "class_thresholds.json")
+    with open(thresholds_path, "w") as f:
+        json.dump({"model_hash": model_hash, "metric": "f1", "iou": args.iou, "thresholds": report['thresholds']}, f, indent=4)
+    print(f"Sweep report saved to {report_path}")
+    print(f"Class thresholds saved to {thresholds_path}, use them with inference.py --class_thresholds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+import supervision as sv
+from inference import decode_video, encode_video, get_partial_path, get_predict_conf, get_threshold
+
+def to_motion_frame(frame):
+    return cv2.GaussianBlur(cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (160, 90)), (5, 5), 0)
+
+def get_motion_score(previous_motion_frame, motion_frame):
+    return float(np.mean(cv2.absdiff(previous_motion_frame, motion_frame)))
+
+def is_keyframe(frame_index, last_keyframe_index, motion_score, keyframe_mode, stride, motion_threshold):
+    if last_keyframe_index is None:
+        return True
+    frame_gap = frame_index - last_keyframe_index
+    if keyframe_mode == "stride":
+        return frame_gap >= stride
+    # In motion mode the stride is the longest gap allowed between two keyframes
+    return motion_score >= motion_threshold or frame_gap >= stride
+
+def update_tracks(tracks, tracked_detections, frame_index):
+    active_tracks = {}
+    if tracked_detections.tracker_id is None:
+        return active_tracks
+    for i, tracker_id in enumerate(tracked_detections.tracker_id):
+        tracker_id = int(tracker_id)
+        box = tracked_detections.xyxy[i].astype(float)
+        class_id = int(tracked_detections.class_id[i])
+        track = tracks.get(tracker_id)
+        if track is None:
+            track = {"velocity": np.zeros(4), "class_votes": collections.Counter(), "hits": 0}
+        else:
+            frame_gap = max(frame_index - track['frame'], 1)
+            track['velocity'] = (box - track['box']) / frame_gap
+        track['box'] = box
+        track['frame'] = frame_index
+        track['score'] = float(tracked_detections.confidence[i])
+        track['class_votes'][class_id] += 1
+        track['hits'] += 1
+        tracks[tracker_id] = track
+        active_tracks[tracker_id] = track
+    return active_tracks
+
+def get_track_objects(active_tracks, class_names, frame_index):
+    # Between keyframes each box moves with the velocity measured over the last two keyframes
+    objects = []
+    for tracker_id, track in active_tracks.items():
+        frame_gap = frame_index - track['frame']
+        class_id = track['class_votes'].most_common(1)[0][0]
+        objects.append({
+            "tracker_id": tracker_id,
+            "class_id": class_id,
+            "class_name": class_names[class_id],
+            "score": track['score'],
+            "box": [float(value) for value in track['box'] + track['velocity'] * frame_gap],
+            "propagated": frame_gap > 0,
+        })
+    return objects
+
+def draw_track_objects(frame, objects):
+    for obj in objects:
+        xmin, ymin, xmax, ymax = [int(round(value)) for value in obj['box']]
+        color = (0, 255, 0) if not obj['propagated'] else (0, 200, 255)
+        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 2)
+        cv2.putText(frame, f"#{obj['tracker_id']} {obj['class_name']}", (xmin, max(ymin - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
+
+def get_class_counts(tracks, class_names, min_track_hits):
+    counts = collections.Counter()
+    for track in tracks.values():
+        if track['hits'] >= min_track_hits:
+            counts[class_names[track['class_votes'].most_common(1)[0][0]]] += 1
+    return dict(counts)
+
+def infer_video_with_tracking(model, video_path, result_directory, conf, imgsz=640, keyframe_mode="stride", stride=5, motion_threshold=4.0, min_track_hits=1, video_output="jsonl", queue_size=64, class_thresholds=None):
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        print(f"Could not open {video_path}, skipping it")
+        return
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    threading.Thread(target=decode_video, args=(capture, frame_queue, 1), daemon=True).start()
+
+    if video_output == "render":
+        output_path = os.path.join(result_directory, video_name + ".mp4")
+        writer = cv2.VideoWriter(get_partial_path(output_path), cv2.VideoWriter_fourcc(*"mp4v"), fps, frame_size)
+        encode_queue = queue.Queue(maxsize=queue_size)
+        encoder = threading.Thread(target=encode_video, args=(writer, encode_queue), daemon=True)
+        encoder.start()
+    else:
+        output_path = os.path.join(result_directory, video_name + ".tracks.jsonl")
+        tracks_file = open(get_partial_path(output_path), "w")
+
+    tracker = sv.ByteTrack(frame_rate=max(1, round(fps / stride)))
+    class_names = model.names
+    tracks = {}
+    active_tracks = {}
+    last_keyframe_index = None
+    last_motion_frame = None
+    frame_count = 0
+    keyframe_count = 0
+
+    start = time.perf_counter()
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        frame_index, frame = item
+
+        motion_score = 0.0
+        motion_frame = None
+        if keyframe_mode == "motion":
+            motion_frame = to_motion_frame(frame)
+            if last_motion_frame is not None:
+                motion_score = get_motion_score(last_motion_frame, motion_frame)
+
+        keyframe = is_keyframe(frame_index, last_keyframe_index, motion_score, keyframe_mode, stride, motion_threshold)
+        if keyframe:
+            result = model.predict(frame, conf=get_predict_conf(conf, class_thresholds), imgsz=imgsz, save=False, verbose=False)[0]
+            detections = sv.Detections.from_ultralytics(result)
+            if class_thresholds:
+                detections = detections[np.array([score >= get_threshold(class_names[int(class_id)], conf, class_thresholds) for class_id, score in zip(detections.class_id, detections.confidence)], dtype=bool)]
+            tracked_detections = tracker.update_with_detections(detections)
+            active_tracks = update_tracks(tracks, tracked_detections, frame_index)
+            last_keyframe_index = frame_index
+            last_motion_frame = motion_frame
+            keyframe_count += 1
+
+        objects = get_track_objects(active_tracks, class_names, frame_index)
+        if video_output == "render":
+            encode_queue.put(draw_track_objects(frame, objects))
+        else:
+            tracks_file.write(json.dumps({"frame": frame_index, "time_s": frame_index / fps, "keyframe": keyframe, "objects": objects}) + "\n")
+        frame_count += 1
+
+    if video_output == "render":
+        encode_queue.put(None)
+        encoder.join()
+    else:
+        tracks_file.close()
+    os.replace(get_partial_path(output_path), output_path)
+    elapsed = time.perf_counter() - start
+
+    counts = get_class_counts(tracks, class_names, min_track_hits)
+    summary = {
+        "video": video_path,
+        "frames": frame_count,
+        "keyframes": keyframe_count,
+        "elapsed_s": elapsed,
+        "frames_per_second": frame_count / max(elapsed, 1e-9),
+        "counts": counts,
+    }
+    summary_path = os.path.join(result_directory, video_name + ".counts.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=4)
+
+    print(f"Processed {frame_count} frames of {video_path} with {keyframe_count} keyframes in {elapsed:.2f}s ({summary['frames_per_second']:.2f} frames/sec)")
+    for class_name, count in sorted(counts.items()):
+        print(f"{class_name} : {count}")
+    print(f"Tracking results saved to {output_path} and {summary_path}")
@@ -1,20 +1,256 @@
-import subprocess
 import argparse
+import json
 import os
+import resource
+import sys
+import time
+import torch
+import yaml
+from ultralytics import YOLOv10
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(ROOT_DIR)
+import augment_bank
+import balance
+# Offline augmented images already carry mosaic, scale, translation, flips and color jitter
+NO_AUGMENTATION = {"mosaic": 0.0, "close_mosaic": 0, "fliplr": 0.0, "scale": 0.0, "translate": 0.0, "hsv_h": 0.0, "hsv_s": 0.0, "hsv_v": 0.0}
+
+class EpochLogger:
+    # ultralytics only calls on_train_batch_start once the loader has handed over the batch, so the gap since the previous step is loader wait
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.epoch_start = self.step_end = self.train_end = 0.0
+        self.data_wait = 0.0
+        self.steps = 0
+
+    def on_train_epoch_start(self, trainer):
+        self.epoch_start = self.step_end = time.perf_counter()
+        self.data_wait = 0.0
+        self.steps = 0
+
+    def on_train_batch_start(self, trainer):
+        self.data_wait += time.perf_counter() - self.step_end
+
+    def on_train_batch_end(self, trainer):
+        self.step_end = time.perf_counter()
+        self.steps += 1
+
+    def on_train_epoch_end(self, trainer):
+        self.train_end = time.perf_counter()
+
+    def on_fit_epoch_end(self, trainer):
+        train_time = self.train_end - self.epoch_start
+        images = len(trainer.train_loader.dataset)
+        record = {
+            "epoch": trainer.epoch + 1,
+            "epochs": trainer.epochs,
+            "steps": self.steps,
+            "images": images,
+            "epoch_time_s": time.perf_counter() - self.epoch_start,
+            "train_time_s": train_time,
+            "data_wait_s": self.data_wait,
+            "data_wait_fraction": self.data_wait / max(train_time, 1e-9),
+            "images_per_second": images / max(train_time, 1e-9),
+            "losses": trainer.label_loss_items(trainer.tloss, prefix="train") if trainer.tloss is not None else {},
+            "metrics": {name: float(value) for name, value in (trainer.metrics or {}).items()},
+            "lr": {name: float(value) for name, value in trainer.lr.items()},
+        }
+        if self.log_path is None:
+            self.log_path = os.path.join(trainer.save_dir, "epochs.jsonl")
+        # Appending keeps the epochs before a resume in the same log
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Epoch {record['epoch']}/{record['epochs']}: {record['images_per_second']:.2f} images/sec, {record['data_wait_s']:.2f}s data wait, {record['epoch_time_s']:.2f}s total")
+
+def get_memory_mb():
+    # Current RSS from /proc where available, peak RSS (kilobytes on Linux) otherwise
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+class StepProfiler(EpochLogger):
+    # The forward hooks split each step into data wait, forward (with the loss) and backward with the optimizer step
+    def __init__(self, log_path=None, profile_path=None, input_bound_threshold=0.2):
+        super().__init__(log_path)
+        self.profile_path = profile_path
+        self.input_bound_threshold = input_bound_threshold
+        self.step_start = self.step_wait = self.forward_start = self.forward_end = 0.0
+        self.step_images = 0
+        self.epoch_steps = []
+
+    def write(self, record):
+        with open(self.profile_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_train_start(self, trainer):
+        if self.profile_path is None:
+            self.profile_path = os.path.join(trainer.save_dir, "profile.jsonl")
+        trainer.model.register_forward_pre_hook(self.on_forward_start)
+        trainer.model.register_forward_hook(self.on_forward_end)
+
+    def on_forward_start(self, module, inputs):
+        if module.training:
+            synchronize()
+            self.forward_start = time.perf_counter()
+            self.step_images = len(inputs[0]['img']) if isinstance(inputs[0], dict) else len(inputs[0])
+
+    def on_forward_end(self, module, inputs, outputs):
+        if module.training:
+            synchronize()
+            self.forward_end = time.perf_counter()
+
+    def on_train_epoch_start(self, trainer):
+        super().on_train_epoch_start(trainer)
+        self.epoch_steps = []
+
+    def on_train_batch_start(self, trainer):
+        super().on_train_batch_start(trainer)
+        self.step_start = time.perf_counter()
+        self.step_wait = self.step_start - self.step_end
+
+    def on_train_batch_end(self, trainer):
+        synchronize()
+        super().on_train_batch_end(trainer)
+        step_time = self.step_end - self.step_start + self.step_wait
+        record = {
+            "type": "step",
+            "trainer": "yolov10",
+            "epoch": trainer.epoch + 1,
+            "step": self.steps,
+            "images": self.step_images,
+            "data_wait_s": self.step_wait,
+            "forward_s": self.forward_end - self.forward_start,
+            "backward_s": self.step_end - self.forward_end,
+            "compute_s": self.step_end - self.step_start,
+            "step_time_s": step_time,
+            "images_per_second": self.step_images / max(step_time, 1e-9),
+            "memory_mb": get_memory_mb(),
+        }
+        self.epoch_steps.append(record)
+        self.write(record)
+
+    def on_train_epoch_end(self, trainer):
+        super().on_train_epoch_end(trainer)
+        self.write(summarize_epoch(self.epoch_steps, trainer.epoch + 1, "yolov10", self.train_end - self.epoch_start, self.input_bound_threshold))
+
+def summarize_epoch(steps, epoch, trainer_name, epoch_time, input_bound_threshold):
+    data_wait = sum(step['data_wait_s'] for step in steps)
+    images = sum(step['images'] for step in steps)
+    record = {
+        "type": "epoch",
+        "trainer": trainer_name,
+        "epoch": epoch,
+        "steps": len(steps),
+        "images": images,
+        "epoch_time_s": epoch_time,
+        "data_wait_s": data_wait,
+        "forward_s": sum(step['forward_s'] for step in steps),
+        "backward_s": sum(step['backward_s'] for step in steps),
+        "compute_s": sum(step['compute_s'] for step in steps),
+        "data_wait_fraction": data_wait / max(epoch_time, 1e-9),
+        "images_per_second": images / max(epoch_time, 1e-9),
+        "peak_memory_mb": max([step['memory_mb'] for step in steps], default=0.0),
+    }
+    if torch.cuda.is_available():
+        record['peak_gpu_memory_mb'] = torch.cuda.max_memory_allocated() / 1024 / 1024
+    record['input_bound'] = record['data_wait_fraction'] >= input_bound_threshold
+    if record['input_bound']:
+        print(f"Epoch {epoch} is input bound: {record['data_wait_fraction']:.0%} of the time went to waiting for data, try more workers, pre-resized images or an image cache")
+    return record
+
+def add_callbacks(model, callbacks):
+    for event in ["on_train_start", "on_train_epoch_start", "on_train_batch_start", "on_train_batch_end", "on_train_epoch_end", "on_fit_epoch_end"]:
+        if hasattr(callbacks, event):
+            model.add_callback(event, getattr(callbacks, event))
+
+def write_balanced_data(data_path, threshold, seed):
+    # ultralytics keeps repeated entries of a train list file, so repeating an image there oversamples it
+    split_directory = os.path.dirname(data_path)
+    img_names = balance.get_balanced_image_list(split_directory, "train", threshold, seed)
+    # Threshold and seed are part of the names so parallel sweep trials on one dataset keep their own lists
+    suffix = f"{threshold}_{seed}"
+    list_path = os.path.join(split_directory, f"train_balanced_{suffix}.txt")
+    with open(list_path, "w") as f:
+        f.write("".join(os.path.abspath(os.path.join(split_directory, "train", "images", img_name)) + "\n" for img_name in img_names))
+
+    with open(data_path, "r") as f:
+        data = yaml.safe_load(f)
+    data['train'] = list_path
+    balanced_data_path = os.path.join(split_directory, f"data_balanced_{suffix}.yaml")
+    with open(balanced_data_path, "w") as f:
+        yaml.safe_dump(data, f)
+    return balanced_data_path
+
+def train(weight, data_path, epochs, batch_size, imgsz=640, cache="none", workers=8, rect=False, seed=0, deterministic=True, resume=False, log_path=None, profile=False, profile_path=None, input_bound_threshold=0.2, project=None, name=None, augment=True, trainer=None):
+    model = YOLOv10(weight)
+    logger = StepProfiler(log_path, profile_path, input_bound_threshold) if profile else EpochLogger(log_path)
+    add_callbacks(model, logger)
+    if resume:
+        # Every other setting comes from the args saved in the checkpoint
+        model.train(resume=True, trainer=trainer)
+    else:
+        model.train(
+            trainer=trainer, data=data_path, epochs=epochs, batch=batch_size, imgsz=imgsz, cache=False if cache == "none" else cache,
+            workers=workers, rect=rect, seed=seed, deterministic=deterministic, plots=True, project=project, name=name,
+            **({} if augment else NO_AUGMENTATION),
+        )
+    print(f"Epoch log saved to {logger.log_path}")
+    if profile:
+        print(f"Profile trace saved to {logger.profile_path}")
+    return model
 
 def main():
-    parser = argparse.ArgumentParser(description="Preprocess dataset.")
+    parser = argparse.ArgumentParser(description="Train YOLOv10 on a splitted dataset.")
     parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory name (without 'datasets' parent folder)")
     parser.add_argument('--epochs', type=int, required=True, help="Number of epochs to be trained")
     parser.add_argument('--weight', type=str, required=True, help="Path to model to be fine tuned or checkpoint")
     parser.add_argument('--batch_size', type=int, required=False, default=8, help="Batch size for training")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="Training image size")
+    parser.add_argument('--cache', type=str, choices=["none", "ram", "disk"], required=False, default="none", help="Keep decoded images in RAM or as .npy files on disk between epochs")
+    parser.add_argument('--workers', type=int, required=False, default=8, help="Number of data loader worker processes")
+    parser.add_argument('--rect', action='store_true', help="Batch images of similar aspect ratio with minimal padding")
+    parser.add_argument('--seed', type=int, required=False, default=0, help="Random seed for weights, shuffling and augmentation")
+    parser.add_argument('--no_deterministic', action='store_true', help="Allow non-deterministic torch algorithms, faster but not reproducible")
+    parser.add_argument('--resume', action='store_true', help="Resume an interrupted training from the checkpoint given as weight (e.g. runs/detect/train/weights/last.pt)")
+    parser.add_argument('--log_path', type=str, required=False, help="JSONL file for per-epoch metrics (default: epochs.jsonl in the run directory)")
+    parser.add_argument('--project', type=str, required=False, help="Directory the run directory is created in (default: runs/detect)")
+    parser.add_argument('--name', type=str, required=False, help="Run directory name (default: train, train2, ...)")
+    parser.add_argument('--augment_bank', type=str, required=False, help="Train on an augment_bank.py output instead of the train split, with online augmentation turned off (every variant is seen each epoch, so fewer epochs are needed)")
+    parser.add_argument('--balance_threshold', type=float, required=False, help="Repeat images of classes found in fewer than this fraction of train images (e.g. 0.01), using class_index.json of the split")
+    parser.add_argument('--profile', action='store_true', help="Trace data wait, forward, backward, images/sec and memory of every step")
+    parser.add_argument('--profile_path', type=str, required=False, help="JSONL file for the profile trace (default: profile.jsonl in the run directory)")
+    parser.add_argument('--input_bound_threshold', type=float, required=False, default=0.2, help="Fraction of epoch time spent waiting for data above which training is flagged as input bound")
     args = parser.parse_args()
 
-    cwd = os.getcwd()
-    train_command = [
-        "yolo", "task=detect", "mode=train", f"epochs={args.epochs}", f"batch={args.batch_size}", "plots=True", f"model={args.weight}", f"data={cwd}/datasets/{args.directory}/data.yaml"
-    ]
-    subprocess.run(train_command, check=True)
+    data_path = os.path.join(os.getcwd(), "datasets", args.directory, "data.yaml")
+    if args.resume and not os.path.exists(args.weight):
+        print(f"Checkpoint ({args.weight}) not found")
+        sys.exit(1)
+    if args.augment_bank:
+        if not os.path.exists(os.path.join(args.augment_bank, "index.json")):
+            print(f"Augmentation bank index ({os.path.join(args.augment_bank, 'index.json')}) not found")
+            sys.exit(1)
+        dataset_directory, index = augment_bank.materialize_bank(args.augment_bank)
+        data_path = os.path.abspath(os.path.join(dataset_directory, "data.yaml"))
+        if args.imgsz != index['settings']['size']:
+            print(f"Training at the bank's image size {index['settings']['size']} instead of {args.imgsz}")
+            args.imgsz = index['settings']['size']
+    if not args.resume and not os.path.exists(data_path):
+        print(f"Dataset config ({data_path}) not found")
+        sys.exit(1)
+    if args.balance_threshold is not None and not args.resume:
+        data_path = write_balanced_data(data_path, args.balance_threshold, args.seed)
+
+    train(
+        args.weight, data_path, args.epochs, args.batch_size, args.imgsz, args.cache, args.workers, args.rect,
+        args.seed, not args.no_deterministic, args.resume, args.log_path, args.profile, args.profile_path, args.input_bound_threshold,
+        args.project, args.name, not args.augment_bank,
+    )
 
 if __name__ == "__main__":
     main()
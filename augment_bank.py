@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def get_label_path(image_path):
+    image_directory, img_name = os.path.split(image_path)
+    return os.path.join(os.path.dirname(image_directory), "labels", os.path.splitext(img_name)[0] + ".txt")
+
+def load_example(image_path, label_format):
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    width, height = image.size
+    classes, boxes = [], []
+    label_path = get_label_path(image_path)
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            for line in f:
+                values = line.split()
+                if len(values) != 5:
+                    continue
+                x, y, w, h = map(float, values[1:])
+                if label_format == "yolo":
+                    x, y, w, h = (x - w / 2) * width, (y - h / 2) * height, w * width, h * height
+                classes.append(values[0])
+                boxes.append([x, y, x + w, y + h])
+    return image, np.array(boxes, dtype=np.float32).reshape(-1, 4), classes
+
+def scale_example(image, boxes, ratio):
+    width, height = max(1, round(image.width * ratio)), max(1, round(image.height * ratio))
+    scale = np.array([width / image.width, height / image.height] * 2, dtype=np.float32)
+    return image.resize((width, height), Image.BILINEAR), boxes * scale
+
+def place_single(example, size, rng, settings):
+    image, boxes, classes = example
+    ratio = size / max(image.size) * rng.uniform(1 - settings['scale'], 1 + settings['scale'])
+    image, boxes = scale_example(image, boxes, ratio)
+    left = round((size - image.width) / 2 + rng.uniform(-1, 1) * settings['translate'] * size)
+    top = round((size - image.height) / 2 + rng.uniform(-1, 1) * settings['translate'] * size)
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    canvas.paste(image, (left, top))
+    return canvas, boxes + np.array([left, top, left, top], dtype=np.float32), classes
+
+def place_mosaic(examples, size, rng, settings):
+    # Four images meet at a random center, each one filling the quadrant towards its own corner
+    center_x, center_y = rng.uniform(0.25, 0.75, size=2) * size
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    all_boxes, all_classes = [], []
+    for index, (image, boxes, classes) in enumerate(examples):
+        ratio = size / 2 / max(image.size) * rng.uniform(1 - settings['scale'], 1 + settings['scale'])
+        image, boxes = scale_example(image, boxes, ratio)
+        left = round(center_x - image.width if index in [0, 2] else center_x)
+        top = round(center_y - image.height if index in [0, 1] else center_y)
+        canvas.paste(image, (left, top))
+        all_boxes.append(boxes + np.array([left, top, left, top], dtype=np.float32))
+        all_classes.extend(classes)
+    return canvas, np.concatenate(all_boxes), all_classes
+
+def clip_boxes(boxes, classes, size, min_visible=0.2, min_side=2):
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    boxes = boxes.clip(0, size)
+    visible = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = (visible >= min_visible * np.maximum(areas, 1e-9)) & (boxes[:, 2] - boxes[:, 0] >= min_side) & (boxes[:, 3] - boxes[:, 1] >= min_side)
+    return boxes[keep], [class_id for class_id, kept in zip(classes, keep) if kept]
+
+def jitter_hsv(image, rng, settings):
+    hsv = np.asarray(image.convert("HSV")).astype(np.float32)
+    gains = rng.uniform(-1, 1, size=3) * [settings['hsv_h'], settings['hsv_s'], settings['hsv_v']]
+    hsv[..., 0] = (hsv[..., 0] + gains[0] * 255) % 256
+    hsv[..., 1:] *= 1 + gains[1:]
+    return Image.fromarray(hsv.clip(0, 255).astype(np.uint8), "HSV").convert("RGB")
+
+def augment(image_paths, index, variant, settings):
+    rng = np.random.default_rng([settings['seed'], index, variant])
+    size = settings['size']
+    example = load_example(image_paths[index], settings['label_format'])
+    if len(image_paths) >= 4 and rng.random() < settings['mosaic']:
+        others = rng.choice(np.delete(np.arange(len(image_paths)), index), size=3, replace=False)
+        examples = [example] + [load_example(image_paths[other], settings['label_format']) for other in others]
+        image, boxes, classes = place_mosaic(examples, size, rng, settings)
+    else:
+        image, boxes, classes = place_single(example, size, rng, settings)
+    boxes, classes = clip_boxes(boxes, classes, size)
+    if rng.random() < settings['flip']:
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+        boxes = np.stack([size - boxes[:, 2], boxes[:, 1], size - boxes[:, 0], boxes[:, 3]], axis=1)
+    return jitter_hsv(image, rng, settings), boxes, classes
+
+def to_label_lines(boxes, classes, size, label_format):
+    lines = []
+    for class_id, (x1, y1, x2, y2) in zip(classes, boxes):
+        if label_format == "yolo":
+            lines.append(f"{class_id} {(x1 + x2) / 2 / size:.6f} {(y1 + y2) / 2 / size:.6f} {(x2 - x1) / size:.6f} {(y2 - y1) / size:.6f}")
+        else:
+            lines.append(f"{class_id} {x1:.2f} {y1:.2f} {x2 - x1:.2f} {y2 - y1:.2f}")
+    return "".join(line + "\n" for line in lines)
+
+def add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+def write_shard(task):
+    shard_path, image_paths, indices, settings = task
+    partial_path = shard_path + ".partial"
+    samples = boxes = 0
+    with tarfile.open(partial_path, "w") as tar:
+        for index in indices:
+            stem = os.path.splitext(os.path.basename(image_paths[index]))[0]
+            for variant in range(settings['variants']):
+                image, variant_boxes, classes = augment(image_paths, index, variant, settings)
+                buffer = io.BytesIO()
+                image.save(buffer, format="JPEG", quality=settings['quality'])
+                add_bytes(tar, f"images/{stem}_aug{variant}.jpg", buffer.getvalue())
+                add_bytes(tar, f"labels/{stem}_aug{variant}.txt", to_label_lines(variant_boxes, classes, settings['size'], settings['label_format']).encode("utf8"))
+                samples += 1
+                boxes += len(classes)
+    os.replace(partial_path, shard_path)
+    return {"file": os.path.basename(shard_path), "samples": samples, "boxes": boxes}
+
+def get_bank_hash(bank_directory):
+    with open(os.path.join(bank_directory, "index.json"), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def link_or_copy(source, destination):
+    try:
+        os.symlink(os.path.abspath(source), destination)
+    except OSError:
+        if os.path.isdir(source):
+            shutil.copytree(source, destination)
+        else:
+            shutil.copy(source, destination)
+
+def materialize_bank(bank_directory):
+    # Trainers read plain image and label files, so the shards are unpacked once into a split directory next to them
+    with open(os.path.join(bank_directory, "index.json"), "r") as f:
+        index = json.load(f)
+    dataset_directory = os.path.join(bank_directory, "dataset")
+    marker_path = os.path.join(dataset_directory, ".bank_hash")
+    bank_hash = get_bank_hash(bank_directory)
+    if os.path.exists(marker_path):
+        with open(marker_path, "r") as f:
+            if f.read() == bank_hash:
+                return dataset_directory, index
+
+    if os.path.exists(dataset_directory):
+        shutil.rmtree(dataset_directory)
+    split_directory = os.path.join(dataset_directory, index['split'])
+    os.makedirs(split_directory)
+    for shard in index['shards']:
+        with tarfile.open(os.path.join(bank_directory, shard['file']), "r") as tar:
+            members = [member for member in tar.getmembers() if member.isfile() and not os.path.isabs(member.name) and ".." not in member.name.split("/")]
+            tar.extractall(split_directory, members=members)
+    # The other splits, data.yaml and annotations.json come from the source so validation stays unaugmented,
+    # the class index describes the source images and is rebuilt for the bank when needed
+    for entry in os.listdir(index['source']):
+        if entry not in [index['split'], "class_index.json"]:
+            link_or_copy(os.path.join(index['source'], entry), os.path.join(dataset_directory, entry))
+    with open(marker_path, "w") as f:
+        f.write(bank_hash)
+    print(f"Augmentation bank unpacked to {dataset_directory}")
+    return dataset_directory, index
+
+def is_bank_directory(directory):
+    # Only what a previous run writes: shards, their partial files, index.json and the unpacked dataset
+    return all(entry in ["index.json", "dataset"] or entry.startswith("shard-") for entry in os.listdir(directory))
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute K augmented variants of every training image into tar shards.")
+    parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory (e.g. datasets/taco or a TFLite split directory)")
+    parser.add_argument('--split', type=str, required=False, default="train", help="Split to augment")
+    parser.add_argument('--output_directory', type=str, required=True, help="Directory to write the shards and index.json to")
+    parser.add_argument('--label_format', type=str, choices=["yolo", "pixel"], required=False, default="yolo", help="yolo: normalized class cx cy w h, pixel: class x1 y1 w h in pixels as used by TFLite")
+    parser.add_argument('--variants', type=int, required=False, default=4, help="Augmented variants written per image")
+    parser.add_argument('--size', type=int, required=False, default=640, help="Side of the square augmented images")
+    parser.add_argument('--mosaic', type=float, required=False, default=0.5, help="Probability of a 4 image mosaic")
+    parser.add_argument('--flip', type=float, required=False, default=0.5, help="Probability of a horizontal flip")
+    parser.add_argument('--scale', type=float, required=False, default=0.5, help="Random scale range (+/- fraction)")
+    parser.add_argument('--translate', type=float, required=False, default=0.1, help="Random translation range (+/- fraction of the size)")
+    parser.add_argument('--hsv_h', type=float, required=False, default=0.015, help="Hue jitter (fraction)")
+    parser.add_argument('--hsv_s', type=float, required=False, default=0.7, help="Saturation jitter (fraction)")
+    parser.add_argument('--hsv_v', type=float, required=False, default=0.4, help="Value jitter (fraction)")
+    parser.add_argument('--quality', type=int, required=False, default=90, help="JPEG quality of the augmented images")
+    parser.add_argument('--shard_size', type=int, required=False, default=128, help="Source images per shard")
+    parser.add_argument('--seed', type=int, required=False, default=0, help="Seed, the same seed writes the same bank")
+    parser.add_argument('--workers', type=int, required=False, default=os.cpu_count(), help="Number of processes writing shards")
+    args = parser.parse_args()
+
+    image_directory = os.path.join(args.directory, args.split, "images")
+    if not os.path.exists(image_directory):
+        print(f"Image directory ({image_directory}) not found")
+        sys.exit(1)
+    if args.variants <= 0 or args.shard_size <= 0:
+        print("Variants and shard size must be positive")
+        sys.exit(1)
+
+    image_paths = [os.path.join(image_directory, file_name) for file_name in sorted(os.listdir(image_directory)) if is_image(file_name)]
+    settings = {name: getattr(args, name) for name in ["label_format", "variants", "size", "mosaic", "flip", "scale", "translate", "hsv_h", "hsv_s", "hsv_v", "quality", "seed"]}
+    source_directory, output_directory = os.path.realpath(args.directory), os.path.realpath(args.output_directory)
+    if os.path.commonpath([source_directory, output_directory]) == output_directory:
+        print(f"Output directory ({args.output_directory}) must not be or contain the dataset directory")
+        sys.exit(1)
+    if os.path.exists(args.output_directory):
+        if not os.path.isdir(args.output_directory) or not is_bank_directory(args.output_directory):
+            print(f"Output directory ({args.output_directory}) exists and is not an augmentation bank, refusing to overwrite it")
+            sys.exit(1)
+        shutil.rmtree(args.output_directory)
+    os.makedirs(args.output_directory)
+
+    tasks = [
+        (os.path.join(args.output_directory, f"shard-{shard:05d}.tar"), image_paths, list(range(start, min(start + args.shard_size, len(image_paths)))), settings)
+        for shard, start in enumerate(range(0, len(image_paths), args.shard_size))
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        shards = list(executor.map(write_shard, tasks))
+    samples = sum(shard['samples'] for shard in shards)
+    print(f"Wrote {samples} samples from {len(image_paths)} images into {len(shards)} shards in {time.perf_counter() - start:.2f}s")
+
+    index = {"source": os.path.abspath(args.directory), "split": args.split, "images": len(image_paths), "samples": samples, "settings": settings, "shards": shards}
+    with open(os.path.join(args.output_directory, "index.json"), "w") as f:
+        json.dump(index, f, indent=4)
+    print(f"Augmentation bank saved to {args.output_directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def read_label_classes(label_path):
+    counts = Counter()
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            for line in f:
+                values = line.split()
+                if len(values) == 5:
+                    counts[values[0]] += 1
+    return dict(counts)
+
+def create_class_index(split_directory, split_types, class_names=None):
+    # Class ids are kept as written in the label files, class_names only adds readable names for reports
+    splits = {}
+    for split_type in split_types:
+        image_dir = os.path.join(split_directory, split_type, "images")
+        label_dir = os.path.join(split_directory, split_type, "labels")
+        if not os.path.exists(image_dir):
+            continue
+        splits[split_type] = {
+            img_name: read_label_classes(os.path.join(label_dir, os.path.splitext(img_name)[0] + ".txt"))
+            for img_name in sorted(os.listdir(image_dir)) if is_image(img_name)
+        }
+    class_ids = sorted({class_id for images in splits.values() for counts in images.values() for class_id in counts}, key=lambda class_id: (len(class_id), class_id))
+    index = {
+        "classes": {class_id: (class_names or {}).get(class_id, class_id) for class_id in class_ids},
+        "splits": splits,
+    }
+    index_path = os.path.join(split_directory, "class_index.json")
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    print(f"Class index created at {index_path}")
+    return index
+
+def load_class_index(split_directory):
+    with open(os.path.join(split_directory, "class_index.json"), "r") as f:
+        return json.load(f)
+
+def get_repeat_factors(image_classes, threshold):
+    # Repeat factor sampling: a class seen in fewer than threshold of the images repeats them sqrt(threshold / frequency) times
+    image_count = max(len(image_classes), 1)
+    frequencies = Counter(class_id for counts in image_classes.values() for class_id in counts)
+    class_factors = {class_id: max(1.0, math.sqrt(threshold / (count / image_count))) for class_id, count in frequencies.items()}
+    image_factors = {img_name: max([class_factors[class_id] for class_id in counts], default=1.0) for img_name, counts in image_classes.items()}
+    return image_factors, class_factors, frequencies
+
+def sample_image_list(image_factors, seed=0):
+    # Fractional factors are rounded up or down at random so the expected count matches the factor
+    rng = random.Random(seed)
+    img_names = []
+    for img_name, factor in sorted(image_factors.items()):
+        img_names.extend([img_name] * (int(factor) + (rng.random() < factor - int(factor))))
+    return img_names
+
+def get_balanced_image_list(split_directory, split_type, threshold, seed=0):
+    if os.path.exists(os.path.join(split_directory, "class_index.json")):
+        index = load_class_index(split_directory)
+    else:
+        index = create_class_index(split_directory, [split_type])
+    if split_type not in index['splits']:
+        index = create_class_index(split_directory, list(index['splits']) + [split_type], index['classes'])
+    image_factors, _, _ = get_repeat_factors(index['splits'][split_type], threshold)
+    img_names = sample_image_list(image_factors, seed)
+    print(f"Balanced {split_type} split: {len(img_names)} images per epoch instead of {len(image_factors)}")
+    return img_names
+
+def print_report(index, split_type, threshold):
+    image_classes = index['splits'][split_type]
+    image_factors, class_factors, frequencies = get_repeat_factors(image_classes, threshold)
+    repeated = Counter()
+    for img_name, factor in image_factors.items():
+        for class_id in image_classes[img_name]:
+            repeated[class_id] += factor
+    print("| Class | Images | Frequency | Repeat factor | Images per epoch |")
+    print("|---|---|---|---|---|")
+    for class_id, count in sorted(frequencies.items(), key=lambda item: item[1]):
+        print(f"| {index['classes'].get(class_id, class_id)} | {count} | {count / len(image_classes):.4f} | {class_factors[class_id]:.2f} | {repeated[class_id]:.1f} |")
+    print(f"Images per epoch: {sum(image_factors.values()):.0f} instead of {len(image_classes)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the class occurrence index of a split dataset and report repeat factor sampling for it.")
+    parser.add_argument('--directory', type=str, required=True, help="Splitted dataset directory")
+    parser.add_argument('--split', type=str, required=False, default="train", help="Split to report on")
+    parser.add_argument('--threshold', type=float, required=False, default=0.01, help="Image frequency below which a class gets its images repeated")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild class_index.json from the label files even if it exists")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.directory, args.split, "images")):
+        print(f"Split directory ({os.path.join(args.directory, args.split)}) not found")
+        sys.exit(1)
+    if args.threshold <= 0 or args.threshold > 1:
+        print(f"Threshold must be in (0, 1], but found {args.threshold} instead")
+        sys.exit(1)
+
+    if args.rebuild or not os.path.exists(os.path.join(args.directory, "class_index.json")):
+        split_types = [entry for entry in os.listdir(args.directory) if os.path.isdir(os.path.join(args.directory, entry, "images"))]
+        index = create_class_index(args.directory, split_types)
+    else:
+        index = load_class_index(args.directory)
+    if args.split not in index['splits']:
+        print(f"Split ({args.split}) not found in the class index, rebuild it with --rebuild")
+        sys.exit(1)
+    print_report(index, args.split, args.threshold)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_PREFIX = "BENCHMARK_RESULT "
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]
+# Families whose exports can pin the input size, so several --image_sizes may run the same model
+FIXED_SIZE_FAMILIES = ["onnx", "tflite", "model_garden"]
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def load_images(directory, max_images):
+    image_paths = [os.path.join(directory, file_name) for file_name in sorted(os.listdir(directory)) if is_image(file_name)][:max_images]
+    images = []
+    for image_path in image_paths:
+        with Image.open(image_path) as image:
+            images.append(np.asarray(image.convert("RGB")))
+    return images
+
+def create_yolov10_runner(model_path, threads, image_size):
+    import torch
+    from ultralytics import YOLOv10
+    torch.set_num_threads(threads)
+    model = YOLOv10(model_path)
+
+    def run(images):
+        # ultralytics expects BGR arrays like the ones cv2 decodes
+        model.predict([image[:, :, ::-1] for image in images], imgsz=image_size, save=False, verbose=False)
+    return run, image_size
+
+def create_onnx_runner(model_path, threads, image_size):
+    from inference_server import load_module
+    onnx_backend = load_module("onnx_backend", os.path.join(ROOT_DIR, "YOLO V10", "src", "onnx_backend.py"))
+    model = onnx_backend.OnnxModel(model_path, threads)
+
+    def run(images):
+        model.predict([image[:, :, ::-1] for image in images], imgsz=image_size)
+    return run, model.fixed_size or image_size
+
+def create_tflite_runner(model_path, threads, image_size):
+    from inference_server import load_module
+    tflite_inference = load_module("tflite_inference", os.path.join(ROOT_DIR, "TFLite", "src", "inference.py"))
+    with open(model_path, "rb") as f:
+        interpreter = tflite_inference.create_interpreter(f.read(), threads)
+    input_details = interpreter.get_input_details()[0]
+    runner = interpreter.get_signature_runner()
+    input_name = list(runner.get_input_details().keys())[0]
+    _, height, width, _ = input_details['shape']
+
+    def run(images):
+        # EfficientDet-Lite exports have a fixed input size and a batch of 1
+        for image in images:
+            resized = np.asarray(Image.fromarray(image).resize((width, height)), dtype=input_details['dtype'])
+            tflite_inference.detect_objects(runner, input_name, np.expand_dims(resized, axis=0), (image.shape[1], image.shape[0]), 0.0)
+    return run, int(width)
+
+def create_model_garden_runner(model_path, threads, image_size):
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+    detect_fn = tf.saved_model.load(model_path).signatures['serving_default']
+    input_name, input_spec = list(detect_fn.structured_input_signature[1].items())[0]
+    if input_spec.shape[1] is not None and input_spec.shape[2] is not None:
+        image_size = int(input_spec.shape[1])
+
+    def run(images):
+        batch = tf.cast(tf.stack([tf.image.resize(image, (image_size, image_size)) for image in images]), tf.uint8)
+        if input_spec.shape[0] == 1:
+            for i in range(batch.shape[0]):
+                detect_fn(**{input_name: batch[i:i + 1]})
+        else:
+            detect_fn(**{input_name: batch})
+    return run, image_size
+
+RUNNERS = {
+    "yolov10": create_yolov10_runner,
+    "onnx": create_onnx_runner,
+    "tflite": create_tflite_runner,
+    "model_garden": create_model_garden_runner,
+}
+
+def iter_batches(images, batch_size, count):
+    index = 0
+    for _ in range(count):
+        batch = [images[(index + i) % len(images)] for i in range(batch_size)]
+        index = (index + batch_size) % len(images)
+        yield batch
+
+def run_worker(config):
+    if config.get('resolve_only'):
+        # Runners return the size they will really use, None when the model takes any size
+        return {"image_size": RUNNERS[config['family']](config['model_path'], config['threads'], None)[1]}
+    images = load_images(config['directory'], config['max_images'])
+    start = time.perf_counter()
+    run, image_size = RUNNERS[config['family']](config['model_path'], config['threads'], config['image_size'])
+    load_time_s = time.perf_counter() - start
+
+    for batch in iter_batches(images, config['batch_size'], config['warmup']):
+        run(batch)
+
+    latencies_ms = []
+    measured_batches = max(1, config['runs'] * len(images) // config['batch_size'])
+    start = time.perf_counter()
+    for batch in iter_batches(images, config['batch_size'], measured_batches):
+        batch_start = time.perf_counter()
+        run(batch)
+        latencies_ms.append((time.perf_counter() - batch_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        **{key: config[key] for key in ['name', 'family', 'model_path', 'batch_size', 'threads']},
+        "image_size": image_size,
+        "load_time_s": load_time_s,
+        "batches": len(latencies_ms),
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "images_per_second": len(latencies_ms) * config['batch_size'] / max(elapsed, 1e-9),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_config(config, timeout):
+    # Every configuration gets a fresh process so load time, thread pools and peak RSS are not shared
+    env = dict(os.environ, **{name: str(config['threads']) for name in THREAD_ENV_VARS})
+    command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {**config, "error": f"timed out after {timeout}s"}
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {**config, "error": (process.stderr.strip().splitlines() or ["no result"])[-1]}
+
+def resolve_fixed_size(family, model_path, timeout):
+    result = run_config({"family": family, "model_path": model_path, "threads": 1, "resolve_only": True}, timeout)
+    if "error" in result:
+        print(f"Could not read the input size of {model_path}, every image size is benchmarked: {result['error']}")
+        return None
+    return result['image_size']
+
+def to_markdown(results):
+    lines = [
+        "| Model | Batch | Threads | Size | Load (s) | p50 (ms) | p95 (ms) | p99 (ms) | Images/sec | Peak RSS (MB) |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for result in results:
+        if "error" in result:
+            lines.append(f"| {result['name']} | {result['batch_size']} | {result['threads']} | {result['image_size']} | failed: {result['error']} | | | | | |")
+            continue
+        lines.append(
+            f"| {result['name']} | {result['batch_size']} | {result['threads']} | {result['image_size']} | {result['load_time_s']:.2f} | "
+            f"{result['latency_p50_ms']:.1f} | {result['latency_p95_ms']:.1f} | {result['latency_p99_ms']:.1f} | {result['images_per_second']:.2f} | {result['peak_rss_mb']:.0f} |"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU latency and throughput of YOLOv10, TFLite and Model Garden models.")
+    parser.add_argument('--models', type=str, nargs='+', required=False, help=f"One or more family=path entries, families: {', '.join(RUNNERS)}")
+    parser.add_argument('--directory', type=str, required=False, help="Directory of images used for every configuration")
+    parser.add_argument('--max_images', type=int, required=False, default=50, help="Number of images taken from the directory")
+    parser.add_argument('--batch_sizes', type=int, nargs='+', required=False, default=[1], help="Batch sizes to sweep")
+    parser.add_argument('--threads', type=int, nargs='+', required=False, default=[os.cpu_count()], help="Thread counts to sweep")
+    parser.add_argument('--image_sizes', type=int, nargs='+', required=False, default=[640], help="Input resolutions to sweep (models with a fixed input size use their own)")
+    parser.add_argument('--warmup', type=int, required=False, default=5, help="Batches run before measuring")
+    parser.add_argument('--runs', type=int, required=False, default=3, help="Measured passes over the image set")
+    parser.add_argument('--timeout', type=float, required=False, default=1800, help="Seconds a single configuration may take")
+    parser.add_argument('--output', type=str, required=False, default="benchmark.json", help="JSON file to write results to, a markdown table is written next to it")
+    parser.add_argument('--worker', type=str, required=False, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(RESULT_PREFIX + json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    if not args.models or not args.directory:
+        print("The models and directory flags must be used")
+        sys.exit(1)
+    if not os.path.exists(args.directory):
+        print(f"Directory ({args.directory}) not found")
+        sys.exit(1)
+
+    models = []
+    for entry in args.models:
+        family, _, model_path = entry.partition("=")
+        if family not in RUNNERS or not model_path:
+            print(f"Model ({entry}) must be given as family=path with a family out of {', '.join(RUNNERS)}")
+            sys.exit(1)
+        if not os.path.exists(model_path):
+            print(f"Model ({model_path}) not found")
+            sys.exit(1)
+        models.append((family, model_path))
+
+    fixed_sizes = {}
+    if len(set(args.image_sizes)) > 1:
+        for family, model_path in models:
+            if family in FIXED_SIZE_FAMILIES:
+                fixed_sizes[(family, model_path)] = resolve_fixed_size(family, model_path, args.timeout)
+
+    results = []
+    benchmarked = set()
+    for (family, model_path), batch_size, threads, image_size in itertools.product(models, args.batch_sizes, args.threads, args.image_sizes):
+        # A model with a fixed input size gives the same result for every requested size, so it runs once
+        image_size = fixed_sizes.get((family, model_path)) or image_size
+        if (family, model_path, batch_size, threads, image_size) in benchmarked:
+            continue
+        benchmarked.add((family, model_path, batch_size, threads, image_size))
+        config = {
+            "name": f"{family}:{os.path.basename(os.path.normpath(model_path))}",
+            "family": family,
+            "model_path": model_path,
+            "directory": args.directory,
+            "max_images": args.max_images,
+            "batch_size": batch_size,
+            "threads": threads,
+            "image_size": image_size,
+            "warmup": args.warmup,
+            "runs": args.runs,
+        }
+        print(f"Benchmarking {config['name']} with batch {batch_size}, {threads} threads, size {image_size}")
+        result = run_config(config, args.timeout)
+        if "error" in result:
+            print(f"Failed: {result['error']}")
+        results.append(result)
+
+    markdown = to_markdown(results)
+    print(markdown)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    markdown_path = os.path.splitext(args.output)[0] + ".md"
+    with open(markdown_path, "w") as f:
+        f.write(markdown + "\n")
+    print(f"Results saved to {args.output} and {markdown_path}")
+
+if __name__ == "__main__":
+    main()
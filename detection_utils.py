@@ -0,0 +1,20 @@
+import cv2
+
+def yolo_result_to_detections(result):
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    scores = boxes.conf.cpu().numpy()
+    classes = boxes.cls.cpu().numpy().astype(int)
+    return [{
+        "class_id": int(classes[i]),
+        "class_name": result.names[int(classes[i])],
+        "score": float(scores[i]),
+        "box": [float(value) for value in xyxy[i]],
+    } for i in range(len(scores))]
+
+def draw_detections(image, detections):
+    for detection in detections:
+        xmin, ymin, xmax, ymax = [int(round(value)) for value in detection['box']]
+        cv2.rectangle(image, (xmin, ymin), (xmax, ymax), (0, 255, 0), 2)
+        cv2.putText(image, f"{detection['class_name']} {detection['score']:.2f}", (xmin, max(ymin - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    return image
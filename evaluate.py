@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import yaml
+from PIL import Image
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0, 1, 101)
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def normalize_name(name):
+    return str(name).strip().lower()
+
+def to_columns(rows, with_scores):
+    # rows are (image, class_name, xmin, ymin, xmax, ymax[, score]) tuples
+    columns = {
+        "images": np.array([row[0] for row in rows], dtype=str),
+        "classes": np.array([normalize_name(row[1]) for row in rows], dtype=str),
+        "boxes": np.array([row[2:6] for row in rows], dtype=float).reshape(-1, 4),
+    }
+    if with_scores:
+        columns['scores'] = np.array([row[6] for row in rows], dtype=float)
+    return columns
+
+def load_yolo_ground_truth(split_path, data_yaml=None):
+    data_yaml = data_yaml or os.path.join(os.path.dirname(os.path.abspath(split_path)), "data.yaml")
+    with open(data_yaml, "r") as f:
+        names = yaml.safe_load(f)['names']
+    if isinstance(names, dict):
+        names = [names[class_id] for class_id in sorted(names)]
+
+    image_dir = os.path.join(split_path, "images")
+    label_dir = os.path.join(split_path, "labels")
+    rows, images = [], []
+    for img_name in sorted(os.listdir(image_dir)):
+        if not is_image(img_name):
+            continue
+        images.append(img_name)
+        label_path = os.path.join(label_dir, os.path.splitext(img_name)[0] + ".txt")
+        if not os.path.exists(label_path):
+            continue
+        with Image.open(os.path.join(image_dir, img_name)) as image:
+            width, height = image.size
+        with open(label_path, "r") as f:
+            for line in f:
+                values = line.strip().split()
+                if len(values) != 5:
+                    continue
+                x_center, y_center, box_width, box_height = map(float, values[1:])
+                rows.append((img_name, names[int(values[0])], (x_center - box_width / 2) * width, (y_center - box_height / 2) * height, (x_center + box_width / 2) * width, (y_center + box_height / 2) * height))
+    return to_columns(rows, False), images
+
+def load_voc_ground_truth(xml_dir):
+    rows, images = [], []
+    for xml_name in sorted(os.listdir(xml_dir)):
+        if not xml_name.endswith(".xml"):
+            continue
+        root = ET.parse(os.path.join(xml_dir, xml_name)).getroot()
+        img_name = root.findtext("filename")
+        images.append(img_name)
+        for obj in root.findall("object"):
+            box = obj.find("bndbox")
+            rows.append((img_name, obj.findtext("name"), *[float(box.findtext(key)) for key in ["xmin", "ymin", "xmax", "ymax"]]))
+    return to_columns(rows, False), images
+
+def load_tfrecord_ground_truth(tfrecord_path):
+    import tensorflow as tf
+    features = {
+        'image/filename': tf.io.FixedLenFeature([], tf.string),
+        'image/height': tf.io.FixedLenFeature([], tf.int64),
+        'image/width': tf.io.FixedLenFeature([], tf.int64),
+        'image/object/bbox/xmin': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/ymin': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/xmax': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/ymax': tf.io.VarLenFeature(tf.float32),
+        'image/object/class/text': tf.io.VarLenFeature(tf.string),
+    }
+    rows, images = [], []
+    for record in tf.data.TFRecordDataset(tfrecord_path):
+        example = tf.io.parse_single_example(record, features)
+        img_name = os.path.basename(example['image/filename'].numpy().decode("utf8"))
+        width, height = int(example['image/width']), int(example['image/height'])
+        images.append(img_name)
+        values = {key: tf.sparse.to_dense(example[key]).numpy() for key in features if key.startswith("image/object")}
+        for i in range(len(values['image/object/class/text'])):
+            rows.append((
+                img_name,
+                values['image/object/class/text'][i].decode("utf8"),
+                values['image/object/bbox/xmin'][i] * width,
+                values['image/object/bbox/ymin'][i] * height,
+                values['image/object/bbox/xmax'][i] * width,
+                values['image/object/bbox/ymax'][i] * height,
+            ))
+    return to_columns(rows, False), images
+
+def load_predictions(predictions_path):
+    # YOLOv10 writes one JSON line per detection, TFLite and Model Garden one per image with a list of detections
+    rows = []
+    if predictions_path.endswith(".parquet"):
+        import pandas as pd
+        for record in pd.read_parquet(predictions_path).to_dict("records"):
+            rows.append((os.path.basename(record['image']), record['class_name'], record['xmin'], record['ymin'], record['xmax'], record['ymax'], record['score']))
+    elif predictions_path.endswith(".jsonl"):
+        with open(predictions_path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                detections = record['detections'] if "detections" in record else [record]
+                for detection in detections:
+                    rows.append((os.path.basename(record['image']), detection['class_name'], *detection['box'], detection['score']))
+    else:
+        with open(predictions_path, "r") as f:
+            coco = json.load(f)
+        file_names = {image['id']: os.path.basename(image['file_name']) for image in coco['images']}
+        class_names = {category['id']: category['name'] for category in coco['categories']}
+        for annotation in coco['annotations']:
+            x, y, w, h = annotation['bbox']
+            rows.append((file_names[annotation['image_id']], class_names[annotation['category_id']], x, y, x + w, y + h, annotation['score']))
+    return to_columns(rows, True)
+
+def box_iou_matrix(boxes1, boxes2):
+    xmin = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    ymin = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    xmax = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    ymax = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+    areas1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    areas2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    return intersection / np.maximum(areas1[:, None] + areas2[None, :] - intersection, 1e-9)
+
+def match_image(det_boxes, gt_boxes, iou_thresholds):
+    # Detections arrive sorted by score; every IoU threshold is matched at once as one row of the state
+    true_positives = np.zeros((len(iou_thresholds), len(det_boxes)), dtype=bool)
+    if len(det_boxes) == 0 or len(gt_boxes) == 0:
+        return true_positives
+    ious = box_iou_matrix(det_boxes, gt_boxes)
+    matched = np.zeros((len(iou_thresholds), len(gt_boxes)), dtype=bool)
+    rows = np.arange(len(iou_thresholds))
+    for i in range(len(det_boxes)):
+        candidates = np.where(matched, -1, ious[i][None, :])
+        best = np.argmax(candidates, axis=1)
+        hits = candidates[rows, best] >= iou_thresholds
+        matched[rows[hits], best[hits]] = True
+        true_positives[hits, i] = True
+    return true_positives
+
+def average_precision(precision, recall):
+    # COCO-style 101-point interpolation over the precision envelope
+    if len(precision) == 0:
+        return 0.0
+    envelope = np.maximum.accumulate(precision[::-1])[::-1]
+    indices = np.searchsorted(recall, RECALL_THRESHOLDS, side="left")
+    return float(np.mean(np.where(indices < len(envelope), envelope[np.minimum(indices, len(envelope) - 1)], 0)))
+
+def evaluate_class(gt_images, gt_boxes, det_images, det_scores, det_boxes, max_dets=100):
+    gt_count = len(gt_images)
+    if gt_count == 0:
+        return None
+
+    scores, true_positives = [], []
+    for img_name in np.unique(det_images):
+        in_image = np.where(det_images == img_name)[0]
+        in_image = in_image[np.argsort(-det_scores[in_image], kind="mergesort")][:max_dets]
+        scores.append(det_scores[in_image])
+        true_positives.append(match_image(det_boxes[in_image], gt_boxes[gt_images == img_name], IOU_THRESHOLDS))
+    if not scores:
+        return {"ap": 0.0, "ap50": 0.0, "ap75": 0.0, "ground_truth": gt_count, "detections": 0}
+
+    scores = np.concatenate(scores)
+    order = np.argsort(-scores, kind="mergesort")
+    true_positives = np.concatenate(true_positives, axis=1)[:, order]
+    cumulative_tp = np.cumsum(true_positives, axis=1)
+    cumulative_fp = np.cumsum(~true_positives, axis=1)
+    recall = cumulative_tp / gt_count
+    precision = cumulative_tp / np.maximum(cumulative_tp + cumulative_fp, np.finfo(float).eps)
+
+    ap = np.array([average_precision(precision[t], recall[t]) for t in range(len(IOU_THRESHOLDS))])
+    return {"ap": float(ap.mean()), "ap50": float(ap[0]), "ap75": float(ap[5]), "ground_truth": gt_count, "detections": int(len(scores))}
+
+def evaluate(ground_truth, predictions, images, workers=None, max_dets=100):
+    keep = np.isin(predictions['images'], images)
+    predictions = {key: value[keep] for key, value in predictions.items()}
+    class_names = sorted(set(ground_truth['classes'].tolist()) | set(predictions['classes'].tolist()))
+
+    jobs = []
+    for class_name in class_names:
+        in_gt = ground_truth['classes'] == class_name
+        in_pred = predictions['classes'] == class_name
+        jobs.append((ground_truth['images'][in_gt], ground_truth['boxes'][in_gt], predictions['images'][in_pred], predictions['scores'][in_pred], predictions['boxes'][in_pred], max_dets))
+
+    # Classes are independent, so each one is matched and accumulated in its own process
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(evaluate_class, *zip(*jobs))) if jobs else []
+
+    per_class = {class_name: result for class_name, result in zip(class_names, results) if result is not None}
+    summary = {
+        "map": float(np.mean([result['ap'] for result in per_class.values()])) if per_class else 0.0,
+        "map50": float(np.mean([result['ap50'] for result in per_class.values()])) if per_class else 0.0,
+        "map75": float(np.mean([result['ap75'] for result in per_class.values()])) if per_class else 0.0,
+    }
+    unmatched = sorted(set(predictions['classes'].tolist()) - set(ground_truth['classes'].tolist()))
+    return {**summary, "classes": per_class, "prediction_only_classes": unmatched}
+
+def cross_check_with_pycocotools(ground_truth, predictions, images, max_dets=100):
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+
+    image_ids = {img_name: index for index, img_name in enumerate(images)}
+    class_names = sorted(set(ground_truth['classes'].tolist()))
+    class_ids = {class_name: index for index, class_name in enumerate(class_names)}
+
+    def to_xywh(box):
+        return [float(box[0]), float(box[1]), float(box[2] - box[0]), float(box[3] - box[1])]
+
+    coco_gt = COCO()
+    coco_gt.dataset = {
+        "images": [{"id": index} for index in image_ids.values()],
+        "categories": [{"id": index, "name": class_name} for class_name, index in class_ids.items()],
+        "annotations": [{
+            "id": index + 1,
+            "image_id": image_ids[img_name],
+            "category_id": class_ids[class_name],
+            "bbox": to_xywh(box),
+            "area": float((box[2] - box[0]) * (box[3] - box[1])),
+            "iscrowd": 0,
+        } for index, (img_name, class_name, box) in enumerate(zip(ground_truth['images'], ground_truth['classes'], ground_truth['boxes']))],
+    }
+    coco_gt.createIndex()
+    detections = [{
+        "image_id": image_ids[img_name],
+        "category_id": class_ids[class_name],
+        "bbox": to_xywh(box),
+        "score": float(score),
+    } for img_name, class_name, box, score in zip(predictions['images'], predictions['classes'], predictions['boxes'], predictions['scores']) if img_name in image_ids and class_name in class_ids]
+    if not detections:
+        return {"map": 0.0, "map50": 0.0, "map75": 0.0}
+
+    coco_eval = COCOeval(coco_gt, coco_gt.loadRes(detections), "bbox")
+    coco_eval.params.maxDets = [1, 10, max_dets]
+    coco_eval.evaluate()
+    coco_eval.accumulate()
+    coco_eval.summarize()
+    return {"map": float(coco_eval.stats[0]), "map50": float(coco_eval.stats[1]), "map75": float(coco_eval.stats[2])}
+
+def load_ground_truth(args):
+    if args.gt_format == "yolo":
+        return load_yolo_ground_truth(args.gt_path, args.data_yaml)
+    if args.gt_format == "voc":
+        return load_voc_ground_truth(args.gt_path)
+    return load_tfrecord_ground_truth(args.gt_path)
+
+def print_report(reports):
+    print("| Model | mAP50-95 | mAP50 | mAP75 | Eval time (s) |")
+    print("|---|---|---|---|---|")
+    for name, report in reports.items():
+        print(f"| {name} | {report['map']:.4f} | {report['map50']:.4f} | {report['map75']:.4f} | {report['elapsed_s']:.2f} |")
+
+    class_names = sorted({class_name for report in reports.values() for class_name in report['classes']})
+    print()
+    print("| Class | GT | " + " | ".join(f"{name} AP50-95" for name in reports) + " |")
+    print("|---|---|" + "---|" * len(reports))
+    for class_name in class_names:
+        gt_count = next(report['classes'][class_name]['ground_truth'] for report in reports.values() if class_name in report['classes'])
+        values = [f"{report['classes'][class_name]['ap']:.4f}" if class_name in report['classes'] else "-" for report in reports.values()]
+        print(f"| {class_name} | {gt_count} | " + " | ".join(values) + " |")
+    for name, report in reports.items():
+        if report['prediction_only_classes']:
+            print(f"{name} predicts classes missing from the ground truth: {', '.join(report['prediction_only_classes'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare COCO-style mAP of YOLOv10, TFLite and Model Garden detections on one split.")
+    parser.add_argument('--gt_format', type=str, required=True, choices=['yolo', 'voc', 'tfrecord'], help="Layout of the ground truth")
+    parser.add_argument('--gt_path', type=str, required=True, help="Split directory with images/ and labels/ (yolo), directory of XML files (voc) or TFRecord file (tfrecord)")
+    parser.add_argument('--data_yaml', type=str, required=False, help="data.yaml with the class names of YOLO labels (default: data.yaml next to the split directory)")
+    parser.add_argument('--predictions', type=str, nargs='+', required=True, help="One or more name=path entries, e.g. yolov10=detections.jsonl tflite=tflite.jsonl")
+    parser.add_argument('--output', type=str, required=False, help="JSON file to write the full report to")
+    parser.add_argument('--workers', type=int, required=False, default=os.cpu_count(), help="Processes evaluating classes in parallel")
+    parser.add_argument('--max_dets', type=int, required=False, default=100, help="Detections kept per image and class, as in COCO")
+    parser.add_argument('--cross_check', action='store_true', help="Also run pycocotools on the same data and print both results")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.gt_path):
+        print(f"Ground truth ({args.gt_path}) not found")
+        sys.exit(1)
+    predictions_paths = {}
+    for entry in args.predictions:
+        if "=" not in entry:
+            print(f"Predictions ({entry}) must be given as name=path")
+            sys.exit(1)
+        name, path = entry.split("=", 1)
+        if not os.path.exists(path):
+            print(f"Predictions ({path}) not found")
+            sys.exit(1)
+        predictions_paths[name] = path
+
+    start = time.perf_counter()
+    ground_truth, images = load_ground_truth(args)
+    print(f"Loaded {len(ground_truth['images'])} ground truth boxes on {len(images)} images in {time.perf_counter() - start:.2f}s")
+
+    reports = {}
+    for name, path in predictions_paths.items():
+        predictions = load_predictions(path)
+        start = time.perf_counter()
+        report = evaluate(ground_truth, predictions, images, args.workers, args.max_dets)
+        report['elapsed_s'] = time.perf_counter() - start
+        if args.cross_check:
+            report['pycocotools'] = cross_check_with_pycocotools(ground_truth, predictions, images, args.max_dets)
+            print(f"{name}: mAP50-95 {report['map']:.4f} here vs {report['pycocotools']['map']:.4f} with pycocotools")
+        reports[name] = report
+
+    print_report(reports)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=4)
+        print(f"Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import collections
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlencode, urlparse
+import cv2
+import numpy as np
+from detection_utils import yolo_result_to_detections
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class ServerBusyError(Exception):
+    pass
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def create_yolo_predictor(weight, imgsz):
+    from ultralytics import YOLOv10
+    model = YOLOv10(weight)
+
+    def predict(images, conf):
+        results = model.predict(images, conf=conf, imgsz=imgsz, save=False, verbose=False)
+        return [yolo_result_to_detections(result) for result in results]
+    return predict
+
+def create_tflite_predictor(model_path, labels_path, num_threads):
+    tflite_inference = load_module("tflite_inference", os.path.join(ROOT_DIR, "TFLite", "src", "inference.py"))
+    with open(model_path, "rb") as f:
+        interpreter = tflite_inference.create_interpreter(f.read(), num_threads)
+    labels = tflite_inference.load_labels(model_path, labels_path)
+    input_details = interpreter.get_input_details()[0]
+    runner = interpreter.get_signature_runner()
+    input_name = list(runner.get_input_details().keys())[0]
+    _, height, width, _ = input_details['shape']
+
+    def predict(images, conf):
+        # EfficientDet-Lite exports have a fixed batch of 1, so the micro-batch runs back to back
+        detections = []
+        for image in images:
+            original_size = (image.shape[1], image.shape[0])
+            resized = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (width, height))
+            input_image = np.expand_dims(resized.astype(input_details['dtype']), axis=0)
+            detections.append(tflite_inference.detect_objects(runner, input_name, input_image, original_size, conf, labels))
+        return detections
+    return predict
+
+class MicroBatcher:
+    def __init__(self, name, predict_fn, max_batch_size, max_latency_ms, max_queue_size):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.latencies_ms = collections.deque(maxlen=1000)
+        self.counters = collections.Counter()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, image, conf, timeout):
+        item = {"image": image, "conf": conf, "enqueued": time.perf_counter(), "event": threading.Event()}
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise ServerBusyError(f"{self.name} queue is full")
+        if not item['event'].wait(timeout):
+            raise TimeoutError(f"{self.name} did not answer within {timeout}s")
+        if "error" in item:
+            raise RuntimeError(item['error'])
+        return item['detections']
+
+    def collect_batch(self):
+        # The first request's arrival sets the deadline for the whole micro-batch
+        batch = [self.queue.get()]
+        deadline = batch[0]['enqueued'] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect_batch()
+            min_conf = min(item['conf'] for item in batch)
+            start = time.perf_counter()
+            try:
+                batch_detections = self.predict_fn([item['image'] for item in batch], min_conf)
+                for item, detections in zip(batch, batch_detections):
+                    item['detections'] = [detection for detection in detections if detection['score'] >= item['conf']]
+            except Exception as e:
+                for item in batch:
+                    item['error'] = str(e)
+            finished = time.perf_counter()
+
+            with self.lock:
+                self.counters['batches'] += 1
+                self.counters['requests'] += len(batch)
+                self.counters['inference_ms'] += (finished - start) * 1000
+                if "error" in batch[0]:
+                    self.counters['errors'] += len(batch)
+                for item in batch:
+                    self.latencies_ms.append((finished - item['enqueued']) * 1000)
+            for item in batch:
+                item['event'].set()
+
+    def metrics(self):
+        with self.lock:
+            latencies = list(self.latencies_ms)
+            counters = dict(self.counters)
+        batches = counters.get('batches', 0)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "requests": counters.get('requests', 0),
+            "rejected": counters.get('rejected', 0),
+            "errors": counters.get('errors', 0),
+            "batches": batches,
+            "mean_batch_size": counters.get('requests', 0) / batches if batches else 0,
+            "mean_inference_ms": counters.get('inference_ms', 0) / batches if batches else 0,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+            "latency_p95_ms": float(np.percentile(latencies, 95)) if latencies else None,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if latencies else None,
+        }
+
+def create_handler(batchers, request_timeout):
+    class InferenceRequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body, headers=None):
+            content = json.dumps(body).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/health":
+                self.send_json(200, {"status": "ok", "models": list(batchers.keys())})
+            elif path == "/metrics":
+                self.send_json(200, {name: batcher.metrics() for name, batcher in batchers.items()})
+            else:
+                self.send_json(404, {"error": f"Unknown path {path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "predict":
+                self.send_json(404, {"error": f"Unknown path {url.path}"})
+                return
+            if parts[1] not in batchers:
+                self.send_json(404, {"error": f"Model {parts[1]} is not loaded"})
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            query = parse_qs(url.query)
+            try:
+                conf = float(query.get("conf", [0.35])[0])
+            except ValueError:
+                self.send_json(400, {"error": f"conf must be a number, but found {query['conf'][0]} instead"})
+                return
+            if not 0 <= conf <= 1:
+                self.send_json(400, {"error": f"conf must be between 0 and 1, but found {conf} instead"})
+                return
+            image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                self.send_json(400, {"error": "Request body is not a decodable image"})
+                return
+
+            start = time.perf_counter()
+            try:
+                detections = batchers[parts[1]].submit(image, conf, request_timeout)
+            except ServerBusyError as e:
+                self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+                return
+            except TimeoutError as e:
+                self.send_json(504, {"error": str(e)})
+                return
+            except RuntimeError as e:
+                self.send_json(500, {"error": str(e)})
+                return
+            self.send_json(200, {"detections": detections, "latency_ms": (time.perf_counter() - start) * 1000})
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceRequestHandler
+
+def predict_image(server_url, model_name, image_path, conf=0.35, timeout=60):
+    with open(image_path, "rb") as f:
+        body = f.read()
+    url = f"{server_url.rstrip('/')}/predict/{model_name}?{urlencode({'conf': conf})}"
+    req = urllib_request.Request(url, data=body, method="POST", headers={"Content-Type": "application/octet-stream"})
+    try:
+        with urllib_request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read())['detections']
+    except HTTPError as e:
+        raise RuntimeError(f"Inference server returned {e.code}: {e.read().decode('utf8')}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve warm detection models over a local HTTP endpoint.")
+    parser.add_argument('--weight', type=str, required=False, help="Path to YOLOv10 weights to serve as the 'yolov10' model")
+    parser.add_argument('--tflite_model', type=str, required=False, help="Path to a TFLite model to serve as the 'tflite' model")
+    parser.add_argument('--tflite_labels', type=str, required=False, help="Label file for the TFLite model (defaults to its metadata)")
+    parser.add_argument('--host', type=str, required=False, default="127.0.0.1", help="Host to listen on")
+    parser.add_argument('--port', type=int, required=False, default=8500, help="Port to listen on")
+    parser.add_argument('--imgsz', type=int, required=False, default=640, help="YOLOv10 inference image size")
+    parser.add_argument('--tflite_threads', type=int, required=False, default=4, help="Threads used by the TFLite interpreter")
+    parser.add_argument('--max_batch_size', type=int, required=False, default=8, help="Maximum number of requests grouped into one model call")
+    parser.add_argument('--max_latency_ms', type=float, required=False, default=20, help="Longest a request waits for its micro-batch to fill")
+    parser.add_argument('--max_queue_size', type=int, required=False, default=64, help="Requests queued per model before new ones are rejected with 503")
+    parser.add_argument('--request_timeout', type=float, required=False, default=60, help="Seconds a request may wait for its result")
+    args = parser.parse_args()
+
+    if (not args.weight) and (not args.tflite_model):
+        print("At least one of the weight or tflite_model flags must be used")
+        sys.exit(1)
+    for model_path in [args.weight, args.tflite_model]:
+        if model_path and not os.path.exists(model_path):
+            print(f"Model ({model_path}) not found")
+            sys.exit(1)
+
+    batchers = {}
+    if args.weight:
+        batchers['yolov10'] = MicroBatcher("yolov10", create_yolo_predictor(args.weight, args.imgsz), args.max_batch_size, args.max_latency_ms, args.max_queue_size)
+    if args.tflite_model:
+        batchers['tflite'] = MicroBatcher("tflite", create_tflite_predictor(args.tflite_model, args.tflite_labels, args.tflite_threads), args.max_batch_size, args.max_latency_ms, args.max_queue_size)
+
+    server = ThreadingHTTPServer((args.host, args.port), create_handler(batchers, args.request_timeout))
+    print(f"Serving {', '.join(batchers.keys())} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
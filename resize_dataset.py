@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+def is_image(file_path):
+    return file_path.lower().endswith(('.png', '.jpg', '.jpeg'))
+
+def get_label_path(image_path):
+    image_directory, img_name = os.path.split(image_path)
+    return os.path.join(os.path.dirname(image_directory), "labels", os.path.splitext(img_name)[0] + ".txt")
+
+def get_target_size(width, height, size):
+    # Images are only ever scaled down, smaller ones keep their resolution
+    ratio = min(1.0, size / max(width, height))
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def resize_image(image_path, output_path, size, letterbox, quality):
+    with Image.open(image_path) as image:
+        # Orientation is applied like cv2.imread does, so labels keep matching what the trainers see
+        orientation = image.getexif().get(0x0112, 1)
+        original_width, original_height = (image.height, image.width) if orientation in [5, 6, 7, 8] else image.size
+        # JPEG decoding can downscale by 1/2, 1/4 or 1/8 for free, which is most of the cost of a 12 megapixel image
+        image.draft("RGB", get_target_size(image.width, image.height, size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    width, height = get_target_size(original_width, original_height, size)
+    resized = image.resize((width, height), Image.BILINEAR) if image.size != (width, height) else image
+    left = top = 0
+    if letterbox:
+        left, top = (size - width) // 2, (size - height) // 2
+        canvas = Image.new("RGB", (size, size), (114, 114, 114))
+        canvas.paste(resized, (left, top))
+        resized = canvas
+    resized.save(output_path, quality=quality)
+    return {
+        "original_size": [original_width, original_height],
+        "size": list(resized.size),
+        "scale": [width / original_width, height / original_height],
+        "padding": [left, top],
+    }
+
+def transform_label_line(line, transform, label_format):
+    values = line.split()
+    if len(values) != 5:
+        return None
+    class_id, x, y, w, h = values[0], *map(float, values[1:])
+    (scale_x, scale_y), (left, top) = transform['scale'], transform['padding']
+    if label_format == "pixel":
+        return f"{class_id} {x * scale_x + left:.2f} {y * scale_y + top:.2f} {w * scale_x:.2f} {h * scale_y:.2f}"
+    # Normalized boxes stay the same under a plain resize and only move with letterbox padding
+    (original_width, original_height), (width, height) = transform['original_size'], transform['size']
+    x = (x * original_width * scale_x + left) / width
+    y = (y * original_height * scale_y + top) / height
+    w = w * original_width * scale_x / width
+    h = h * original_height * scale_y / height
+    return f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
+
+def process_image(task):
+    image_path, output_path, size, letterbox, label_format, quality, previous_transform = task
+    label_path, output_label_path = get_label_path(image_path), get_label_path(output_path)
+    # Outputs newer than their source image and label are reused, so rerunning only processes new or changed images
+    source_mtime = max(os.path.getmtime(path) for path in [image_path, label_path] if os.path.exists(path))
+    if previous_transform and os.path.exists(output_path) and os.path.getmtime(output_path) >= source_mtime and os.path.exists(label_path) == os.path.exists(output_label_path):
+        return output_path, previous_transform, False
+
+    transform = resize_image(image_path, output_path, size, letterbox, quality)
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            lines = [transform_label_line(line, transform, label_format) for line in f if line.strip()]
+        with open(output_label_path, "w") as f:
+            f.write("".join(line + "\n" for line in lines if line is not None))
+    elif os.path.exists(output_label_path):
+        os.remove(output_label_path)
+    return output_path, transform, True
+
+def scale_annotations(json_path, output_json_path, transforms):
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    images = {}
+    for image in data.get('images', []):
+        # Keyed by the flattened file name like json_to_xml.py does, preprocess.py turns batch_1/000001.jpg into batch_1_000001.jpg
+        transform = transforms.get(image['file_name'].replace("/", "_"))
+        if transform is None:
+            continue
+        image['width'], image['height'] = transform['size']
+        images[image['id']] = transform
+    if data.get('images') and not images:
+        print(f"No image of {json_path} matches a resized image, its sizes would not match the resized copy")
+        sys.exit(1)
+
+    for annot in data.get('annotations', []):
+        transform = images.get(annot['image_id'])
+        if transform is None:
+            continue
+        (scale_x, scale_y), (left, top) = transform['scale'], transform['padding']
+        try:
+            x, y, w, h = map(float, annot['bbox'])
+        except (TypeError, ValueError):
+            # Invalid boxes are left for the preprocessing scripts to drop
+            continue
+        annot['bbox'] = [x * scale_x + left, y * scale_y + top, w * scale_x, h * scale_y]
+        if 'area' in annot:
+            annot['area'] = float(annot['area']) * scale_x * scale_y
+        if isinstance(annot.get('segmentation'), list):
+            annot['segmentation'] = [
+                [value * scale_x + left if i % 2 == 0 else value * scale_y + top for i, value in enumerate(polygon)]
+                for polygon in annot['segmentation']
+            ]
+
+    with open(output_json_path, "w") as f:
+        json.dump(data, f)
+
+def load_previous_transforms(output_directory, size, letterbox, label_format):
+    resize_path = os.path.join(output_directory, "resize.json")
+    if not os.path.exists(resize_path):
+        return {}
+    with open(resize_path, "r") as f:
+        previous = json.load(f)
+    if [previous['size'], previous['letterbox'], previous['label_format']] != [size, letterbox, label_format]:
+        return {}
+    return previous['transforms']
+
+def collect_tasks(directory, output_directory, size, letterbox, label_format, quality):
+    previous_transforms = load_previous_transforms(output_directory, size, letterbox, label_format)
+    tasks, other_files = [], []
+    for root, _, file_names in os.walk(directory):
+        output_root = os.path.join(output_directory, os.path.relpath(root, directory))
+        if os.path.basename(root) == "xml_labels":
+            print(f"Skipping {root}, recreate it from the resized copy with json_to_xml.py")
+            continue
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            if os.path.basename(root) == "images" and is_image(file_name):
+                os.makedirs(output_root, exist_ok=True)
+                os.makedirs(os.path.join(os.path.dirname(output_root), "labels"), exist_ok=True)
+                output_path = os.path.join(output_root, file_name)
+                tasks.append((path, output_path, size, letterbox, label_format, quality, previous_transforms.get(os.path.relpath(output_path, output_directory))))
+            elif os.path.basename(root) != "labels":
+                other_files.append((path, os.path.join(output_root, file_name)))
+    return tasks, other_files
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a copy of a dataset with images resized to the model input size and labels rescaled to match.")
+    parser.add_argument('--directory', type=str, required=True, help="Dataset directory, every images directory below it is resized along with its labels directory")
+    parser.add_argument('--output_directory', type=str, required=False, help="Directory of the resized copy (default: <directory>_<size>, with _letterbox when letterboxing)")
+    parser.add_argument('--size', type=int, required=False, default=640, help="Longest image side after resizing")
+    parser.add_argument('--letterbox', action='store_true', help="Pad every image to a size x size square like the YOLOv10 predictor does")
+    parser.add_argument('--label_format', type=str, choices=["yolo", "pixel"], required=False, default="yolo", help="yolo: normalized class cx cy w h, pixel: class x1 y1 w h in pixels as used by TFLite and TF Model Garden")
+    parser.add_argument('--quality', type=int, required=False, default=95, help="JPEG quality of the resized images")
+    parser.add_argument('--workers', type=int, required=False, default=os.cpu_count(), help="Number of processes resizing images")
+    args = parser.parse_args()
+
+    directory = os.path.normpath(args.directory)
+    if not os.path.exists(directory):
+        print(f"Directory ({directory}) not found")
+        sys.exit(1)
+    if args.size <= 0:
+        print(f"Size must be positive, but found {args.size} instead")
+        sys.exit(1)
+    output_directory = args.output_directory or f"{directory}_{args.size}" + ("_letterbox" if args.letterbox else "")
+    if os.path.abspath(output_directory) == os.path.abspath(directory):
+        print("Output directory must differ from the dataset directory, the original resolution copy is kept for tiled inference")
+        sys.exit(1)
+
+    tasks, other_files = collect_tasks(directory, output_directory, args.size, args.letterbox, args.label_format, args.quality)
+    if not tasks:
+        print(f"No images directories found in {directory}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    transforms, resized = {}, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for output_path, transform, changed in executor.map(process_image, tasks, chunksize=16):
+            transforms[os.path.relpath(output_path, output_directory)] = transform
+            resized += changed
+    print(f"Resized {resized} images ({len(tasks) - resized} up to date) in {time.perf_counter() - start:.2f}s")
+
+    for path, output_path in other_files:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if os.path.basename(path) == "annotations.json":
+            scale_annotations(path, output_path, {os.path.basename(name): transform for name, transform in transforms.items()})
+        else:
+            shutil.copy(path, output_path)
+
+    with open(os.path.join(output_directory, "resize.json"), "w") as f:
+        # The per-image scale and padding also map detections on the resized copy back to the originals
+        json.dump({"source": os.path.abspath(directory), "size": args.size, "letterbox": args.letterbox, "label_format": args.label_format, "transforms": transforms}, f, indent=4)
+    print(f"Resized dataset saved to {output_directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]
+
+TRAINERS = {
+    "yolov10": {"script": os.path.join("YOLO V10", "src", "train.py"), "metric": "metrics/mAP50-95(B)", "mode": "max"},
+    "tflite": {"script": os.path.join("TFLite", "src", "train.py"), "metric": "val_loss", "mode": "min"},
+}
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    if config.get('trainer') not in TRAINERS:
+        raise ValueError(f"Trainer must be one of {', '.join(TRAINERS)}, but found {config.get('trainer')} instead")
+    if not config.get('space'):
+        raise ValueError("Config has no search space")
+    trainer = TRAINERS[config['trainer']]
+    config.setdefault('args', {})
+    config.setdefault('metric', trainer['metric'])
+    config.setdefault('mode', trainer['mode'])
+    return config
+
+def sample_value(values, rng):
+    if isinstance(values, list):
+        return rng.choice(values)
+    low, high = values['min'], values['max']
+    value = math.exp(rng.uniform(math.log(low), math.log(high))) if values.get('log') else rng.uniform(low, high)
+    return round(value) if values.get('type') == "int" else value
+
+def generate_trials(space, search, max_trials, seed):
+    rng = random.Random(seed)
+    names = sorted(space)
+    if search == "grid":
+        if not all(isinstance(space[name], list) for name in names):
+            raise ValueError("Grid search needs a list of values for every parameter")
+        trials = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+        if max_trials and max_trials < len(trials):
+            trials = rng.sample(trials, max_trials)
+        return trials
+    trials, seen = [], set()
+    # Repeated samples are dropped, which can leave fewer than max_trials when the space is small
+    for _ in range(max_trials * 10):
+        params = {name: sample_value(space[name], rng) for name in names}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            trials.append(params)
+        if len(trials) == max_trials:
+            break
+    return trials
+
+def to_flags(params):
+    flags = []
+    for name, value in params.items():
+        if value is True:
+            flags.append(f"--{name}")
+        elif value is not False and value is not None:
+            flags.extend([f"--{name}", str(value)])
+    return flags
+
+def get_trial_flags(trainer_name, trial_directory, log_path):
+    # Every trial writes its run, model and metrics into its own directory so concurrent trials never share paths
+    if trainer_name == "yolov10":
+        return ["--log_path", log_path, "--project", trial_directory, "--name", "train"]
+    # TFRecord caches are written without locking, so trials sharing one would write the same shards at once
+    return ["--log_path", log_path, "--model_save_name", os.path.join(trial_directory, "model"), "--cache_dir", os.path.join(trial_directory, "cache")]
+
+def open_database(database_path):
+    connection = sqlite3.connect(database_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS trials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, sweep TEXT, trainer TEXT, params TEXT, command TEXT, cores TEXT,
+            status TEXT, returncode INTEGER, epochs INTEGER, metric TEXT, best_metric REAL, trial_directory TEXT,
+            started_at REAL, finished_at REAL
+        )
+    """)
+    connection.execute("CREATE TABLE IF NOT EXISTS trial_metrics (trial_id INTEGER, epoch INTEGER, value REAL, PRIMARY KEY (trial_id, epoch))")
+    connection.commit()
+    return connection
+
+def load_finished_trials(connection, sweep_name):
+    # Finished trials are skipped when a sweep is restarted and still count towards the median
+    rows = connection.execute("SELECT id, params FROM trials WHERE sweep = ? AND status IN ('completed', 'stopped')", (sweep_name,)).fetchall()
+    curves = {}
+    for trial_id, _ in rows:
+        values = connection.execute("SELECT value FROM trial_metrics WHERE trial_id = ? ORDER BY epoch", (trial_id,)).fetchall()
+        curves[trial_id] = [value for (value,) in values]
+    return {params for _, params in rows}, curves
+
+def get_metric(record, metric):
+    for values in [record.get('metrics', {}), record.get('losses', {}), record]:
+        if metric in values:
+            return float(values[metric])
+    return None
+
+def read_metric_curve(log_path, metric, mode):
+    # Best value so far at every epoch, so a single noisy epoch does not stop a trial
+    curve = []
+    if not os.path.exists(log_path):
+        return curve
+    with open(log_path, "r") as f:
+        for line in f:
+            try:
+                value = get_metric(json.loads(line), metric)
+            except json.JSONDecodeError:
+                break
+            if value is None:
+                continue
+            if curve:
+                value = max(value, curve[-1]) if mode == "max" else min(value, curve[-1])
+            curve.append(value)
+    return curve
+
+def should_stop(trial_id, curves, mode, grace_epochs, min_trials):
+    # Median stopping rule: stop when the best value so far is worse than the median of other trials at the same epoch
+    curve = curves.get(trial_id, [])
+    epoch = len(curve)
+    if epoch < grace_epochs:
+        return False
+    others = [other[epoch - 1] for other_id, other in curves.items() if other_id != trial_id and len(other) >= epoch]
+    if len(others) < min_trials:
+        return False
+    median = statistics.median(others)
+    return curve[-1] < median if mode == "max" else curve[-1] > median
+
+def get_descendants(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    return pids
+
+def get_tree_rss_mb(pid):
+    # Data loader workers are child processes, so the whole tree counts towards a trial's memory
+    if not os.path.exists("/proc"):
+        return 0.0
+    total = 0
+    for child in get_descendants(pid):
+        try:
+            with open(f"/proc/{child}/statm", "r") as f:
+                total += int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def get_total_memory_mb():
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) / 1024
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 / 1024
+
+def get_available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+def start_trial(command, cores, trial_directory):
+    env = dict(os.environ, **{name: str(len(cores)) for name in THREAD_ENV_VARS}, TF_NUM_INTEROP_THREADS="2")
+
+    def pin():
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+
+    output = open(os.path.join(trial_directory, "output.log"), "w")
+    # A new session lets the whole trial, data loader workers included, be stopped with one signal
+    process = subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT, cwd=ROOT_DIR, env=env, preexec_fn=pin, start_new_session=True)
+    output.close()
+    return process
+
+def stop_trial(process, timeout=30):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def finish_trial(connection, trial, status, returncode, curve, metric):
+    connection.executemany("INSERT OR REPLACE INTO trial_metrics (trial_id, epoch, value) VALUES (?, ?, ?)", [(trial['id'], epoch + 1, value) for epoch, value in enumerate(curve)])
+    connection.execute(
+        "UPDATE trials SET status = ?, returncode = ?, epochs = ?, metric = ?, best_metric = ?, finished_at = ? WHERE id = ?",
+        (status, returncode, len(curve), metric, curve[-1] if curve else None, time.time(), trial['id']),
+    )
+    connection.commit()
+    print(f"Trial {trial['id']} {status} after {len(curve)} epochs, best {metric}: {curve[-1] if curve else 'n/a'}")
+
+def run_sweep(config, trials, args, connection, curves):
+    trainer = TRAINERS[config['trainer']]
+    free_cores = get_available_cores()[:args.cores]
+    if len(free_cores) < args.threads_per_trial:
+        raise ValueError(f"Threads per trial ({args.threads_per_trial}) exceed the core budget ({len(free_cores)})")
+    pending = list(trials)
+    running = []
+
+    try:
+        while pending or running:
+            # A trial is admitted when its cores are free and the measured memory of running trials leaves room for it
+            used_memory = sum(max(args.trial_memory_mb, get_tree_rss_mb(trial['process'].pid)) for trial in running)
+            while pending and len(free_cores) >= args.threads_per_trial and used_memory + args.trial_memory_mb <= args.memory_mb:
+                params = pending.pop(0)
+                cores, free_cores = free_cores[:args.threads_per_trial], free_cores[args.threads_per_trial:]
+                cursor = connection.execute(
+                    "INSERT INTO trials (sweep, trainer, params, cores, status, started_at) VALUES (?, ?, ?, ?, 'running', ?)",
+                    (args.sweep_name, config['trainer'], json.dumps(params, sort_keys=True), ",".join(map(str, cores)), time.time()),
+                )
+                trial_id = cursor.lastrowid
+                trial_directory = os.path.abspath(os.path.join(args.output_directory, args.sweep_name, f"trial_{trial_id}"))
+                os.makedirs(trial_directory, exist_ok=True)
+                log_path = os.path.join(trial_directory, "epochs.jsonl")
+                command = [sys.executable, trainer['script']] + to_flags({**config['args'], **params}) + get_trial_flags(config['trainer'], trial_directory, log_path)
+                connection.execute("UPDATE trials SET command = ?, trial_directory = ? WHERE id = ?", (json.dumps(command), trial_directory, trial_id))
+                connection.commit()
+
+                print(f"Starting trial {trial_id} on cores {cores}: {params}")
+                running.append({"id": trial_id, "process": start_trial(command, cores, trial_directory), "cores": cores, "log_path": log_path})
+                curves[trial_id] = []
+                used_memory += args.trial_memory_mb
+
+            time.sleep(args.poll_interval)
+
+            for trial in list(running):
+                curves[trial['id']] = read_metric_curve(trial['log_path'], config['metric'], config['mode'])
+                returncode = trial['process'].poll()
+                if returncode is not None:
+                    finish_trial(connection, trial, "completed" if returncode == 0 else "failed", returncode, curves[trial['id']], config['metric'])
+                elif should_stop(trial['id'], curves, config['mode'], args.grace_epochs, args.min_trials):
+                    stop_trial(trial['process'])
+                    finish_trial(connection, trial, "stopped", trial['process'].returncode, curves[trial['id']], config['metric'])
+                else:
+                    continue
+                running.remove(trial)
+                free_cores.extend(trial['cores'])
+                if returncode is not None and returncode != 0:
+                    # Failed trials do not take part in the median
+                    del curves[trial['id']]
+    except KeyboardInterrupt:
+        print("Interrupted, stopping running trials")
+        for trial in running:
+            stop_trial(trial['process'])
+            finish_trial(connection, trial, "cancelled", trial['process'].returncode, curves.get(trial['id'], []), config['metric'])
+        sys.exit(1)
+
+def print_report(connection, sweep_name, mode):
+    order = "DESC" if mode == "max" else "ASC"
+    rows = connection.execute(f"SELECT id, status, epochs, best_metric, params FROM trials WHERE sweep = ? ORDER BY best_metric IS NULL, best_metric {order}", (sweep_name,)).fetchall()
+    print("| Trial | Status | Epochs | Best metric | Params |")
+    print("|---|---|---|---|---|")
+    for trial_id, status, epochs, best_metric, params in rows:
+        print(f"| {trial_id} | {status} | {epochs} | {best_metric if best_metric is not None else ''} | {params} |")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep over the YOLOv10 or TFLite trainer with concurrent, core pinned trials.")
+    parser.add_argument('--config', type=str, required=True, help="JSON file with trainer (yolov10 or tflite), fixed args, search space and optionally metric and mode")
+    parser.add_argument('--sweep_name', type=str, required=False, help="Name the trials are stored under, reusing it resumes the sweep (default: config file name)")
+    parser.add_argument('--database', type=str, required=False, default="sweeps.db", help="SQLite database the trials and their metrics are stored in")
+    parser.add_argument('--output_directory', type=str, required=False, default="sweeps", help="Directory holding one directory per trial")
+    parser.add_argument('--search', type=str, choices=["grid", "random"], required=False, default="grid", help="Try every combination or sample max_trials of them")
+    parser.add_argument('--max_trials', type=int, required=False, default=0, help="Upper limit on trials, required for random search")
+    parser.add_argument('--seed', type=int, required=False, default=0, help="Seed for sampling trials")
+    parser.add_argument('--cores', type=int, required=False, default=len(get_available_cores()), help="CPU cores the whole sweep may use")
+    parser.add_argument('--threads_per_trial', type=int, required=False, default=8, help="Cores pinned to each trial")
+    parser.add_argument('--memory_mb', type=float, required=False, default=get_total_memory_mb() * 0.8, help="Memory the whole sweep may use")
+    parser.add_argument('--trial_memory_mb', type=float, required=False, default=8000, help="Memory reserved for a trial until its measured usage is higher")
+    parser.add_argument('--grace_epochs', type=int, required=False, default=3, help="Epochs a trial always runs before it can be stopped early")
+    parser.add_argument('--min_trials', type=int, required=False, default=3, help="Other trials that must have reached an epoch before the median rule applies")
+    parser.add_argument('--poll_interval', type=float, required=False, default=10, help="Seconds between checks of the running trials")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print(f"Config ({args.config}) not found")
+        sys.exit(1)
+    try:
+        config = load_config(args.config)
+        args.sweep_name = args.sweep_name or os.path.splitext(os.path.basename(args.config))[0]
+        if args.search == "random" and args.max_trials <= 0:
+            raise ValueError("Random search needs max_trials")
+        trials = generate_trials(config['space'], args.search, args.max_trials, args.seed)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    connection = open_database(args.database)
+    finished, curves = load_finished_trials(connection, args.sweep_name)
+    trials = [params for params in trials if json.dumps(params, sort_keys=True) not in finished]
+    parallel = min(args.cores // args.threads_per_trial, int(args.memory_mb // args.trial_memory_mb))
+    print(f"Running {len(trials)} trials ({len(finished)} already finished), up to {parallel} at a time with {args.threads_per_trial} cores each")
+    try:
+        run_sweep(config, trials, args, connection, curves)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    print_report(connection, args.sweep_name, config['mode'])
+    print(f"Results saved to {args.database}")
+
+if __name__ == "__main__":
+    main()